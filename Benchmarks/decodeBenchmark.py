@@ -0,0 +1,403 @@
+#
+# This file is part of PyOLab. https://github.com/matsselen/pyolab
+# (C) 2017 Mats Selen <mats.selen@gmail.com>
+#
+# SPDX-License-Identifier:    BSD-3-Clause
+# (https://opensource.org/licenses/BSD-3-Clause)
+#
+
+# system stuff
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import subprocess
+import numpy as np
+
+# use the library code in this checkout (so that different commits can be compared)
+repoDir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, os.path.join(repoDir, 'src'))
+
+# local stuff
+from pyolab3.pyolabGlobals import G
+from pyolab3.iolabInfo import configName
+import pyolab3.setupMethods as setupMethods
+import pyolab3.dataMethods as dataMethods
+
+# older checkouts don't have all of these (see "Older commits" below)
+try:
+    from pyolab3.replayClass import ReplayPort
+except ImportError:
+    ReplayPort = None
+
+try:
+    from pyolab3.iolabInfo import configDict
+except ImportError:
+    configDict = dict([(n, configName(n)) for n in range(256) if configName(n) != ''])
+
+try:
+    from pyolab3.iolabInfo import sampleBytes
+except ImportError:
+    sampleBytes = {1: 6, 2: 6, 3: 6, 4: 4, 6: 2, 7: 2, 8: 2, 9: 2, 10: 6, 11: 2,
+                   12: 2, 13: 1, 21: 2, 22: 2, 23: 2, 26: 4, 241: 12}
+
+"""
+Measures how fast the analysis code gets through the data from each fixed
+configuration (see configName() in iolabInfo.py). For each configuration a
+stream of records like the ones the remote would send is made up (random
+sensor data, with as many valid bytes in each record as the sample rates
+call for), and then fed through the same steps analyzeData() goes through,
+timing each of them separately:
+
+    read       readDataBlocking(): serial port -> G.dataBuffer
+    find       findRecords() & findLastConfig(): bytes -> records
+    decode     decodeDataPayloads() minus the time spent in extractSensorData()
+    extract    extractSensorData(): sensor bytes -> numbers in G.uncalDataDict
+
+Each configuration is run in a process of its own so that the peak memory
+use (RSS) belongs to that configuration alone. Typical use:
+
+    python decodeBenchmark.py                      # all configurations
+    python decodeBenchmark.py -c 38 45 46          # just these
+    python decodeBenchmark.py --compare abc123 def456
+
+The results are printed and also appended to a file (benchmarkResults.jsonl
+by default) as one JSON line per configuration, tagged with the git commit,
+so runs made on different commits can be compared with --compare.
+The "realtime" column says how many times faster than the remote sends
+data the whole chain is - anything below 1 can't keep up with the hardware.
+Configurations marked INCOMPLETE didn't get all of the samples that were
+sent decoded. Sensors without a decoder in dataMethods.py don't count towards
+that, but they are listed after NO DECODER (configurations 7, 44 and 47 have 
+nothing else, so there is nothing to time).
+
+Older commits: the script only needs what the analysis code has always had
+(setupGlobalVariables(), findRecords(), findLastConfig(), decodeDataPayloads()
+and extractSensorData()), so it can be copied into an older checkout to get its
+numbers. Where there is no ReplayPort or readDataBlocking() yet the bytes go
+straight into G.dataBuffer (or G.dataList, in the original code), so "read"
+is just the time it takes to store them. Where there are no SensorDecoders
+the sensors that got no samples at all are taken to be the ones without one.
+The original code needs numpy 1.x (under numpy 2 its extractSensorData() fails
+with an OverflowError on samples above 32767).
+
+"""
+
+framePeriod = 0.010    # the remote sends one data record every 10 ms
+
+#======================================
+# Makes up the records the remote would send in "seconds" seconds of running
+# fixed configuration "config". Returns a list of (time, bytes) chunks, one
+# per record, that can be given to a ReplayPort, and a dictionary with the
+# number of samples each sensor sent.
+#
+def makeStream(config, seconds, seed=1):
+
+    rng = np.random.default_rng(seed)
+    info = configName(config)
+    remote = 1
+
+    # each sensor gets room for one sample more than it needs per frame
+    # (like the real packet configurations)
+    slots = []
+    for s in info[2]:
+        perFrame = s['rate'] * framePeriod
+        slots.append([s['sensor'], sampleBytes[s['sensor']] * (int(np.ceil(perFrame)) + 1), perFrame, 0.0])
+
+    packetConfig = [remote, len(slots)]
+    for sensor, nBytes, perFrame, acc in slots:
+        packetConfig += [sensor, nBytes]
+
+    chunks = [(0, bytes([0x02, G.recType_getFixedConfig, 2, remote, config, 0x0A])),
+              (0, bytes([0x02, G.recType_getPacketConfig, len(packetConfig)] + packetConfig + [0x0A]))]
+    nSamples = {}
+
+    nFrames = int(round(seconds / framePeriod))
+    for frame in range(nFrames):
+        body = bytearray([remote, frame & 0xFF, frame & 0x03, len(slots)])
+        for slot in slots:
+            sensor, nBytes, perFrame, acc = slot
+            acc += perFrame
+            n = int(acc)
+            slot[3] = acc - n
+            nSamples[sensor] = nSamples.get(sensor, 0) + n
+
+            nValid = n * sampleBytes[sensor]
+            body += bytes([sensor, nValid])
+            body += rng.integers(0, 256, nValid, dtype=np.uint8).tobytes()
+            body += bytes(nBytes - nValid)
+        body.append(0xC0)   # RSSI
+
+        t = int((frame + 1) * framePeriod * 1e9)
+        chunks.append((t, bytes([0x02, G.recType_dataFromRemote, len(body)]) + bytes(body) + b'\x0a'))
+
+    return chunks, nSamples
+
+#======================================
+# Feeds "chunks" through the analysis steps, batchFrames records' worth
+# of bytes at a time, and returns the time spent in each step.
+#
+def runStages(chunks, batchFrames):
+
+    setupMethods.setupGlobalVariables()
+    G.logData = False
+
+    if ReplayPort is not None and hasattr(setupMethods, 'readDataBlocking'):
+        recordBytes = len(chunks[-1][1])
+        G.serialPort = ReplayPort(chunks, 'fast', batchFrames * recordBytes)
+        G.serialPort.timeout = 0
+        read = setupMethods.readDataBlocking
+        done = G.serialPort.done
+    else:
+        read, done = legacyReader(chunks, batchFrames)
+
+    # time extractSensorData() on its own by wrapping it
+    # (decodeDataPayloads() looks it up in dataMethods every time it is called)
+    extract = dataMethods.extractSensorData
+    extractTime = [0.0]
+
+    def timedExtract(*args):
+        t = time.perf_counter()
+        d = extract(*args)
+        extractTime[0] += time.perf_counter() - t
+        return d
+
+    times = {'read': 0.0, 'find': 0.0, 'decode': 0.0, 'extract': 0.0}
+    dataMethods.extractSensorData = timedExtract
+    try:
+        while not done():
+            t0 = time.perf_counter()
+            read()
+            t1 = time.perf_counter()
+            if hasattr(G, 'dataBuffer'):
+                dataMethods.findRecords(G.dataBuffer.writePos)
+            else:
+                dataMethods.findRecords()
+            dataMethods.findLastConfig()
+            t2 = time.perf_counter()
+            dataMethods.decodeDataPayloads()
+            t3 = time.perf_counter()
+
+            times['read'] += t1 - t0
+            times['find'] += t2 - t1
+            times['decode'] += t3 - t2
+    finally:
+        dataMethods.extractSensorData = extract
+
+    times['extract'] = extractTime[0]
+    times['decode'] -= extractTime[0]
+    times['total'] = times['read'] + times['find'] + times['decode'] + times['extract']
+    return times
+
+#======================================
+# For checkouts that can't replay data yet: returns read() and done() functions
+# that store batchFrames records' worth of "chunks" at a time the way the read
+# thread of that code did (setupGlobalVariables() didn't start over back then,
+# so that is done here too)
+#
+def legacyReader(chunks, batchFrames):
+
+    G.nextRecord = 0
+    if hasattr(G, 'dataBuffer'):
+        G.nextData = G.dataBuffer.writePos
+        store = G.dataBuffer.write
+    else:
+        G.dataList = []
+        G.nextData = 0
+        store = G.dataList.extend
+
+    data = [b''.join([piece for t, piece in chunks[i:i + batchFrames]])
+            for i in range(0, len(chunks), batchFrames)]
+    data.reverse()
+
+    def read():
+        store(data.pop())
+
+    def done():
+        return len(data) == 0
+
+    return read, done
+
+#======================================
+# Returns the peak resident memory of this process in bytes
+# (or None if there is no way of finding out)
+#
+def peakRSS():
+
+    try:
+        import resource
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return rss if sys.platform == 'darwin' else rss * 1024   # bytes on macOS, kB on Linux
+    except ImportError:
+        pass
+
+    try:
+        import psutil
+        info = psutil.Process().memory_info()
+        return getattr(info, 'peak_wset', info.rss)              # peak_wset is Windows only
+    except ImportError:
+        return None
+
+#======================================
+# Benchmarks a single configuration (best of "repeat" runs) and
+# returns the results as a dictionary.
+#
+def benchmarkConfig(config, seconds, batchFrames, repeat):
+
+    chunks, nSamples = makeStream(config, seconds)
+
+    best = None
+    for i in range(repeat):
+        times = runStages(chunks, batchFrames)
+        if best is None or times['total'] < best['total']:
+            best = times
+
+    nBytes = sum([len(data) for t, data in chunks])
+    nRecords = sum([len(G.recDict[recType]) for recType in G.recDict])
+    nDecoded = sum([len(G.uncalDataDict[s]) for s in G.uncalDataDict])
+
+    # the sensors that sent samples we can't decode (see "Older commits" above)
+    decoders = getattr(dataMethods, 'sensorDecoders', None)
+    if decoders is None:
+        decoders = [s for s in G.uncalDataDict if len(G.uncalDataDict[s]) > 0]
+    undecoded = sorted([s for s, n in nSamples.items() if n > 0 and s not in decoders])
+    nExpected = sum([n for s, n in nSamples.items() if s not in undecoded])
+
+    result = {
+        'config'    : config,
+        'name'      : configName(config)[0],
+        'seconds'   : seconds,
+        'batch'     : batchFrames,
+        'bytes'     : nBytes,
+        'records'   : nRecords,
+        'samples'   : nDecoded,
+        'complete'  : nDecoded == nExpected,
+        'undecoded' : undecoded,
+        'peakRSS'   : peakRSS(),
+        'stages'    : {},
+    }
+    for stage, t in best.items():
+        result['stages'][stage] = {
+            'time'          : t,
+            'bytesPerSec'   : nBytes / t if t > 0 else None,
+            'recordsPerSec' : nRecords / t if t > 0 else None,
+            'samplesPerSec' : nDecoded / t if t > 0 else None,
+        }
+    result['realtime'] = seconds / best['total'] if best['total'] > 0 else None
+
+    return result
+
+#======================================
+# Returns the git commit of this checkout ('-dirty' is added if there are
+# uncommitted changes) or 'unknown'
+#
+def gitCommit():
+
+    try:
+        commit = subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'],
+                                         cwd=repoDir, stderr=subprocess.DEVNULL).decode().strip()
+        dirty = subprocess.call(['git', 'diff', '--quiet', 'HEAD', '--', 'src'],
+                                cwd=repoDir, stderr=subprocess.DEVNULL) != 0
+        return commit + ('-dirty' if dirty else '')
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+#======================================
+# prints one line of the results table
+#
+def printResult(r):
+
+    mb = '%8.1f' % (r['peakRSS'] / 2**20) if r['peakRSS'] else '       ?'
+    s = r['stages']
+    flags = '' if r['complete'] else '  INCOMPLETE'
+    if r.get('undecoded'):
+        flags += '  NO DECODER ' + ' '.join([str(sensor) for sensor in r['undecoded']])
+    print('%3d %-28s %10.0f %10.0f %8.3f %8.3f %8.3f %8.3f %8.1f %s%s' %
+          (r['config'], r['name'][:28], s['total']['recordsPerSec'], s['total']['samplesPerSec'],
+           s['read']['time'], s['find']['time'], s['decode']['time'], s['extract']['time'],
+           r['realtime'], mb, flags))
+
+def printHeader():
+    print('%3s %-28s %10s %10s %8s %8s %8s %8s %8s %8s' %
+          ('cfg', 'name', 'records/s', 'samples/s', 'read', 'find', 'decode', 'extract', 'realtime', 'RSS(MB)'))
+
+#======================================
+# Prints records/s of the latest run of each configuration on commit "old"
+# next to those on commit "new", from the results file.
+#
+def compare(fileName, old, new):
+
+    latest = {}
+    with open(fileName) as f:
+        for line in f:
+            r = json.loads(line)
+            for rev in (old, new):
+                if r['commit'].startswith(rev):
+                    latest[(rev, r['config'])] = r
+
+    print('%3s %-28s %12s %12s %7s' % ('cfg', 'name', old, new, 'ratio'))
+    for config in sorted(configDict):
+        if (old, config) in latest and (new, config) in latest:
+            a = latest[(old, config)]['stages']['total']['recordsPerSec']
+            b = latest[(new, config)]['stages']['total']['recordsPerSec']
+            print('%3d %-28s %12.0f %12.0f %7.2f' % (config, configName(config)[0][:28], a, b, b / a))
+
+#=========================================
+
+def main():
+
+    parser = argparse.ArgumentParser(description='Benchmarks the pyolab decoding chain for each fixed configuration.')
+    parser.add_argument('-c', '--configs', type=int, nargs='+', default=sorted(configDict),
+                        help='fixed configurations to benchmark (default: all of them)')
+    parser.add_argument('-s', '--seconds', type=float, default=30.0,
+                        help='seconds of data to make up for each configuration (default 30)')
+    parser.add_argument('-b', '--batch', type=int, default=10,
+                        help='records handled per pass through the analysis steps (default 10)')
+    parser.add_argument('-r', '--repeat', type=int, default=3,
+                        help='number of runs per configuration, the fastest one counts (default 3)')
+    parser.add_argument('-o', '--out', default='benchmarkResults.jsonl',
+                        help='file the results are appended to (default benchmarkResults.jsonl)')
+    parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'),
+                        help='compare the results for two commits in the results file')
+    parser.add_argument('--worker', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    # run one configuration and hand the results back to the parent process
+    if args.worker is not None:
+        print(json.dumps(benchmarkConfig(args.worker, args.seconds, args.batch, args.repeat)))
+        return
+
+    if args.compare:
+        compare(args.out, args.compare[0], args.compare[1])
+        return
+
+    common = {
+        'commit'    : gitCommit(),
+        'date'      : time.strftime('%Y-%m-%d %H:%M:%S'),
+        'python'    : platform.python_version(),
+        'numpy'     : np.__version__,
+        'machine'   : platform.platform(),
+    }
+    print('commit ' + common['commit'] + ', python ' + common['python'] + ', numpy ' + common['numpy'])
+    printHeader()
+
+    with open(args.out, 'a') as out:
+        for config in args.configs:
+            if configName(config) == '':
+                print('%3d unknown configuration' % config)
+                continue
+
+            command = [sys.executable, os.path.abspath(__file__), '--worker', str(config),
+                       '-s', str(args.seconds), '-b', str(args.batch), '-r', str(args.repeat)]
+            output = subprocess.check_output(command).decode()
+
+            result = dict(common)
+            result.update(json.loads(output.strip().splitlines()[-1]))
+            out.write(json.dumps(result) + '\n')
+            printResult(result)
+
+
+if __name__ == '__main__':
+    main()
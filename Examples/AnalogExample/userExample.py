@@ -97,6 +97,10 @@ def main():
 
     # set up IOLab user callback routines
     analClass = AnalysisClass(analUserStart, analUserEnd, analUserLoop)
+
+    # keep running averages of the sensors (see statsMethods.py)
+    G.runningStats = True
+    G.statsWindows = [U.aveTime]
     
     # start up the IOLab data acquisition stuff
     if not startItUp():
@@ -21,8 +21,5 @@ class U(object):
     analUserCalls = 0           # how many times analUserLoop() has been called
                                 # (just for example - not needed in your own code)
                                 
-    # keep track of some stuff used for calculating averages
-    lastA7 = 0
-    lastA8 = 0
-    lastA9 = 0
-    lastHG = 0
\ No newline at end of file
+    # the voltages shown are averaged over this many seconds (see G.statsWindows)
+    aveTime = 0.2
\ No newline at end of file
@@ -70,41 +70,17 @@ def analUserEnd():
 def analUserLoop():
     U.analUserCalls += 1
 
-    # find the average of the A7 data acquired since the last time
-    nA7 = len(G.uncalDataDict[21])
-    aveA7 = 0
-    if nA7 > U.lastA7:
-        for i in range(U.lastA7,nA7):
-            aveA7 += G.uncalDataDict[21][i]
-        aveA7 = float(aveA7)/(nA7 - U.lastA7)
-    U.lastA7 = nA7
-
-    # find the average of the A8 data acquired since the last time
-    nA8 = len(G.uncalDataDict[22])
-    aveA8 = 0
-    if nA8 > U.lastA8:
-        for i in range(U.lastA8,nA8):
-            aveA8 += G.uncalDataDict[22][i]
-        aveA8 = float(aveA8)/(nA8 - U.lastA8)
-    U.lastA8 = nA8
-
-    # find the average of the A9 data acquired since the last time
-    nA9 = len(G.uncalDataDict[23])
-    aveA9 = 0
-    if nA9 > U.lastA9:
-        for i in range(U.lastA9,nA9):
-            aveA9 += G.uncalDataDict[23][i]
-        aveA9 = float(aveA9)/(nA9 - U.lastA9)
-    U.lastA9 = nA9
-
-    # find the average of the HG data acquired since the last time
-    nHG = len(G.uncalDataDict[12])
-    aveHG = 0
-    if nHG > U.lastHG:
-        for i in range(U.lastHG,nHG):
-            aveHG += G.uncalDataDict[12][i]
-        aveHG = float(aveHG)/(nHG - U.lastHG)
-    U.lastHG = nHG
+    # the averages of the A7, A8, A9 and HG data from the last U.aveTime seconds 
+    # (these are kept up to date as the data are decoded, see statsMethods.py).
+    # The window moves on with the clock, so once the data stop (after Pause, say)
+    # it is empty and the average is 0, like it was when nothing new came in.
+    if not all([sensor in G.statsDict for sensor in (21, 22, 23, 12)]):
+        return
+    ave = {}
+    for sensor in (21, 22, 23, 12):
+        window = G.statsDict[sensor].window(U.aveTime)
+        ave[sensor] = window.mean if window.count > 0 else 0
+    aveA7, aveA8, aveA9, aveHG = ave[21], ave[22], ave[23], ave[12]
 
     adcPerVolt_A       = 4095 / 3.3
     adcPerMilliVolt_HG = 1400 * 2047 / (1000*3.3/2)
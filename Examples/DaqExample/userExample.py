@@ -48,8 +48,8 @@ def main():
     #
     analClass = AnalysisClass(analUserStart, analUserEnd, analUserLoop)
     
-    # This causes the raw data to be dumped to a file called "data.txt" in
-    # the working directory
+    # This causes the raw data to be dumped to a capture file called "data.iolab" in
+    # the working directory (set G.dumpFormat = 'hex' to get the old "data.txt" instead)
     G.dumpData = True
     
     if not startItUp():
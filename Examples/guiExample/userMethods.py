@@ -81,7 +81,7 @@ def analUserLoop():
         for i in range(U.lastRecord,nData):
             recType = G.allRecList[i][0]
             index = G.allRecList[i][1]
-            rec = G.recDict[recType][index]
+            rec = G.recDict[recType][index].tolist()
 
             if recType == G.recType_dataFromRemote:
                 U.listBoxData.insert(END,rec)
@@ -0,0 +1,252 @@
+#
+# This file is part of PyOLab. https://github.com/matsselen/pyolab
+# (C) 2017 Mats Selen <mats.selen@gmail.com>
+#
+# SPDX-License-Identifier:    BSD-3-Clause
+# (https://opensource.org/licenses/BSD-3-Clause)
+#
+
+# system stuff
+import time
+import numpy as np
+from collections import deque
+from threading import Lock, Condition
+
+"""
+This is the buffer that holds the raw bytes received from the serial port
+until findRecords() has turned them into records.
+
+The bytes live in a preallocated bytearray with a read cursor and a write
+cursor. The serial port reads straight into the free space after the write
+cursor, and findRecords() advances the read cursor once it has framed the
+records it found. The space behind the read cursor is reclaimed by sliding
+the unread bytes back to the front of the array whenever the writer runs out
+of room (the array only grows if the reader has fallen really far behind).
+The unread bytes are therefore always contiguous, so a record never has to
+be stitched together across the end of the array.
+
+Positions passed in and out of this class are absolute stream offsets
+(the number of bytes received since the buffer was created), so they
+stay valid no matter how often the storage is compacted.
+
+One thread writes (readDataThread) and one thread reads (analyzeDataThread).
+Only the writer ever moves bytes around, which is what makes it safe for
+the serial read itself to happen outside the lock.
+
+The reader doesn't have to poll: waitForData() sleeps until the writer has
+added enough new bytes (or until close() is called when shutting down).
+Every write is also recorded as a numbered chunk (seq, offset, length, time),
+where offset is the stream offset of the first byte and time is from
+time.monotonic_ns(), so the reader can tell exactly when each piece arrived.
+The most recent chunkHistory of these are kept (see chunksSince() and arrivalTimes()).
+
+Anything that needs to see every byte (for example the capture file writer
+in captureClass.py) can register a listener with addListener(). Each listener
+is called as listener(chunk, data) for every write, where chunk is the
+(seq, offset, length, time) tuple and data is a bytes copy of the chunk.
+Listeners are called with the lock held, so they need to be quick.
+
+"""
+
+class RingBuffer(object):
+
+    def __init__(self, size=0x10000, chunkHistory=4096):
+        self.buf  = bytearray(size)   # the storage
+        self.head = 0                 # index in buf of the next unread byte
+        self.tail = 0                 # index in buf where the next byte will be written
+        self.readPos  = 0             # absolute offset of the byte at buf[head]
+        self.writePos = 0             # absolute offset of the byte at buf[tail]
+        self.lock = Lock()
+        self.dataReady = Condition(self.lock)      # signaled whenever bytes are added
+        self.seq = 0                               # number of chunks written so far
+        self.chunks = deque(maxlen=chunkHistory)   # (seq, offset, length, time) of recent chunks
+        self.closed = False
+        self.listeners = []                        # called for every chunk (see addListener())
+
+    # number of bytes that have been written but not yet consumed
+    def __len__(self):
+        return self.tail - self.head
+
+    #======================================
+    # make sure there are at least n free bytes after the write cursor.
+    # must be called with the lock held, and only from the writer thread.
+    def _makeRoom(self, n):
+
+        if self.tail + n <= len(self.buf):
+            return
+
+        nUnread = self.tail - self.head
+        if nUnread + n <= len(self.buf):
+            # reclaim the consumed space by sliding the unread bytes to the front
+            self.buf[0:nUnread] = self.buf[self.head:self.tail]
+        else:
+            # the reader is way behind - grow the storage (this should be rare)
+            size = len(self.buf)
+            while nUnread + n > size:
+                size *= 2
+            newBuf = bytearray(size)
+            newBuf[0:nUnread] = self.buf[self.head:self.tail]
+            self.buf = newBuf
+
+        self.head = 0
+        self.tail = nUnread
+
+    #======================================
+    # copy the bytes in "data" to the buffer. Returns the number of bytes written.
+    # "arrived" is when they arrived (time.monotonic_ns(), now if it isn't given).
+    def write(self, data, arrived=None):
+
+        n = len(data)
+        with self.lock:
+            self._makeRoom(n)
+            self.buf[self.tail:self.tail + n] = data
+            self._commit(n, arrived)
+        return n
+
+    #======================================
+    # read up to n bytes from the serial port "port" directly into the
+    # free space of the buffer. Returns the number of bytes read.
+    def readFrom(self, port, n):
+
+        with self.lock:
+            self._makeRoom(n)
+            start = self.tail
+
+        # the reader never moves data, so the free space can be filled without the lock
+        mv = memoryview(self.buf)[start:start + n]
+        try:
+            nRead = port.readinto(mv) or 0
+        finally:
+            mv.release()
+
+        with self.lock:
+            self._commit(nRead)
+        return nRead
+
+    #======================================
+    # account for n new bytes at the write cursor and wake up anyone waiting for them.
+    # must be called with the lock held.
+    def _commit(self, n, arrived=None):
+
+        if n > 0:
+            self.seq += 1
+            chunk = (self.seq, self.writePos, n, time.monotonic_ns() if arrived is None else arrived)
+            self.chunks.append(chunk)
+            if self.listeners:
+                data = bytes(self.buf[self.tail:self.tail + n])
+                for listener in self.listeners:
+                    listener(chunk, data)
+            self.tail += n
+            self.writePos += n
+            self.dataReady.notify_all()
+
+    #======================================
+    # wait until there are data past absolute position "pointer", and then give the
+    # writer up to maxWait seconds to make it at least minBytes. If nothing at all 
+    # arrives within "timeout" seconds (None means wait forever) give up. 
+    # Returns the write position at the time it returns (so if this is not bigger 
+    # than pointer, the wait timed out or the buffer was closed).
+    def waitForData(self, pointer, minBytes=1, maxWait=0.0, timeout=None):
+
+        with self.dataReady:
+            # sleep until something new shows up
+            if not self.dataReady.wait_for(lambda: self.closed or self.writePos > pointer, timeout):
+                return self.writePos
+
+            # then let the batch fill up for a little while
+            self.dataReady.wait_for(lambda: self.closed or self.writePos - pointer >= minBytes, maxWait)
+            return self.writePos
+
+    #======================================
+    # returns a list of (seq, offset, length, time) for the chunks after number "seq"
+    # (only the most recent chunkHistory chunks are remembered)
+    def chunksSince(self, seq):
+
+        with self.lock:
+            return [c for c in self.chunks if c[0] > seq]
+
+    #======================================
+    # returns the time (time.monotonic_ns()) when each of the bytes at stream offsets
+    # "offsets" (a sorted numpy array) arrived. Bytes older than the chunk history 
+    # get the time of the oldest chunk still remembered.
+    def arrivalTimes(self, offsets):
+
+        with self.lock:
+            recent = []
+            for chunk in reversed(self.chunks):
+                recent.append(chunk)
+                if chunk[1] <= offsets[0]:
+                    break
+
+        if len(recent) == 0:
+            return np.full(len(offsets), time.monotonic_ns(), dtype=np.int64)
+
+        recent.reverse()
+        starts = np.array([chunk[1] for chunk in recent], dtype=np.int64)
+        times  = np.array([chunk[3] for chunk in recent], dtype=np.int64)
+        which = np.searchsorted(starts, offsets, 'right') - 1
+        return times[np.maximum(which, 0)]
+
+    #======================================
+    # start or stop calling listener(chunk, data) for every chunk that is written
+    def addListener(self, listener):
+
+        with self.lock:
+            self.listeners.append(listener)
+
+    def removeListener(self, listener):
+
+        with self.lock:
+            if listener in self.listeners:
+                self.listeners.remove(listener)
+
+    #======================================
+    # wake up everyone waiting in waitForData() for good (used when shutting down)
+    def close(self):
+
+        with self.lock:
+            self.closed = True
+            self.dataReady.notify_all()
+
+    #======================================
+    # returns (offset, data) where "data" is a bytes copy of the unread bytes
+    # up to absolute position "stop" (or all of them if stop is None) and
+    # "offset" is the absolute position of data[0]
+    def peek(self, stop=None):
+
+        with self.lock:
+            end = self.tail
+            if stop is not None:
+                end = min(end, self.head + stop - self.readPos)
+            return self.readPos, bytes(self.buf[self.head:end])
+
+    #======================================
+    # returns a bytes copy of the unread bytes between absolute positions start and stop
+    def getBytes(self, start, stop):
+
+        with self.lock:
+            start = max(start, self.readPos)
+            stop  = min(stop, self.writePos)
+            i = self.head + start - self.readPos
+            return bytes(self.buf[i:i + max(stop - start, 0)])
+
+    #======================================
+    # tells the buffer that everything before absolute position "upTo" has been
+    # dealt with, so the space it occupies can be reused
+    def consume(self, upTo):
+
+        with self.lock:
+            n = min(upTo, self.writePos) - self.readPos
+            if n > 0:
+                self.head += n
+                self.readPos += n
+
+    #======================================
+    # forget everything (only call this when the reading thread is not running)
+    def clear(self):
+
+        with self.lock:
+            self.head = self.tail = 0
+            self.readPos = self.writePos
+            self.chunks.clear()
+            self.closed = False
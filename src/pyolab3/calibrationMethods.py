@@ -0,0 +1,405 @@
+#
+# This file is part of PyOLab. https://github.com/matsselen/pyolab
+# (C) 2017 Mats Selen <mats.selen@gmail.com>
+#
+# SPDX-License-Identifier:    BSD-3-Clause
+# (https://opensource.org/licenses/BSD-3-Clause)
+#
+
+# system stuff
+import os
+import json
+from threading import Lock
+import numpy as np
+
+# local stuff
+from .pyolabGlobals import G
+from .iolabInfo import sensorName, configName
+from .calibratorClass import SensorCalibrator
+from .commMethods import issueCommand
+
+"""
+These methods turn the uncalibrated sensor data in G.uncalDataDict into physical
+units, using the conversions in Documentation/old_csharp_code.cs. The calibrated
+data is found in G.calDataDict, keyed by sensor number, for example
+
+    G.calDataDict[1].since(n)       accelerometer samples n, n+1, ... in units of g
+    G.calDataDict[4][-1]            the latest [pressure (kPa), temperature (C)]
+
+Samples are calibrated the first time they are looked at (see calibratorClass.py).
+
+The constants below are the defaults from the old code. The barometer and thermometer
+constants are replaced by the ones stored in the remote whenever a getCalibration()
+response comes in (see readCalibrationRecord()). Others (the force probe offset and
+the magnetometer for example) really need to be measured by the user, and can be
+changed with setCalibration().
+
+The constants used for each remote are kept in the file G.calibrationFile (JSON),
+keyed by the ID of the remote (from getDongleStatus()), so they only have to be
+read from the hardware (or measured by the user) once:
+
+    {"000001": {"firmware": [256, 256],                      from getRemoteStatus()
+                "factory" : {"4": [68, 34, ...], "26": [...]}, getCalibration() bytes
+                "user"    : {"8": {"countsOffset": 2059}}}}   from setCalibration()
+
+This is off unless G.calibrationFile is set (it is None by default), since it costs
+a few round trips to the remote before startItUp() returns. When it is set,
+startItUp() calls setupRemoteCalibration(), which uses what is in the file and only
+sends getCalibration() for the constants that are missing, or if the firmware of
+the remote is not the same as when they were saved. For example
+
+    G.calibrationFile = 'calibration.json'
+    startItUp()
+
+"""
+
+#======================================================================
+# Makes sure the calDataDict of "remote" (a RemoteStream, see remoteClass.py) has a 
+# CalibratedStore for every sensor that has both a calibrator and a store in its 
+# uncalDataDict (called by setupRemoteStores() in dataMethods.py)
+#
+def setupCalibratedStores(remote):
+
+    remote.calDataDict = {}
+    for sensor in remote.uncalDataDict:
+        if sensor in sensorCalibrators:
+            remote.calDataDict[sensor] = sessionCalibrator(sensor).makeStore(remote)
+
+#======================================================================
+# Returns the calibrator for "sensor" used by this session (G.calibrators), 
+# which is its own copy of the one in sensorCalibrators so that each remote 
+# can have its own constants
+#
+def sessionCalibrator(sensor):
+
+    calibrator = sensorCalibrators[sensor]
+    mine = G.calibrators.get(sensor)
+    if mine is None or mine.source is not calibrator:
+        mine = calibrator.copy()
+        G.calibrators[sensor] = mine
+    return mine
+
+
+#======================================================================
+# Adds (or replaces) the calibrator for sensor number "sensor".
+# See calibratorClass.py for a description of the parameters. For example,
+#
+#   registerSensorCalibrator(11, 'V', 682.5)                       # Battery
+#   registerSensorCalibrator(10, ['mV']*3, 2048*350/1500, 0x7FF)   # ECG3
+#
+def registerSensorCalibrator(sensor, units, countsPerUnit=1.0, countsOffset=0.0, calibrate=None, params=None, name=None):
+
+    if name is None:
+        name = sensorName(sensor)
+        if name == '':
+            name = 'Sensor' + str(sensor)
+    if isinstance(units, str):
+        units = [units]
+
+    calibrator = SensorCalibrator(sensor, name, units, countsPerUnit, countsOffset, calibrate, params)
+    sensorCalibrators[sensor] = calibrator
+
+    for remote in G.remotes.values():
+        if sensor in remote.uncalDataDict:
+            remote.calDataDict[sensor] = sessionCalibrator(sensor).makeStore(remote)
+
+    return calibrator
+
+
+#======================================================================
+# Changes the calibration constants of a sensor (see SensorCalibrator.set()), for example
+#
+#   setCalibration(8, countsOffset=0x7FF + 12)       # force probe zeroed by the user
+#   setCalibration(2, countsPerUnit=[570, 590, 560])
+#
+# If the ID of the remote is known (see setupRemoteCalibration()) the new constants
+# are also saved in G.calibrationFile, and used again next time.
+#
+def setCalibration(sensor, countsPerUnit=None, countsOffset=None, **params):
+
+    sessionCalibrator(sensor).set(countsPerUnit, countsOffset, **params)
+
+    entry = remoteCalibration()
+    if entry is not None:
+        if countsPerUnit is not None:
+            params['countsPerUnit'] = countsPerUnit
+        if countsOffset is not None:
+            params['countsOffset'] = countsOffset
+        entry['user'].setdefault(str(sensor), {}).update(params)
+        saveCalibrationCache()
+
+
+#======================================================================
+# Uses the constants in a getCalibration() response (record type 0x29)
+# for the sensor it is about. The payload is [remote, sensor, n, n calibration bytes]
+# (see IOLab_usb_interface_specs.pdf). Called by saveRecords() in dataMethods.py.
+#
+def readCalibrationRecord(rec):
+
+    if len(rec) < 7:
+        return
+    sensor = rec[4]
+    calBytes = rec[6:6 + rec[5]]
+
+    if useFactoryCalibration(sensor, calBytes):
+        # remember them for next time (see setupRemoteCalibration())
+        entry = remoteCalibration()
+        if entry is not None:
+            entry['factory'][str(sensor)] = calBytes
+    elif G.logData:
+        G.logFile.write("\nCalibration data for sensor " + str(sensor) + " not used: " + str(calBytes))
+
+#======================================================================
+# Uses the calibration bytes "calBytes" read from sensor "sensor" of the remote.
+# Returns False if they aren't understood.
+#
+def useFactoryCalibration(sensor, calBytes):
+
+    if sensor not in sensorCalibrators:
+        return False
+    if sensor == 4 and len(calBytes) == 8:
+        sessionCalibrator(sensor).set(coefficients=barometerCoefficients(calBytes))
+    elif sensor == 26 and len(calBytes) == 4:
+        sessionCalibrator(sensor).set(cal85=(calBytes[0] << 8) + calBytes[1],
+                                      cal30=(calBytes[2] << 8) + calBytes[3])
+    else:
+        return False
+    return True
+
+
+#======================================================================
+# Calibration constants kept for each remote.
+#
+# sensors whose constants are stored in the remote (and read with getCalibration())
+factorySensors = [4, 26]
+
+#======================================
+# Finds out which remote is being used and sets up its calibration constants:
+#   - the ID of the remote and its firmware versions are asked for with
+#     getDongleStatus() and getRemoteStatus()
+#   - constants saved in G.calibrationCache for this remote are used
+#   - getCalibration() is only sent for factory constants that are missing, or
+#     if the firmware has changed, and the answers are saved in G.calibrationFile
+#
+# This needs the analysis thread to be running (see startItUp()) to see the answers.
+# Returns True if it worked.
+#
+def setupRemoteCalibration(s, remote=1):
+
+    try:
+        dongle = issueCommand(s, [0x02, G.recType_getDongleStatus, 0x00, 0x0A]).result()
+        status = issueCommand(s, [0x02, G.recType_getRemoteStatus, 0x01, remote, 0x0A]).result()
+    except TimeoutError:
+        if G.logData:
+            G.logFile.write("\nCan't get the remote ID - using the default calibration constants")
+        return False
+
+    if dongle[1] != G.recType_getDongleStatus or status[1] != G.recType_getRemoteStatus:
+        if G.logData:
+            G.logFile.write("\nRemote " + str(remote) + " didn't answer - using the default calibration constants")
+        return False
+
+    # Dongle: FW (2) : Mode : ID (3),  Remote: remote : Sens FW (2) : RF FW (2) : Battery (2)
+    remoteID = (dongle[6] << 16) + (dongle[7] << 8) + dongle[8]
+    firmware = [(status[4] << 8) + status[5], (status[6] << 8) + status[7]]
+
+    key = remoteKey(remoteID)
+    entry = G.calibrationCache.get(key)
+    if entry is None or entry.get('firmware') != firmware:
+        # new remote, or new firmware (the user constants are still good)
+        user = {} if entry is None else entry.get('user', {})
+        entry = {'firmware': firmware, 'factory': {}, 'user': user}
+        G.calibrationCache[key] = entry
+    G.remoteID = remoteID
+
+    # use what we know
+    for sensor, calBytes in entry['factory'].items():
+        useFactoryCalibration(int(sensor), calBytes)
+    for sensor, constants in entry['user'].items():
+        if int(sensor) in sensorCalibrators:
+            sessionCalibrator(int(sensor)).set(**constants)
+
+    # ask the remote for what we don't (readCalibrationRecord() adds it to entry)
+    missing = [sensor for sensor in factorySensors if str(sensor) not in entry['factory']]
+    for sensor in missing:
+        try:
+            issueCommand(s, [0x02, G.recType_getCalibration, 0x02, remote, sensor, 0x0A]).result()
+        except TimeoutError:
+            if G.logData:
+                G.logFile.write("\nNo calibration data for sensor " + str(sensor))
+    if len(missing) > 0:
+        saveCalibrationCache()
+
+    if G.logData:
+        G.logFile.write("\nCalibration for remote " + key + ": " + str(len(missing)) + " sensors read from the remote")
+    return True
+
+#======================================
+# the key used for a remote in the calibration file (the ID as 6 hex digits,
+# like the calibration files of the old code)
+def remoteKey(remoteID):
+    return '%06x' % remoteID
+
+#======================================
+# returns the calibration constants kept for the current remote (or None)
+def remoteCalibration():
+    if G.remoteID is None:
+        return None
+    return G.calibrationCache.get(remoteKey(G.remoteID))
+
+#======================================
+# reads G.calibrationFile into G.calibrationCache (if there is such a file)
+def loadCalibrationCache():
+
+    G.calibrationCache = {}
+    if G.calibrationFile is not None and os.path.isfile(G.calibrationFile):
+        try:
+            with open(G.calibrationFile) as f:
+                G.calibrationCache = json.load(f)
+        except ValueError:
+            if G.logData:
+                G.logFile.write("\nCan't read " + G.calibrationFile + " - ignoring it")
+
+#======================================
+# writes G.calibrationCache to G.calibrationFile
+# (to a new file that then replaces the old one, so it is never left half written).
+# Other sessions may have saved their remotes since the file was read, so what is in
+# the file is kept, and only the entry for this session's remote is changed.
+def saveCalibrationCache():
+
+    if G.calibrationFile is None:
+        return
+    with calibrationFileLock:
+        entry = remoteCalibration()
+        if entry is not None:
+            loadCalibrationCache()
+            G.calibrationCache[remoteKey(G.remoteID)] = entry
+        with open(G.calibrationFile + '.tmp', 'w') as f:
+            json.dump(G.calibrationCache, f, indent=1, sort_keys=True)
+        os.replace(G.calibrationFile + '.tmp', G.calibrationFile)
+
+# only one session at a time writes the file
+calibrationFileLock = Lock()
+
+
+#======================================================================
+# Returns the sample rate (Hz) of "sensor" in fixed configuration "config" (the 
+# current one of remote 1 if it isn't given), or "default" if it isn't part of it
+#
+def sensorRate(sensor, default, config=None):
+
+    info = configName(G.lastFixedConfig if config is None else config)
+    if info != '':
+        for s in info[2]:
+            if s['sensor'] == sensor:
+                return s['rate']
+    return default
+
+
+#======================================================================
+# Barometer
+# Turns the 8 calibration bytes stored in the barometer chip into the
+# coefficients [a0, b1, b2, c12] used by barometerCalibration(). Each is a signed
+# 16 bit number with 3, 13, 14 and 22 fractional bits respectively (c12 uses only
+# its top 14 bits). See CalculateCalibrationConstants() in Documentation/old_csharp_code.cs
+#
+def barometerCoefficients(calBytes):
+
+    words = np.frombuffer(bytes(calBytes), dtype='>u2').astype(np.int64)
+    signed = np.where(words > 0x7FFF, words - 0x10000, words)
+    signs = np.sign(signed)
+    mags = np.abs(signed)
+    mags[3] = words[3] >> 2
+
+    a0  = mags[0] / 2.0**3
+    b1  = mags[1] / 2.0**13
+    b2  = mags[2] / 2.0**14
+    c12 = (mags[3] & 0x1FFF) / 2.0**22
+    return (signs * [a0, b1, b2, c12]).tolist()
+
+# The uncalibrated samples are [pressure, temperature] with the measurements
+# in the top 10 bits. Returns [pressure (kPa), temperature (C)]
+# (see Pressure() in Documentation/old_csharp_code.cs)
+def barometerCalibration(raw, cal, config):
+
+    a0, b1, b2, c12 = cal.params['coefficients']
+    P = ((raw[:, 0] >> 6) & 0x3FF).astype(np.float64)
+    T = ((raw[:, 1] >> 6) & 0x3FF).astype(np.float64)
+
+    d = np.empty((len(raw), 2))
+    d[:, 0] = 50 + (a0 + (b1 + c12 * T) * P + b2 * T) * (115 - 50) / 1023
+    d[:, 1] = (T - 605.75) / -5.35
+    return d
+
+#-----------------------
+# Thermometer
+# The uncalibrated data is the sum of the 400 Hz ADC readings made during each
+# sample, so it is scaled to an average reading and then to a temperature (C)
+# using the ADC values at 30 and 85 degrees.
+def thermometerCalibration(raw, cal, config):
+
+    adc = raw * (sensorRate(26, 50, config) / 400.0)
+    return 30 + (adc - cal.params['cal30']) * (85 - 30) / (cal.params['cal85'] - cal.params['cal30'])
+
+#-----------------------
+# Analog7/8/9
+# 12 bit ADC with a full scale of 3.0V, or 3.3V in configurations with '3V3'
+# in their names. Returns volts.
+def analogCalibration(raw, cal, config):
+
+    info = configName(G.lastFixedConfig if config is None else config)
+    fullScale = 3.3 if info != '' and '3V3' in info[0] else 3.0
+    return raw * (fullScale / 4095)
+
+#-----------------------
+# Wheel
+# The uncalibrated data is how far the wheel moved (in mm) since the last sample.
+# Returns the velocity in m/s.
+def wheelCalibration(raw, cal, config):
+    return raw * (sensorRate(9, 100, config) / 1000.0)
+
+
+#======================================================================
+# Dictionary of the SensorCalibrators, keyed by sensor number.
+# The ones below are set up when this file is imported.
+# (each session calibrates with copies of these, see sessionCalibrator())
+#
+sensorCalibrators = {}
+
+# Accelerometer (g)
+registerSensorCalibrator(1, ['g', 'g', 'g'], [8206, 8116, 8162], [38, 0, -53])
+
+# Magnetometer (the units are whatever the user calibrates to)
+registerSensorCalibrator(2, ['', '', ''], [573, 591, 558], [-569, -388, -1283])
+
+# Gyroscope (2000 dps = 34.91 rad/s = 0x7FFF)
+registerSensorCalibrator(3, ['rad/s', 'rad/s', 'rad/s'], 938.7, [-20, 230, -80])
+
+# Barometer (the defaults are from the first unit Mats tested - they are pretty close)
+registerSensorCalibrator(4, ['kPa', 'C'], calibrate=barometerCalibration,
+                         params={'coefficients': barometerCoefficients([0x44, 0x22, 0xad, 0x63, 0xbc, 0xda, 0x3a, 0xb8])})
+
+# Microphone and Light (relative intensity)
+registerSensorCalibrator(6, '', 500)
+registerSensorCalibrator(7, '', 500)
+
+# Force (the offset is the nominal zero 0x7FF plus whatever the user measures)
+registerSensorCalibrator(8, 'N', -120, 0x7FF)
+
+# Wheel (m/s)
+registerSensorCalibrator(9, 'm/s', calibrate=wheelCalibration)
+
+# ECG3 (mV at the input, gain 350) and Battery (V), for when these are decoded
+registerSensorCalibrator(10, ['mV', 'mV', 'mV'], 2048 * 350 / 1500, 0x7FF)
+registerSensorCalibrator(11, 'V', 682.5)
+
+# HighGain (mV at the input, gain 1400, full scale +- 1500 mV)
+registerSensorCalibrator(12, 'mV', 2048 * 1400 / 1500, 0x7FF)
+
+# Analog7/8/9 (V)
+registerSensorCalibrator(21, 'V', calibrate=analogCalibration)
+registerSensorCalibrator(22, 'V', calibrate=analogCalibration)
+registerSensorCalibrator(23, 'V', calibrate=analogCalibration)
+
+# Thermometer (C)
+registerSensorCalibrator(26, 'C', calibrate=thermometerCalibration, params={'cal30': 2041, 'cal85': 2426})
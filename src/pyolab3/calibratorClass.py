@@ -0,0 +1,197 @@
+#
+# This file is part of PyOLab. https://github.com/matsselen/pyolab
+# (C) 2017 Mats Selen <mats.selen@gmail.com>
+#
+# SPDX-License-Identifier:    BSD-3-Clause
+# (https://opensource.org/licenses/BSD-3-Clause)
+#
+
+# system stuff
+import copy
+import numpy as np
+
+# local stuff
+from .storeClass import ColumnStore
+
+"""
+A SensorCalibrator knows how to turn the uncalibrated samples of one sensor
+(see decoderClass.py) into physical units. The calibrators are registered in
+the sensorCalibrators dictionary in calibrationMethods.py, keyed by sensor
+number (see registerSensorCalibrator() there), and each session uses its own
+copy of them (G.calibrators), since every dongle's remote has its own constants.
+
+The parameters are:
+
+    sensor          sensor number as per sensorName()
+    name            sensor name (used in messages)
+    units           list of the units of each column of the calibrated data
+    countsPerUnit   a number, or a list with one number per column
+    countsOffset    a number, or a list with one number per column
+                    (by default calibrated = (raw - countsOffset) / countsPerUnit)
+    calibrate       optional function calibrate(raw, calibrator, config) -> numpy array of floats,
+                    for sensors that need more than a scale and an offset (config is
+                    the fixed configuration the samples were taken with)
+    params          optional dictionary of any other constants that calibrate() uses
+
+Changing the constants with set() makes the CalibratedStores calibrate their
+samples again the next time they are looked at. Nothing else does.
+
+A CalibratedStore holds the calibrated samples of one sensor of a remote next to the
+uncalibrated ones in its uncalDataDict (G.calDataDict[sensor] for remote 1, see 
+pyolabGlobals.py and remoteClass.py).
+Nothing is calibrated until the store is looked at, and then all of the samples
+that arrived since the last time are calibrated at once with numpy and kept,
+so each sample is only calibrated once. Each sample is calibrated with the fixed
+configuration it was taken with (remote.configStarts says where each one started,
+see dataMethods.py), so changing the configuration in the middle of a run doesn't
+change the samples taken before (samples from before the first configuration we 
+heard of get config 0, which isn't one). The store can be used the same way as a
+ColumnStore (see storeClass.py): len(store), store[i], store[i:j], store.data(),
+store.since(n), and so on, with the same sample numbers as the uncalibrated store.
+Calibrated samples are only kept for the uncalibrated samples still held in memory
+(see retentionMethods.py).
+
+"""
+
+class SensorCalibrator(object):
+
+    def __init__(self, sensor, name, units, countsPerUnit=1.0, countsOffset=0.0, calibrate=None, params=None):
+        self.sensor   = sensor
+        self.name     = name
+        self.units    = list(units)
+        self.calibrateFunction = calibrate
+        self.params   = {} if params is None else dict(params)
+        self.version  = 0           # goes up every time the constants change
+        self.source   = None        # the calibrator this is a copy of (see copy())
+        self._setConstants(countsPerUnit, countsOffset)
+
+    def _setConstants(self, countsPerUnit, countsOffset):
+        self.countsPerUnit = countsPerUnit
+        self.countsOffset  = countsOffset
+        self.scale  = 1.0 / np.asarray(countsPerUnit, dtype=np.float64)
+        self.offset = np.asarray(countsOffset, dtype=np.float64)
+
+    #======================================
+    # change any of countsPerUnit, countsOffset or the things in params, for example
+    #   calibrator.set(countsOffset=[40, 0, -50])
+    #   calibrator.set(cal30=2045, cal85=2430)
+    def set(self, countsPerUnit=None, countsOffset=None, **params):
+
+        self._setConstants(self.countsPerUnit if countsPerUnit is None else countsPerUnit,
+                           self.countsOffset if countsOffset is None else countsOffset)
+        self.params.update(params)
+        self.version += 1
+
+    #======================================
+    # Returns the samples in "raw" (a numpy array of uncalibrated samples taken with
+    # fixed configuration "config", the current one of remote 1 if it isn't given)
+    # in physical units, as float64 with one row per sample
+    def calibrate(self, raw, config=None):
+
+        if self.calibrateFunction is not None:
+            return self.calibrateFunction(raw, self, config)
+
+        cal = np.subtract(raw, self.offset, dtype=np.float64)
+        cal *= self.scale
+        return cal
+
+    #======================================
+    # returns a copy of this calibrator that has its own constants
+    def copy(self):
+        calibrator = SensorCalibrator(self.sensor, self.name, self.units, self.countsPerUnit, 
+                                      self.countsOffset, self.calibrateFunction, copy.deepcopy(self.params))
+        calibrator.source = self
+        return calibrator
+
+    #======================================
+    # returns an empty CalibratedStore for this sensor of "remote" (a RemoteStream)
+    def makeStore(self, remote):
+        return CalibratedStore(self, remote)
+
+    def __repr__(self):
+        return 'SensorCalibrator(' + str(self.sensor) + ', ' + repr(self.name) + ', ' + repr(self.units) + ')'
+
+
+class CalibratedStore(object):
+
+    def __init__(self, calibrator, remote):
+        self.calibrator = calibrator
+        self.remote  = remote  # the RemoteStream the samples come from
+        self.raw     = None    # the store in its uncalDataDict they come from
+        self.version = None    # the version of the constants they were calibrated with
+        self.store   = None    # the calibrated samples (a ColumnStore of float64)
+
+    #======================================
+    # calibrate whatever has arrived since the last time
+    # (or everything again if the constants changed)
+    def update(self):
+
+        raw = self.remote.uncalDataDict[self.calibrator.sensor]
+        if raw is not self.raw or self.calibrator.version != self.version or len(self.store) < raw.base:
+            self.raw = raw
+            self.version = self.calibrator.version
+            self.store = ColumnStore('float64', len(self.calibrator.units), max(len(raw.buf), 1), raw.base)
+
+        # keep up with the uncalibrated store when old samples are thrown away
+        if raw.base > self.store.base:
+            self.store.discard(raw.base)
+
+        first, last = len(self.store), len(raw)
+        if last > first:
+            self.store.append(self.calibrateSpans(raw.since(first)[:last - first], first))
+
+        return self.store
+
+    #======================================
+    # calibrate "raw" (samples number first, first+1, ...) a piece at a time, 
+    # each with the fixed configuration it was taken with
+    def calibrateSpans(self, raw, first):
+
+        starts = self.remote.configStarts.get(self.calibrator.sensor, [])
+        last = first + len(raw)
+        pieces = []
+        config = 0
+        for start, nextConfig in starts + [(last, None)]:
+            if first >= last:
+                break
+            if start > first:
+                stop = min(start, last)
+                pieces.append(self.calibrator.calibrate(raw[:stop - first], config))
+                raw = raw[stop - first:]
+                first = stop
+            config = nextConfig
+
+        if len(pieces) == 1:
+            return pieces[0]
+        return np.concatenate(pieces)
+
+    #======================================
+    # the same things a ColumnStore has
+    @property
+    def width(self):
+        return len(self.calibrator.units)
+
+    @property
+    def base(self):
+        return self.update().base
+
+    def data(self):
+        return self.update().data()
+
+    def since(self, first):
+        return self.update().since(first)
+
+    def __len__(self):
+        return len(self.update())
+
+    def __getitem__(self, i):
+        return self.update()[i]
+
+    def __iter__(self):
+        return iter(self.update())
+
+    def tolist(self):
+        return self.update().tolist()
+
+    def __repr__(self):
+        return 'CalibratedStore(' + repr(self.calibrator.name) + ', n=' + str(len(self)) + ')'
@@ -0,0 +1,81 @@
+#
+# This file is part of PyOLab. https://github.com/matsselen/pyolab
+# (C) 2017 Mats Selen <mats.selen@gmail.com>
+#
+# SPDX-License-Identifier:    BSD-3-Clause
+# (https://opensource.org/licenses/BSD-3-Clause)
+#
+
+# system stuff
+import time
+from queue import SimpleQueue
+from threading import Thread
+
+# local stuff
+from .captureMethods import captureMagic, captureVersion, fileHeader, chunkHeader
+
+"""
+A CaptureWriter saves the raw data received from the serial port to a
+capture file (see captureMethods.py for the format and for the code that
+reads these files back).
+
+It is meant to be registered as a listener on the raw data buffer:
+
+    writer = CaptureWriter('data.iolab')
+    G.dataBuffer.addListener(writer.add)
+    ...
+    G.dataBuffer.removeListener(writer.add)
+    writer.close()
+
+add() just puts the chunk on a queue, and the actual writing is done
+through a large file buffer by a thread of its own, so a slow disk never
+holds up the thread reading the serial port.
+
+"""
+
+class CaptureWriter(object):
+
+    def __init__(self, fileName, bufferSize=1 << 20):
+        self.fileName = fileName
+        self.file = open(fileName, 'wb', buffering=bufferSize)
+        self.file.write(fileHeader.pack(captureMagic, captureVersion, 0, time.time_ns()))
+
+        self.queue = SimpleQueue()
+        self.nChunks = 0
+        self.nBytes = 0
+
+        self.thread = Thread(target=self.writeThread)
+        self.thread.start()
+
+    #======================================
+    # queue up a chunk for writing. "chunk" is (seq, offset, length, time)
+    # and "data" holds the bytes (see RingBuffer.addListener())
+    def add(self, chunk, data):
+        self.queue.put((chunk, data))
+
+    #======================================
+    # this runs in its own thread until close() is called
+    def writeThread(self):
+
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+
+            (seq, offset, n, t), data = item
+            self.file.write(chunkHeader.pack(t, n, seq & 0xFFFFFFFF))
+            self.file.write(data)
+            self.nChunks += 1
+            self.nBytes += n
+
+        self.file.close()
+
+    #======================================
+    # write whatever is still queued up and close the file
+    def close(self):
+
+        self.queue.put(None)
+        self.thread.join()
+
+    def __repr__(self):
+        return 'CaptureWriter(' + repr(self.fileName) + ', chunks=' + str(self.nChunks) + ', bytes=' + str(self.nBytes) + ')'
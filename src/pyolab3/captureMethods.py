@@ -0,0 +1,123 @@
+#
+# This file is part of PyOLab. https://github.com/matsselen/pyolab
+# (C) 2017 Mats Selen <mats.selen@gmail.com>
+#
+# SPDX-License-Identifier:    BSD-3-Clause
+# (https://opensource.org/licenses/BSD-3-Clause)
+#
+
+# system stuff
+import struct
+
+"""
+These methods deal with capture files, which hold the raw bytes received
+from the serial port exactly as they arrived (see captureClass.py for the
+code that writes them).
+
+A capture file starts with a header:
+
+    8 bytes   captureMagic (b'PYOLABCP')
+    uint16    format version (captureVersion)
+    uint16    reserved (0)
+    int64     wall clock time when the file was started (time.time_ns())
+
+followed by the chunks of data in the order they were read, each one being
+
+    int64     host time when the chunk arrived (time.monotonic_ns())
+    uint32    number of bytes in the chunk
+    uint32    chunk sequence number (see bufferClass.py)
+    ...       the bytes themselves
+
+All numbers are little-endian.
+
+The old hex text format ("data.txt") can still be written by setting
+G.dumpFormat = 'hex', or made from a capture file with exportHex().
+
+"""
+
+captureMagic   = b'PYOLABCP'
+captureVersion = 1
+fileHeader     = struct.Struct('<8sHHq')   # magic, version, reserved, start time
+chunkHeader    = struct.Struct('<qII')     # time, length, sequence number
+
+# hexTable[b] is how byte b is written in the old hex text format
+hexTable = [hex(b)[2:] + ' ' for b in range(256)]
+
+#======================================
+# Returns the bytes in "data" as a string in the old hex text format
+# (each byte in hex with no leading zeros, followed by a space)
+#
+def hexDump(data):
+    return ''.join([hexTable[b] for b in data])
+
+#======================================
+# Reads the header of capture file "f" (an open binary file).
+# Returns a dictionary with the version and startTime, or raises ValueError
+# if this isn't a capture file.
+#
+def readCaptureHeader(f):
+
+    header = f.read(fileHeader.size)
+    if len(header) < fileHeader.size:
+        raise ValueError("file is too short to be a capture file")
+
+    magic, version, reserved, startTime = fileHeader.unpack(header)
+    if magic != captureMagic:
+        raise ValueError("not a capture file")
+    if version > captureVersion:
+        raise ValueError("capture file version " + str(version) + " is newer than this code")
+
+    return {'version': version, 'startTime': startTime}
+
+#======================================
+# Generator that yields (seq, time, data) for each chunk in the capture
+# file called fileName. A chunk that was cut short (if the program writing
+# the file died for example) ends the file.
+#
+def readCapture(fileName):
+
+    with open(fileName, 'rb', buffering=1 << 20) as f:
+        readCaptureHeader(f)
+
+        while True:
+            header = f.read(chunkHeader.size)
+            if len(header) < chunkHeader.size:
+                break
+            t, n, seq = chunkHeader.unpack(header)
+            data = f.read(n)
+            if len(data) < n:
+                break
+            yield seq, t, data
+
+#======================================
+# Generator that yields the raw bytes in the capture file fileName
+# in pieces of about blockSize bytes (chunk boundaries are ignored).
+#
+def readCaptureBytes(fileName, blockSize=1 << 20):
+
+    block = []
+    nBytes = 0
+    for seq, t, data in readCapture(fileName):
+        block.append(data)
+        nBytes += len(data)
+        if nBytes >= blockSize:
+            yield b''.join(block)
+            block = []
+            nBytes = 0
+
+    if nBytes > 0:
+        yield b''.join(block)
+
+#======================================
+# Writes the bytes in capture file captureName to the text file textName
+# in the old hex text format. Returns the number of bytes written.
+#
+def exportHex(captureName, textName):
+
+    nBytes = 0
+    with open(textName, 'w') as out:
+        for data in readCaptureBytes(captureName):
+            out.write(hexDump(data))
+            nBytes += len(data)
+
+    return nBytes
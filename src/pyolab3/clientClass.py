@@ -0,0 +1,231 @@
+#
+# This file is part of PyOLab. https://github.com/matsselen/pyolab
+# (C) 2017 Mats Selen <mats.selen@gmail.com>
+#
+# SPDX-License-Identifier:    BSD-3-Clause
+# (https://opensource.org/licenses/BSD-3-Clause)
+#
+
+# system stuff
+import socket
+import select
+import numpy as np
+
+# local stuff
+from .sharedClass import SharedCatalog, SharedColumn
+from .serverClass import frameHeader, statusFormat, frameData, frameStatus, frameSubscribe
+
+"""
+An IOLabClient reads the data that another program on the same computer is
+publishing in shared memory (see publishMethods.py), without a dongle of its own,
+and without any copying, sockets or pickling. It only needs the name the data are
+published under and the remote number:
+
+    client = IOLabClient('iolab')          # remote 1 of G.publishName = 'iolab'
+    n = 0
+    while not client.done:
+        first, samples, times = client.since(12, n)
+        ...                                # samples[i] was taken at times[i]
+        if client.overwritten(12, first):  # the writer got there first
+            ...
+        n = first + len(samples)
+
+The columns are in client.uncalDataDict and client.timeDataDict, keyed by sensor
+(SharedColumns, which can also be used like the ColumnStores in G.uncalDataDict),
+and client.status() holds the fixed configuration of the remote, the number of
+frames lost etc. Columns for sensors that start sending later are picked up by
+update(), which since() calls when it is asked for a sensor it doesn't know yet.
+
+The client never changes anything, and the data it has mapped stay readable
+even after the publisher has stopped (until close() is called).
+
+Programs that can't map the memory can subscribe to the data an IOLabServer is
+serving on a Unix-domain socket instead (see serverMethods.py) with an IOLabSubscriber:
+
+    subscriber = IOLabSubscriber('/tmp/iolab.sock', remote=1, sensors=[1, 12])
+    while not subscriber.done:
+        batch = subscriber.receive(1.0)    # None if nothing came in for a second
+        if batch is not None:
+            remote, sensor, first, samples, times = batch
+
+Here the samples are copies, and a gap in the sample numbers ("first") means
+the server threw some away because this subscriber wasn't keeping up.
+
+"""
+
+class IOLabClient(object):
+
+    def __init__(self, name='iolab', remote=1, track=False):
+        self.name = name
+        self.remote = remote
+        self.track = track           # see sharedMemory() in sharedClass.py
+        self.catalog = SharedCatalog(name + '_' + str(remote), track=track)
+        self.uncalDataDict = {}
+        self.timeDataDict  = {}
+        self.nColumns = 0            # the number of columns in the catalog already mapped
+        self.update()
+
+    #======================================
+    # maps the columns that have been published since the last time
+    # (returns the sensors that have new ones)
+    def update(self):
+
+        sensors = []
+        for kind, sensor in self.catalog.columns(self.nColumns):
+            column = SharedColumn(self.catalog.columnName(kind, sensor), track=self.track)
+            if kind == 'time':
+                self.timeDataDict[sensor] = column
+            else:
+                self.uncalDataDict[sensor] = column
+            sensors.append(sensor)
+            self.nColumns += 1
+
+        return sensors
+
+    #======================================
+    # Returns (first, samples, times): views (no copies) of the samples of "sensor"
+    # starting with sample number "first" (or the oldest one still there), and the times
+    # they were taken. There might be fewer than there are (when the storage goes around),
+    # in which case asking for the ones after these gets the rest.
+    def since(self, sensor, first=0):
+
+        if sensor not in self.uncalDataDict or sensor not in self.timeDataDict:
+            self.update()
+        if sensor not in self.uncalDataDict or sensor not in self.timeDataDict:
+            raise KeyError('sensor ' + str(sensor) + ' is not published')
+
+        # the times are published first, so there are always times for the samples
+        first, samples = self.uncalDataDict[sensor].view(first)
+        start, times = self.timeDataDict[sensor].view(first, first + len(samples))
+        return start, samples[start - first:start - first + len(times)], times
+
+    #======================================
+    # True if the samples (or times) of "sensor" from sample "first" on could have
+    # been written over since since() returned them
+    def overwritten(self, sensor, first):
+        return self.uncalDataDict[sensor].overwritten(first) or self.timeDataDict[sensor].overwritten(first)
+
+    #======================================
+    # the status of the remote: lastFixedConfig, lostFrames, lastFrameCount and lastFrameTime
+    def status(self):
+        return self.catalog.status()
+
+    @property
+    def lastFixedConfig(self):
+        return self.catalog.status()['lastFixedConfig']
+
+    # True once the publisher has stopped
+    @property
+    def done(self):
+        return self.catalog.done
+
+    #======================================
+    # frees the names of the catalog and the columns (only the publisher, or
+    # whoever has taken over from it, should do this - see stopPublishing())
+    def unlink(self):
+
+        self.update()
+        for column in [self.catalog] + list(self.uncalDataDict.values()) + list(self.timeDataDict.values()):
+            try:
+                column.unlink()
+            except FileNotFoundError:
+                pass
+
+    #======================================
+    # lets go of the data (any views of them that are left keep working)
+    def close(self):
+
+        for column in [self.catalog] + list(self.uncalDataDict.values()) + list(self.timeDataDict.values()):
+            column.close()
+        self.uncalDataDict = {}
+        self.timeDataDict = {}
+
+    def __repr__(self):
+        return 'IOLabClient(' + repr(self.name) + ', ' + str(self.remote) + ', sensors=' + str(sorted(self.uncalDataDict)) + ')'
+
+
+#======================================================================
+# subscribes to the sensors of "remote" (0 for all of the remotes) listed in
+# "sensors" (None for all of them) that the server at "path" is serving
+#
+class IOLabSubscriber(object):
+
+    def __init__(self, path, remote=0, sensors=None):
+        self.path = path
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(path)
+        self.received = bytearray()
+        self.status = {}             # the status of each remote, like IOLabClient.status()
+        self.done = False            # True once the server has gone
+        self.subscribe(remote, sensors)
+
+    #======================================
+    # asks for more sensors (on top of the ones already subscribed to)
+    def subscribe(self, remote=0, sensors=None):
+        payload = bytes([] if sensors is None else sensors)
+        self.sock.sendall(frameHeader.pack(frameSubscribe, remote, 0, 0, b'', 0, 0, len(payload)) + payload)
+
+    #======================================
+    # Waits up to "timeout" seconds (None for as long as it takes) for the next
+    # batch of samples. Returns (remote, sensor, first, samples, times), or None if
+    # nothing came in (or the server has gone, in which case done is True).
+    def receive(self, timeout=None):
+
+        while not self.done:
+            frame = self.nextFrame()
+            if frame is not None:
+                batch = self.unpack(*frame)
+                if batch is not None:
+                    return batch
+                continue
+
+            ready, writable, failed = select.select([self.sock], [], [], timeout)
+            if len(ready) == 0:
+                return None
+            data = self.sock.recv(0x10000)
+            if len(data) == 0:
+                self.done = True
+            self.received += data
+
+        return None
+
+    # the next frame that has come in completely (header, payload) or None
+    def nextFrame(self):
+
+        if len(self.received) < frameHeader.size:
+            return None
+        header = frameHeader.unpack_from(self.received)
+        end = frameHeader.size + header[-1]
+        if len(self.received) < end:
+            return None
+        payload = bytes(self.received[frameHeader.size:end])
+        del self.received[:end]
+        return header, payload
+
+    # the batch of samples in a frame (status frames go to self.status)
+    def unpack(self, header, payload):
+
+        kind, remote, sensor, width, dtype, count, first, size = header
+        if kind == frameStatus:
+            status = dict(zip(['lastFixedConfig', 'lostFrames', 'lastFrameCount', 'lastFrameTime'],
+                              statusFormat.unpack(payload)))
+            if status['lastFrameCount'] < 0:
+                status['lastFrameCount'] = None
+            self.status[remote] = status
+            return None
+
+        if kind != frameData:
+            return None
+
+        times = np.frombuffer(payload, np.float64, count)
+        samples = np.frombuffer(payload, dtype.rstrip(b'\0').decode(), count * width, count * 8)
+        if width > 1:
+            samples = samples.reshape(count, width)
+        return remote, sensor, first, samples, times
+
+    def close(self):
+        self.sock.close()
+        self.done = True
+
+    def __repr__(self):
+        return 'IOLabSubscriber(' + repr(self.path) + ', done=' + str(self.done) + ')'
@@ -8,12 +8,14 @@
 
 # system stuff
 import time
+import itertools
 import serial
 import serial.tools.list_ports
-from threading import Thread
+from threading import Timer
+from concurrent.futures import Future, InvalidStateError
 
 # local stuff
-from .pyolabGlobals import G
+from .pyolabGlobals import G, inSession
 
 
 """
@@ -25,25 +27,33 @@ with the IOLab system via the virtual com port.
 #======================================
 # Returns a list of names of the serial ports that
 # the OS thinks has an IOLab dongle is plugged into them
-def getIOLabPortName():
+def getIOLabPortNames():
 
     # get a list of all serial ports
     ports = list(serial.tools.list_ports.comports())
     
-    # loop over all of the ports found and get the name of 
-    # the last one that is an IOLab USB virtual com port
-    
-    p = ''
+    # loop over all of the ports found and keep the names 
+    # of the ones that are IOLab USB virtual com ports
     pList = []
     for port in ports:
          pInfo = list(port)
-         if G.logData:
+         if G.logData and G.logFile is not None:
             G.logFile.write("\npInfo: "+str(pInfo))
          if 'IOLab' in pInfo[1] or 'PID=1881' in pInfo[2]:
-            pList.append(pInfo)
+            pList.append(pInfo[0])
+
+    return pList
+
+#======================================
+# Returns the name of the serial port that the IOLab dongle is 
+# plugged into (the first one if there are several, see IOLabSessionManager
+# in sessionClass.py for using all of them), or '' if there isn't one
+def getIOLabPortName():
 
+    pList = getIOLabPortNames()
     nFound = len(pList)
 
+    p = ''
     if nFound == 0:
         print("Found no IOLab USB Dongles")
         if G.logData:
@@ -51,7 +61,7 @@ def getIOLabPortName():
     
     else:
 
-        p = pList[0][0]
+        p = pList[0]
         if nFound == 1:
             if G.logData:
                 G.logFile.write("\nFound IOLab USB Dongle: " + p)
@@ -75,6 +85,201 @@ def openIOLabPort(pName):
     return serialport
 
 
+#=======================================================================
+# Commands and their responses.
+#
+# issueCommand() sends a command record and returns a concurrent.futures.Future 
+# that is completed by findRecords() (see dataMethods.py) as soon as the answer 
+# is received. The result of the future is the record that answered the command:
+#
+#   - the ACK record (type 0xAA) or NACK record (type 0xBB) whose payload names the command
+#   - for commands that ask for information (getFixedConfig etc.) the record of the 
+#     same type as the command (or a NACK)
+#
+# For example
+#
+#   f = issueCommand(G.serialPort, [0x02, 0x27, 0x01, 1, 0x0A])  # getFixedConfig for remote 1
+#   rec = f.result()                                             # wait for the answer
+#
+# If there is no answer within "timeout" seconds the command is sent again, up 
+# to "retries" times, after which the future fails with a TimeoutError. 
+#
+# Different commands can be in flight at the same time. Commands that name a remote
+# (see remoteCommands) are kept apart by remote, since the answers say which remote
+# they come from, so getFixedConfig(s, 1) and getFixedConfig(s, 2) can be answered
+# in either order. ACK and NACK records only name the command, and complete the
+# oldest command of that type (whatever remote it is for). If the same command is 
+# issued again before the first one is answered, the answers are handed out in order.
+# A command that had to be sent again can be answered more than once; the answers
+# after the first are thrown away rather than handed to the next command like it
+# (see resolveCommand()).
+#
+# Note that the responses are only seen if analyzeDataThread is running. 
+#
+# The commands below (startData() etc) send the command and return its future right
+# away (or None if the analysis thread isn't running and nobody will see the answer),
+# so several commands can be in flight at once and the caller decides whether to
+# wait for the answer:
+#
+#   setFixedConfig(G.serialPort, 38, 1).result()     # wait until it has been done
+#   f = startData(G.serialPort)                      # or don't
+#
+# Code called by the analysis thread (the user's analLoop() for example) mustn't wait 
+# for an answer, since it is that thread that finds it. It can look at f.done() the
+# next time it is called, or use f.add_done_callback().
+#
+
+# the commands whose first payload byte (byte 3) is the remote they are for, and
+# whose answers (other than ACK and NACK) name the remote in byte 3 too
+remoteCommands = [0x22, 0x23, 0x24, 0x25, 0x26, 0x27, 0x28, 0x29, 0x2A, 0x2B]
+
+# numbers the commands in the order they are issued
+commandNumbers = itertools.count()
+
+#======================================
+# the key of a command or of the answer to one in G.pendingCommands: 
+# (command, remote), with remote None for commands that don't name one
+def commandKey(record):
+
+    command = record[1]
+    if command in remoteCommands and record[2] > 0:
+        return (command, record[3])
+    return (command, None)
+
+#======================================
+# Sends command_record over serial port "s" and returns a Future that 
+# will hold the record that answers it. 
+def issueCommand(s, command_record, timeout=None, retries=None):
+
+    if timeout is None:
+        timeout = G.commandTimeout
+    if retries is None:
+        retries = G.commandRetries
+
+    key = commandKey(command_record)
+    pending = {
+        'future'  : Future(),
+        'record'  : bytearray(command_record),
+        'key'     : key,
+        'number'  : next(commandNumbers),
+        'port'    : s,
+        'timeout' : timeout,
+        'retries' : retries,
+        'sent'    : 1,
+        'timer'   : None
+        }
+
+    with G.commandLock:
+        G.pendingCommands.setdefault(key, []).append(pending)
+        s.write(pending['record'])
+        startCommandTimer(pending)
+
+    return pending['future']
+
+#======================================
+# (re)starts the timer that fires if a pending command isn't answered in time.
+# must be called with G.commandLock held.
+def startCommandTimer(pending):
+
+    pending['timer'] = Timer(pending['timeout'], inSession(commandTimedOut), [pending])
+    pending['timer'].daemon = True
+    pending['timer'].start()
+
+#======================================
+# called by the timer of a pending command that has not been answered
+def commandTimedOut(pending):
+
+    with G.commandLock:
+        command = pending['record'][1]
+        waiting = G.pendingCommands.get(pending['key'], [])
+        if pending not in waiting:
+            return                  # it was answered after all
+
+        if pending['retries'] > 0 and not pending['future'].cancelled():
+            pending['retries'] -= 1
+            pending['sent'] += 1
+            if G.logData:
+                G.logFile.write("\nno response to command " + hex(command) + ", sending it again")
+            pending['port'].write(pending['record'])
+            startCommandTimer(pending)
+            return
+
+        waiting.remove(pending)
+        if len(waiting) == 0:
+            del G.pendingCommands[pending['key']]
+        expectLateAnswers(pending, pending['sent'])
+
+    if G.logData:
+        G.logFile.write("\nno response to command " + hex(command))
+    try:
+        pending['future'].set_exception(TimeoutError("no response to command " + hex(command)))
+    except InvalidStateError:
+        pass                        # somebody cancelled it
+
+#======================================
+# Remembers that "n" answers to the command of "pending" may still come, from the
+# times it was sent that weren't answered. Any that come within the command's
+# timeout are thrown away by resolveCommand(). Must be called with G.commandLock held.
+def expectLateAnswers(pending, n):
+
+    expires = time.monotonic() + pending['timeout']
+    G.lateAnswers += [[pending['key'], expires]] * n
+
+#======================================
+# Called by findRecords() for each record that is received. If "rec" answers a pending 
+# command (see issueCommand()) the oldest such command is completed, unless it
+# is a late answer to a command that was sent again (see expectLateAnswers()).
+def resolveCommand(rec):
+
+    recType = rec[1]
+    if recType == G.recType_ACK or recType == G.recType_NACK:
+        # the command being acknowledged (the ACK doesn't say which remote it came from)
+        answers = lambda key: key[0] == rec[3]
+    else:
+        # a response has the same type as the command, and names its remote
+        key = commandKey(rec)
+        answers = lambda k: k == key
+
+    with G.commandLock:
+        if G.lateAnswers:
+            now = time.monotonic()
+            G.lateAnswers = [late for late in G.lateAnswers if late[1] > now]
+            for late in G.lateAnswers:
+                if answers(late[0]):
+                    G.lateAnswers.remove(late)
+                    return
+
+        keys = [key for key in G.pendingCommands if answers(key)]
+        if len(keys) == 0:
+            return
+        key = min(keys, key=lambda key: G.pendingCommands[key][0]['number'])
+        waiting = G.pendingCommands[key]
+        pending = waiting.pop(0)
+        if len(waiting) == 0:
+            del G.pendingCommands[key]
+        pending['timer'].cancel()
+        expectLateAnswers(pending, pending['sent'] - 1)
+
+    try:
+        pending['future'].set_result(rec)
+    except InvalidStateError:
+        pass                        # somebody cancelled it
+
+#======================================
+# Used by the commands below. If the analysis thread is running this sends the command
+# and returns its future (see issueCommand()) without waiting for the answer, otherwise 
+# it just gives the serial port G.sleepCommand seconds to receive the data and returns None.
+def sendCommand(s, command_record):
+
+    if G.running and G.analThread is not None and G.analThread.is_alive():
+        return issueCommand(s, command_record)
+    else:
+        with G.commandLock:
+            s.write(bytearray(command_record))
+        time.sleep(G.sleepCommand)  #give the serial port some time to receive the data
+        return None
+
+
 #=======================================================================
 # This next bunch of routines sends commands to the IOLab remote via
 # the serial port "s". For a description of the data packets that are returned
@@ -88,8 +293,7 @@ def getDongleStatus(s):
 
     command = 0x14
     command_record = [0x02, command, 0x00, 0x0A] 
-    s.write(bytearray(command_record))
-    time.sleep(G.sleepCommand)  #give the serial port some time to receive the data
+    return sendCommand(s, command_record)
 
 #======================================
 # Start data acquisition. 
@@ -101,8 +305,7 @@ def startData(s):
 
     command = 0x20
     command_record = [0x02, command, 0x00, 0x0A]
-    s.write(bytearray(command_record))
-    time.sleep(G.sleepCommand)  #give the serial port some time to receive the data
+    return sendCommand(s, command_record)
     
 #======================================
 # Stop data acquisition. 
@@ -111,8 +314,7 @@ def stopData(s):
 
     command = 0x21
     command_record = [0x02, command, 0x00, 0x0A]
-    s.write(bytearray(command_record))
-    time.sleep(G.sleepCommand)  #give the serial port some time to receive the data
+    return sendCommand(s, command_record)
 
 #======================================
 # Sends a sensor configuration record to the selected remote. 
@@ -126,8 +328,7 @@ def setSensorConfig(s,idValueList,remote):
     command = 0x22
     command_record = [0x02, command, nBytes] + payload + [0x0A] 
 
-    s.write(bytearray(command_record))
-    time.sleep(G.sleepCommand)  #give the serial port some time to receive the data
+    return sendCommand(s, command_record)
 
 #======================================
 # Gets a sensor configuration record from the selected remote. 
@@ -135,8 +336,7 @@ def getSensorConfig(s,remote):
 
     command = 0x23
     command_record = [0x02, command, 0x01, remote, 0x0A] 
-    s.write(bytearray(command_record))
-    time.sleep(G.sleepCommand)  #give the serial port some time to receive the data
+    return sendCommand(s, command_record)
 
 #======================================
 # Sends an output configuration record to the selected remote. 
@@ -151,8 +351,7 @@ def setOutputConfig(s,idValueList,remote):
     command = 0x24
     command_record = [0x02, command, nBytes] + payload + [0x0A] 
 
-    s.write(bytearray(command_record))
-    time.sleep(G.sleepCommand)  #give the serial port some time to receive the data
+    return sendCommand(s, command_record)
 
 #======================================
 # Gets an output configuration record from the selected remote. 
@@ -160,8 +359,7 @@ def getOutputConfig(s,remote):
 
     command = 0x25
     command_record = [0x02, command, 0x01, remote, 0x0A] 
-    s.write(bytearray(command_record))
-    time.sleep(G.sleepCommand)  #give the serial port some time to receive the data
+    return sendCommand(s, command_record)
 
 #======================================
 # Ask remote to set the current sensor configuration to "config". 
@@ -170,8 +368,7 @@ def setFixedConfig(s,config,remote):
 
     command = 0x26
     command_record = [0x02, command, 0x02, remote, config, 0x0A] 
-    s.write(bytearray(command_record))
-    time.sleep(G.sleepCommand)  #give the serial port some time to receive the data
+    return sendCommand(s, command_record)
 
 #======================================
 # Ask remote to send a data packet of type 0x27 telling us the current sensor configuration 
@@ -179,8 +376,7 @@ def getFixedConfig(s, remote):
 
     command = 0x27
     command_record = [0x02, command, 0x01, remote, 0x0A] 
-    s.write(bytearray(command_record))
-    time.sleep(G.sleepCommand)  #give the serial port some time to receive the data
+    return sendCommand(s, command_record)
 
 #======================================
 # Ask remote to send a data packet of type 0x28 telling us the format of the 
@@ -189,8 +385,7 @@ def getPacketConfig(s, remote):
 
     command = 0x28
     command_record = [0x02, command, 0x01, remote, 0x0A] 
-    s.write(bytearray(command_record))
-    time.sleep(G.sleepCommand)  #give the serial port some time to receive the data
+    return sendCommand(s, command_record)
 
 #======================================
 # Ask remote to send a data packet of type 0x29 containing calibration information from sensor. 
@@ -198,8 +393,7 @@ def getCalibration(s, sensor, remote):
 
     command = 0x29
     command_record = [0x02, command, 0x02, remote, sensor, 0x0A] 
-    s.write(bytearray(command_record))
-    time.sleep(G.sleepCommand)  #give the serial port some time to receive the data
+    return sendCommand(s, command_record)
 
 #======================================
 # Ask remote to send a data packet of type 0x2a telling us its status
@@ -207,8 +401,7 @@ def getRemoteStatus(s, remote):
 
     command = 0x2A
     command_record = [0x02, command, 0x01, remote, 0x0A] 
-    s.write(bytearray(command_record))
-    time.sleep(G.sleepCommand)  #give the serial port some time to receive the data
+    return sendCommand(s, command_record)
 
 #======================================
 # Power down remote. 
@@ -217,12 +410,10 @@ def powerDown(s,remote):
 
     command = 0x2B
     command_record = [0x02, command, 0x01, remote, 0x0A]
-    s.write(bytearray(command_record))
-    time.sleep(G.sleepCommand)  #give the serial port some time to receive the data
+    return sendCommand(s, command_record)
 
 #======================================
 # This is a generic command 
 def sendIOLabCommand(s,command_record):
 
-    s.write(bytearray(command_record))
-    time.sleep(G.sleepCommand)  #give the serial port some time to receive the data
\ No newline at end of file
+    return sendCommand(s, command_record)
\ No newline at end of file
@@ -7,11 +7,17 @@
 #
 
 # system stuff
-import time
 import numpy as np
+from collections import defaultdict
 
 # local stuff
-from .pyolabGlobals import G
+from .pyolabGlobals import G, currentGlobals
+from .decoderClass import SensorDecoder
+from .storeClass import ColumnStore
+from .remoteClass import RemoteStream
+from .commMethods import resolveCommand
+from .calibrationMethods import readCalibrationRecord, setupCalibratedStores
+from .timingMethods import recordArrivalTimes, unwrapFrames, commitFrames, addSampleTimes
 from .iolabInfo import *
 
 """
@@ -22,28 +28,33 @@ from the IOLab system.
 
 #=================================
 # returns the n'th record received
+# (or [] if there isn't one or it has been discarded, see retentionMethods.py)
 #
 def getAllRec(n):
-    if n < len(G.allRecList):
-        return G.recDict[G.allRecList[n][0]][G.allRecList[n][1]]
-    else:
-        return []
+    return getListedRec(G.allRecList, n)
 
 #=========================================
 # returns the n'th data record received
 #
 def getDataRec(n):
-    if n < len(G.dataRecList):
-        return G.recDict[G.dataRecList[n][0]][G.dataRecList[n][1]]
-    else:
-        return []
+    return getListedRec(G.dataRecList, n)
 
 #=========================================
 # returns the n'th command record received
 #
 def getCommRec(n):
-    if n < len(G.commRecList):
-        return G.recDict[G.commRecList[n][0]][G.commRecList[n][1]]
+    return getListedRec(G.commRecList, n)
+
+#=========================================
+# returns the record that recList[n] points to
+#
+def getListedRec(recList, n):
+    if n < len(recList):
+        try:
+            recType, index = recList[n]
+            return G.recDict[recType][index]
+        except IndexError:
+            return []
     else:
         return []
 
@@ -53,189 +64,612 @@ def getCommRec(n):
 # from the remote. These are described in detail in the Indesign USB Interface Specification 
 # document that can be found at at Documentation/IOLab_usb_interface_specs.pdf)
 # 
-# The records are put into dictionary recDict (see pyolabGlobals.py)
-#
-def findRecords():
-
-    i = G.nextData         # where we will start looking
-    iLast = len(G.dataList) # where we will stop looking
-
-    # work through the data looking for valid records and saving these to G.recDict
-    # 
-    while i < (iLast - 3):
-        if (G.dataList[i] == 2):  # find start of packet (SOP) byte = 0x2
-            # find record type
-            for recType in G.recTypeList:
-                if G.dataList[i+1] == recType:
-
-                    # find byte count (BC)
-                    # see if we can find the end of packet (EOP) byte = 0xa
-                    ndata = G.dataList[i+2]
-                    # check that this isn't past the end of the list
-                    if i+3+ndata < iLast:
-                        if G.dataList[i+3+ndata] == 0xa:
-                            # if SOP, BC, and EOP are all consistent then save the record
-                            rec = G.dataList[i:i+4+ndata]
-                            index = len(G.recDict[recType])
-
-                            # all records: [recType,index] points into recDict[recType][index]
-                            G.allRecList.append([recType,index])
-                            if recType == G.recType_dataFromRemote:
-                                # data records: [recType,index] points into recDict[recType][index]
-                                G.dataRecList.append([recType,index])
-                            else:
-                                # command records: [recType,index] points into recDict[recType][index]
-                                G.commRecList.append([recType,index])
-
-                            # add record to the appropriate list in the record dictionary
-                            G.recDict[recType].append(rec)
-                            # if the thing we just received was a NACK it means a command was
-                            # not properly serviced, so we should tell someone
-                            if recType == G.recType_NACK:
-                                if G.logData:
-                                    G.logFile.write("\nNACK: " + str(rec))
-
-                            # figure out where we are starting next
-                            G.nextData = i + 4 + ndata # where the next record starts
-                            i = G.nextData - 1         # since we are adding 1 after the break
-                            break
-                        else:
-                            # shouldn't ever get here unless we are unlucky and the SOP and 
-                            # recType matches were a fluke (which will happen now and then)
-                            if G.logData:
-                                G.logFile.write("\nguessed wrong recType " + hex(recType) + " at i = "+str(i))
-                    else:
-                        break
-            i += 1
+# The records are put into dictionary recDict (see pyolabGlobals.py and saveRecords() below)
+#
+# The raw bytes are taken from G.dataBuffer (see bufferClass.py), up to stream 
+# offset "stop" if it is given. Bytes before the last complete record are 
+# released back to the buffer when we are done.
+#
+# Rather than stepping through the data one byte at a time, the checks are done
+# on all bytes at once using numpy:
+#   1) find every SOP byte (0x2) 
+#   2) keep the ones followed by a known record type (using the G.recTypeLUT lookup table)
+#   3) use the byte count (BC) of each of these to see if there is an EOP byte (0xa) 
+#      where there should be one
+# This leaves a (short) list of candidates. We then walk through these in order, 
+# skipping any that start inside a record we have already accepted, which is exactly 
+# what happens when the bytes are checked one at a time. 
+#
+def findRecords(stop=None):
 
-        else:
-            i += 1
+    g = currentGlobals()    # (quicker than going through G every time, see pyolabGlobals.py)
+
+    # data[0] is the byte at stream offset "base"
+    base, data = g.dataBuffer.peek(stop)
+
+    iFirst = g.nextData - base  # where we will start looking
+    iLast = len(data)           # where we will stop looking
+
+    if iLast - iFirst > 3:
+        a = np.frombuffer(data, dtype=np.uint8)
+
+        # SOP bytes followed by a valid record type
+        sop = np.flatnonzero(a[iFirst:iLast-3] == 2) + iFirst
+        sop = sop[g.recTypeLUT[a[sop+1]]]
+
+        # find byte count (BC) and see if we can find the end of packet (EOP) byte = 0xa
+        ndata = a[sop+2].astype(np.intp)
+        ieop = sop + 3 + ndata
+        complete = ieop < iLast                  # is the whole record here yet?
+        good = np.zeros(len(sop), dtype=bool)
+        good[complete] = a[ieop[complete]] == 0xa
+
+        found = []          # where the records we find start
+        i = iFirst
+        for iSop, nd, isGood, isComplete in zip(sop.tolist(), ndata.tolist(), good.tolist(), complete.tolist()):
+
+            # skip SOP candidates inside the last record we found
+            if iSop < i:
+                continue
+
+            if isGood:
+                # if SOP, BC, and EOP are all consistent then we have a record
+                found.append(iSop)
+
+                # figure out where we are starting next
+                i = iSop + 4 + nd             # where the next record starts
+                g.nextData = base + i
+
+            elif isComplete:
+                # shouldn't ever get here unless we are unlucky and the SOP and 
+                # recType matches were a fluke (which will happen now and then)
+                if g.logData:
+                    g.logFile.write("\nguessed wrong recType " + hex(data[iSop+1]) + " at i = "+str(base+iSop))
+
+        if len(found) > 0:
+            saveRecords(base, a, np.array(found))
+
+    # we will never look at anything before G.nextData again
+    g.dataBuffer.consume(g.nextData)
 
 
 #=================================================================
-# This method looks for changes to the fixed configuration of the 
-# IOLab remote (for now just assumes you are using one remote)
+# Saves the records found by findRecords(). "a" holds the raw bytes starting at 
+# stream offset "base" and the records start at a[starts]. 
 #
-def findLastConfig():
+# The bytes up to the end of the last record are added to G.recordBytes (which is 
+# numbered by stream offset), the records are added to the lists in G.recDict 
+# as offsets into it (see recordClass.py), so no record is copied on its own, 
+# and they get entries in G.recordIndex (see indexClass.py).
+#
+def saveRecords(base, a, starts):
 
-    # look for fixed config information
-    if len(G.recDict[G.recType_getFixedConfig]) > 0:
-        fc = G.recDict[G.recType_getFixedConfig][-1][4]   # the latest fixed config
-    else:
-        fc = 0                                            # or 0 if none found
+    g = currentGlobals()
 
-    # if new, save it and print it
-    if fc != G.lastFixedConfig:        
-        G.lastFixedConfig = fc
-        if G.logData:
-            G.logFile.write("\nNew fixed configuration " + str(fc))
+    g.recordBytes.append(a[len(g.recordBytes) - base:g.nextData - base])
 
+    types = a[starts + 1]
+    offsets = starts + base
+    ends = offsets + a[starts + 2] + 3      # where the EOP bytes are
 
-    # look for packet config information
-    if len(G.recDict[G.recType_getPacketConfig]) > 0:
-        pc = G.recDict[G.recType_getPacketConfig][-1][4:-1] # the latest packet config
-    else:
-        pc = []                                           # or [] if none found
+    # add the records to the lists in recDict and work out their index (ordinal) in these
+    ordinals = np.empty(len(starts), dtype=np.int64)
+    for recType in set(types.tolist()):
+        mine = types == recType
+        ordinals[mine] = len(g.recDict[recType]) + np.arange(np.count_nonzero(mine))
+        g.recDict[recType].extend(offsets[mine])
 
-    # if new, save it and print it
-    if pc != G.lastPacketConfig:       
-        G.lastPacketConfig = pc
+    # and to the record index (see indexClass.py)
+    first = len(g.recordIndex)
+    g.recordIndex.add(types, ordinals, offsets, g.dataBuffer.arrivalTimes(ends))
 
-        sc = {}
-        for i in range(pc[0]):      # decode the packet config record
-            s = pc[i*2+1]           # sensor
-            l = pc[i*2+2]           # max data length
-            sc[s] = l
+    # command records (anything that isn't data)
+    commands = np.flatnonzero(types != g.recType_dataFromRemote)
+    if len(commands) > 0:
+        g.commRecList.add(commands + first)
 
-        G.lastSensorBytes = sc     # save it
-        G.configIsSet = True
+        for j in commands.tolist():
+            recType = int(types[j])
+            rec = g.recDict[recType][int(ordinals[j])]
 
-        if G.logData:
-            G.logFile.write("\nNew packet configuration " + str(pc))
-            G.logFile.write("\nNew sensor configuration " + str(sc))
+            # if the thing we just received was a NACK it means a command was
+            # not properly serviced, so we should tell someone
+            if recType == g.recType_NACK:
+                if g.logData:
+                    g.logFile.write("\nNACK: " + str(rec))
+
+            # calibration constants read from the remote (see calibrationMethods.py)
+            if recType == g.recType_getCalibration:
+                readCalibrationRecord(rec)
+
+            # see if this answers a command that is waiting for it (see issueCommand())
+            if g.pendingCommands or g.lateAnswers:
+                resolveCommand(rec)
+
+
+#=================================================================
+# This method looks for changes to the fixed and packet configurations of the 
+# IOLab remotes, and keeps the latest ones in the RemoteStream of each remote 
+# (see remoteClass.py - for remote 1 these are also G.lastFixedConfig, 
+# G.lastPacketConfig and G.lastSensorBytes). Both kinds of record say which 
+# remote they are about in byte 3.
+#
+# The remote starts counting frames over when its configuration is changed or 
+# data are started, so it is also told where that happened (see timingMethods.py).
+#
+def findLastConfig():
+
+    g = currentGlobals()
+
+    # look for new fixed config information
+    records = g.recDict[g.recType_getFixedConfig]
+    for n in range(max(g.nextFixedConfig, records.base), len(records)):
+        rec = records[n]
+        remote = remoteStream(rec[3])
+        remote.restarts.append(rec.offset)
+        fc = rec[4]
+
+        # if new, save it and print it (and say where the samples taken with it will start)
+        if fc != remote.lastFixedConfig:        
+            remote.lastFixedConfig = fc
+            remote.configChanges.append((rec.offset, fc))
+            if g.logData:
+                g.logFile.write("\nNew fixed configuration " + str(fc) + remoteText(remote))
+    g.nextFixedConfig = len(records)
+
+
+    # look for new packet config information
+    records = g.recDict[g.recType_getPacketConfig]
+    for n in range(max(g.nextPacketConfig, records.base), len(records)):
+        rec = records[n]
+        remote = remoteStream(rec[3])
+        remote.restarts.append(rec.offset)
+        pc = rec[4:-1]
+
+        # if new, save it and print it
+        if pc != remote.lastPacketConfig:       
+            remote.lastPacketConfig = pc
+
+            sc = {}
+            for i in range(pc[0]):      # decode the packet config record
+                s = pc[i*2+1]           # sensor
+                l = pc[i*2+2]           # max data length
+                sc[s] = l
+
+            remote.lastSensorBytes = sc     # save it
+            remote.configIsSet = True
+
+            if g.logData:
+                g.logFile.write("\nNew packet configuration " + str(pc) + remoteText(remote))
+                g.logFile.write("\nNew sensor configuration " + str(sc))
+    g.nextPacketConfig = len(records)
+
+
+    # and for the dongle acknowledging a startData command (this goes for every remote)
+    records = g.recDict[g.recType_ACK]
+    for n in range(max(g.nextACK, records.base), len(records)):
+        rec = records[n]
+        if rec[3] == 0x20:
+            for remote in g.remotes.values():
+                remote.restarts.append(rec.offset)
+    g.nextACK = len(records)
+
+# (log messages about remotes other than remote 1 say which one)
+def remoteText(remote):
+    if remote.remote == 1:
+        return ""
+    return " for remote " + str(remote.remote)
+
+#=================================================================
+# Returns the RemoteStream for remote number "remote" (see remoteClass.py), 
+# setting one up if this is the first we have heard of it. Remote numbers 
+# that a dongle can't have (see G.remoteNumbers) are taken to be remote 1.
+#
+def remoteStream(remote):
+
+    if remote not in G.remotes:
+        if remote not in G.remoteNumbers:
+            return G.remotes[1]
+        G.remotes[remote] = RemoteStream(remote)
+        setupRemoteStores(G.remotes[remote])
+    return G.remotes[remote]
+
+#=================================================================
+# Sets up the stores that will hold the data decoded from a remote 
+# (sensors we can't decode yet get an empty store of 16 bit numbers)
+#
+def setupRemoteStores(remote):
+
+    sensorList = sensorName('SensorList')
+    sensorList += [s for s in sensorDecoders if s not in sensorList]
+    for sensNum in sensorList:
+        if sensNum in sensorDecoders:
+            remote.uncalDataDict[sensNum] = sensorDecoders[sensNum].makeStore()
+        else:
+            remote.uncalDataDict[sensNum] = ColumnStore('uint16')
+
+    # the times of the samples (see timingMethods.py)
+    for sensNum in remote.uncalDataDict:
+        remote.timeDataDict[sensNum] = ColumnStore('float64')
+
+    # and the ones that calibrate these when they are looked at (see calibrationMethods.py)
+    setupCalibratedStores(remote)
 
 #===================================================================
-# Extracts the payload data from dataFromRemote records and calls 
-# extractSensorData() to extract raw sensor data from these 
+# Hands the new dataFromRemote records to the remotes they came from, and calls 
+# decodeRemoteRecords() for each remote that has records waiting.
+#
+# The remote numbers of all of the new records are looked at at once, so this
+# costs next to nothing, and each remote then decodes its records in one go
+# just as if it were the only one.
+# (Records from remotes not in G.decodeRemotes are skipped, see processMethods.py)
 #
 def decodeDataPayloads():
 
+    g = currentGlobals()
+
+    nRec = len(g.recDict[g.recType_dataFromRemote])
+    if nRec > g.nextRecord:
+
+        # where the new records start in G.recordBytes, and which remote they are from
+        offsets = g.recDict[g.recType_dataFromRemote].since(g.nextRecord)[:nRec - g.nextRecord]
+        remotes = g.recordBytes.buf[offsets - g.recordBytes.base + g.recordBytes.start + 3]
+
+        numbers = np.arange(g.nextRecord, nRec)
+        if remotes[0] == remotes[-1] and np.all(remotes == remotes[0]):
+            remoteStream(int(remotes[0])).pending.append(numbers)
+        else:
+            for remote in np.unique(remotes).tolist():
+                remoteStream(remote).pending.append(numbers[remotes == remote])
+        g.nextRecord = nRec
+
+    for remote in list(g.remotes.values()):
+        if len(remote.pending) > remote.pending.base:
+            if g.decodeRemotes is None or remote.remote in g.decodeRemotes:
+                decodeRemoteRecords(remote)
+            else:
+                remote.pending.discard(len(remote.pending))   # somebody else decodes these
+
+#===================================================================
+# Extracts the payload data from the dataFromRemote records waiting in "remote" 
+# (a RemoteStream, see remoteClass.py) and calls extractSensorData() to extract 
+# raw sensor data from these 
+#
+# Since the packet configuration fixes the layout of the data records, runs of records
+# that follow this layout exactly are decoded all at once by decodeRecordBatch(). 
+# Anything else is handled one record at a time by decodeRecord(), as is everything if
+# G.batchDecode is False or fewer than G.batchMinRecords new records are waiting 
+# (for a handful of records the numpy overhead isn't worth it).
+#
+def decodeRemoteRecords(remote):
+
+    g = currentGlobals()
+
     # we can only do this if we know what sensors to expect
-    if len(G.lastSensorBytes) == 0:
-        if G.logData:
-            G.logFile.write("\n len(G.lastSensorBytes) = " + str(len(G.lastSensorBytes)))
-            G.logFile.write(" this will happen if you haven't sent a getPacketConfig command")
+    if len(remote.lastSensorBytes) == 0:
+        if g.logData:
+            g.logFile.write("\n len(g.lastSensorBytes) = " + str(len(remote.lastSensorBytes)) + remoteText(remote))
+            g.logFile.write(" this will happen if you haven't sent a getPacketConfig command")
         return
 
+    # the numbers of the records waiting (in G.recDict), skipping any that were
+    # thrown away before we knew how to decode them (see retentionMethods.py)
+    records = g.recDict[g.recType_dataFromRemote]
+    numbers = remote.pending.data()
+    if numbers[0] < records.base:
+        gone = np.searchsorted(numbers, records.base)
+        if g.logData:
+            g.logFile.write("\n" + str(gone) + " data records were thrown away before they could be decoded" + remoteText(remote))
+        remote.pending.discard(remote.pending.base + gone)
+        numbers = remote.pending.data()
+        if len(numbers) == 0:
+            return
+
+    # where the records start in G.recordBytes
+    offsets = records.data()[numbers - records.base]
+
+    # the valid bytes from each sensor are collected here for all of the records,
+    # and then handed to extractSensorData() one sensor at a time. sampleCounts[sensor][j]
+    # is how many samples of each sensor came from record numbers[j] (for the sample times)
+    payloads = {}
+    sampleCounts = defaultdict(lambda: np.zeros(len(offsets), dtype=np.intp))
+
+    # the records are all still in memory, starting at buf[where]
+    buf = g.recordBytes.buf
+    start = offsets - g.recordBytes.base + g.recordBytes.start
+    where = start.tolist()
+
+    # frame counts (see timingMethods.py)
+    times = recordArrivalTimes(offsets)
+    frameCounts, lostFrames = unwrapFrames(buf[start + 4], times, remote, offsets)
+
+    if g.batchDecode and len(offsets) >= g.batchMinRecords:
+        rows, regular = findRegularRecords(offsets, remote.lastSensorBytes)
+    else:
+        regular = np.zeros(len(offsets), dtype=bool)
+
+    # find where runs of regular (and irregular) records start and stop
+    edges = np.flatnonzero(np.diff(regular)) + 1
+    starts = [0] + edges.tolist()
+    stops = edges.tolist() + [len(offsets)]
 
-    nRec = len(G.recDict[G.recType_dataFromRemote])
-    if nRec > G.nextRecord:
-        for n in range(G.nextRecord,nRec):
-            r = G.recDict[G.recType_dataFromRemote][n]
+    for first, last in zip(starts, stops):
+        if regular[first]:
+            decodeRecordBatch(remote, numbers[first:last], rows[first:last], payloads, sampleCounts, first)
+        else:
+            for j in range(first, last):
+                k = where[j]
+                r = buf[k:k + 4 + int(buf[k+2])].tobytes()
+                if not decodeRecord(remote, int(numbers[j]), r, payloads, sampleCounts, j):
+                    # nothing from this record was kept, so just go on to the next one
+                    if g.logData:
+                        g.logFile.write("\nskipped data record " + str(int(numbers[j])) + remoteText(remote))
+
+    # the samples from records after a change of configuration were taken with the
+    # new one (this is worked out before they are added, so they are never calibrated
+    # with the wrong one, see calibratorClass.py)
+    if len(remote.configChanges) > 0:
+        placeConfigChanges(remote, offsets, sampleCounts)
+
+    # this is where the the good stuff happens
+    for sensor in payloads:
+        if extractSensorData(sensor, payloads[sensor], remote.uncalDataDict) is None:
+            del sampleCounts[sensor]
 
-            frameNumber = r[4]  # hardware frame byte (wraps after 255)
-            rfStatistics = r[5] # indicated which frequency set was used (0, 1, 2 or 3)
-            nSens = r[6]        # number of sensors in this data record
+    # and when it happened (see timingMethods.py)
+    addSampleTimes(sampleCounts, frameCounts, remote)
 
-            # write some info if frame numbers are not adjacent. (This will not catch missing
-            # frames that happened while the number wrapped from 255-0)
-            if G.logData and frameNumber - G.lastFrame > 1:
-                G.logFile.write("\nframeNumber "+str(frameNumber)+", lastFrame "+str(G.lastFrame)+", thisRF "+str(rfStatistics)+", lastRF "+str(G.lastRF))
+    commitFrames(frameCounts, lostFrames, times, remote, int(offsets[-1]))
+    remote.pending.discard(len(remote.pending))
 
 
-            # this should be the same as the number expected for this config
-            if nSens != len(G.lastSensorBytes): 
+#===================================================================
+# Turns the changes of fixed configuration in remote.configChanges that came before
+# the last of the records about to be decoded (which start at stream offsets "offsets",
+# with sampleCounts[sensor][j] samples of each sensor in record j) into the numbers of
+# the first samples taken with the new configurations, in remote.configStarts.
+#
+def placeConfigChanges(remote, offsets, sampleCounts):
+
+    while len(remote.configChanges) > 0 and remote.configChanges[0][0] < offsets[-1]:
+        offset, config = remote.configChanges.pop(0)
+        j = int(np.searchsorted(offsets, offset))
+        for sensor, store in remote.uncalDataDict.items():
+            first = len(store)
+            if sensor in sampleCounts:
+                first += int(sampleCounts[sensor][:j].sum())
+            remote.configStarts.setdefault(sensor, []).append((first, config))
+
+
+#===================================================================
+# Decodes dataFromRemote record number n (r is the record itself) from "remote" 
+# (a RemoteStream), adding the valid bytes from each sensor to the bytearrays in 
+# the dictionary "payloads", and the number of samples to sampleCounts[sensor][row]. 
+# If payloads is None only the debugging info is written. 
+#
+# Returns False (without adding anything) if the record contains a sensor we weren't 
+# expecting, or runs out before all of its sensors have been found.
+#
+def decodeRecord(remote, n, r, payloads, sampleCounts=None, row=0):
 
-                if G.logData:
-                    G.logFile.write("\nsensors found "+str(nSens)+" expected "+str(len(G.lastSensorBytes)))
-                    G.logFile.write("this can happen if you havent sent a getPacketConfig command")
+    g = currentGlobals()
 
-            i = 7               # pointer to info and data from first sensor
-            nSaved = 0          # the number of sensors we have saved data from
+    frameNumber = r[4]  # hardware frame byte (wraps after 255)
+    rfStatistics = r[5] # indicated which frequency set was used (0, 1, 2 or 3)
+    nSens = r[6]        # number of sensors in this data record
 
+    # (looked up once, since this is called for every record)
+    lastSensorBytes = remote.lastSensorBytes
+    logData = g.logData
 
-            dbgSensorBytes = {} # Dict for debugging purposes
-            nOflow = 0          # used to signal some info to be written after an overflow
+    # write some info if frame numbers are not adjacent. (This will not catch missing
+    # frames that happened while the number wrapped from 255-0, but unwrapFrames() 
+    # in timingMethods.py does)
+    if logData and frameNumber - remote.lastFrame > 1:
+        g.logFile.write("\nframeNumber "+str(frameNumber)+", lastFrame "+str(remote.lastFrame)+", thisRF "+str(rfStatistics)+", lastRF "+str(remote.lastRF))
 
-            while nSaved < nSens:
-                thisSensor = r[i] & 0x7F            # ID of the current sensor
-                sensorOverflow = r[i] > thisSensor  # is overflow bit set?
 
-                # make sure thisSensor is on the list of expected sensors for this config
-                if thisSensor in G.lastSensorBytes:
-                    nValidBytes = r[i+1]
-                    sensorBytes = r[i+2:i+2+nValidBytes]
+    # this should be the same as the number expected for this config
+    if nSens != len(lastSensorBytes): 
 
-                    dbgSensorBytes[thisSensor] = str(nValidBytes)+"/"+str(G.lastSensorBytes[thisSensor])
+        if logData:
+            g.logFile.write("\nsensors found "+str(nSens)+" expected "+str(len(lastSensorBytes)))
+            g.logFile.write("this can happen if you havent sent a getPacketConfig command")
 
-                    # see if sensor had the overflow bit set
-                    if G.logData and sensorOverflow:
-                        nOflow += 1
-                        G.logFile.write("\noverflow on record "+str(n)+", frameNumber " +str(frameNumber)+", lastFrame "+str(G.lastFrame)+", thisRF "+str(rfStatistics)+", lastRF "+str(G.lastRF)+", sensor "+str(thisSensor)+", nValidBytes "+str(nValidBytes)+" nSens "+str(nSens))
+    i = 7               # pointer to info and data from first sensor
+    nSaved = 0          # the number of sensors we have saved data from
 
-                    # this is where the the good stuff happens
-                    extractSensorData(thisSensor,sensorBytes)
+
+    dbgSensorBytes = {} # Dict for debugging purposes
+    nOflow = 0          # used to signal some info to be written after an overflow
+    found = []          # (sensor, bytes, samples) to be saved once the whole record checks out
+
+    while nSaved < nSens:
+        if i + 2 > len(r):
+            if logData:
+                g.logFile.write("\nBailing out after running out of record looking for sensor " + str(nSaved + 1) + " of " + str(nSens) + " in " + str(list(r)))
+            return False
+
+        thisSensor = r[i] & 0x7F            # ID of the current sensor
+        sensorOverflow = r[i] > thisSensor  # is overflow bit set?
+
+        # make sure thisSensor is on the list of expected sensors for this config
+        if thisSensor in lastSensorBytes:
+            nValidBytes = r[i+1]
+            sensorBytes = r[i+2:i+2+nValidBytes]
+            if len(sensorBytes) < nValidBytes:
+                if logData:
+                    g.logFile.write("\nBailing out after finding " + str(nValidBytes) + " bytes from sensor " + str(thisSensor) + " in " + str(list(r)))
+                return False
+
+            dbgSensorBytes[thisSensor] = str(nValidBytes)+"/"+str(lastSensorBytes[thisSensor])
+
+            # see if sensor had the overflow bit set
+            if logData and sensorOverflow:
+                nOflow += 1
+                g.logFile.write("\noverflow on record "+str(n)+", frameNumber " +str(frameNumber)+", lastFrame "+str(remote.lastFrame)+", thisRF "+str(rfStatistics)+", lastRF "+str(remote.lastRF)+", sensor "+str(thisSensor)+", nValidBytes "+str(nValidBytes)+" nSens "+str(nSens))
+
+            # save the data for later (if we know how to decode it and it is 
+            # a whole number of samples)
+            if thisSensor in sensorDecoders:
+                decoder = sensorDecoders[thisSensor]
+                if nValidBytes % decoder.blockSize > 0:
+                    if logData:
+                        g.logFile.write("\n" + decoder.name + " data not a multiple of " + str(decoder.blockSize) + " bytes")
                 else:
-                    # if we ever get here we need to tell Mats there is a problem.
-                    if G.logData:
-                        G.logFile.write("\nBailing out after finding wrong sensor: " +str(thisSensor) + " in " + str(r))
+                    found.append((thisSensor, sensorBytes, nValidBytes // decoder.blockSize))
+        else:
+            # if we ever get here we need to tell Mats there is a problem.
+            if logData:
+                g.logFile.write("\nBailing out after finding wrong sensor: " +str(thisSensor) + " in " + str(list(r)))
+            return False
+
+        nSaved += 1
+
+        i += (2 + lastSensorBytes[thisSensor])
 
-                    return
+    # dump some useful info every 1000 records or if an overflow happened
+    # or if framenumbers were out of sequence
+    if (n % 1000 == 0 or nOflow > 0 or frameNumber - remote.lastFrame > 1) and logData: 
+        g.logFile.write("\n*"+str(n)+"-"+str(dbgSensorBytes))
 
-                nSaved += 1
+    # the record is fine, so keep what was in it
+    if payloads is not None:
+        for sensor, sensorBytes, nSamples in found:
+            if sensor not in payloads:
+                payloads[sensor] = bytearray()
+            payloads[sensor].extend(sensorBytes)
+            if sampleCounts is not None:
+                sampleCounts[sensor][row] = nSamples
 
-                i += (2 + G.lastSensorBytes[thisSensor])
+    remote.lastFrame = frameNumber
+    remote.lastRF = rfStatistics
 
-            # dump some useful info every 1000 records or if an overflow happened
-            # or if framenumbers were out of sequence
-            if (n % 1000 == 0 or nOflow > 0 or frameNumber - G.lastFrame > 1) and G.logData: 
-                G.logFile.write("\n*"+str(n)+"-"+str(dbgSensorBytes))
+    return True
 
-            G.lastFrame = frameNumber
-            G.lastRF = rfStatistics
 
-        G.nextRecord = nRec
+#===================================================================
+# Returns a numpy structured dtype describing a dataFromRemote record for the 
+# packet configuration "sensorBytes" (see G.lastSensorBytes). The fields are
+#
+#   remote, frame, rf, nSens       record header
+#   idK, nValidK, dataK            sensor ID, number of valid bytes and the data slot 
+#                                  of the K'th sensor (K = 0, 1, ...)
+#   rssi                           signal strength 
+#
+# A record that doesn't have exactly this many bytes can't be decoded this way.
+#
+recordLayouts = {}
+
+def recordLayout(sensorBytes):
+
+    key = tuple(sensorBytes.items())
+    if key not in recordLayouts:
+        names = ['remote', 'frame', 'rf', 'nSens']
+        formats = ['u1', 'u1', 'u1', 'u1']
+        offsets = [3, 4, 5, 6]
+
+        i = 7
+        for k, (sensor, nBytes) in enumerate(key):
+            names += ['id'+str(k), 'nValid'+str(k), 'data'+str(k)]
+            formats += ['u1', 'u1', ('u1', (nBytes,))]
+            offsets += [i, i+1, i+2]
+            i += 2 + nBytes
+
+        names.append('rssi')
+        formats.append('u1')
+        offsets.append(i)
+
+        recordLayouts[key] = np.dtype({'names': names, 'formats': formats, 
+                                       'offsets': offsets, 'itemsize': i + 2})
+
+    return recordLayouts[key]
+
 
+#===================================================================
+# Looks at the dataFromRemote records that start at "offsets" in G.recordBytes and 
+# figures out which ones are laid out exactly as the packet configuration "sensorBytes"
+# (see RemoteStream.lastSensorBytes) says (right length, right number of sensors in 
+# the right order, and no more valid bytes than there is room for).
+#
+# Returns (rows, regular) where "regular" is a boolean array with one entry per record, 
+# and "rows" is a structured array (see recordLayout()) such that rows[j] is record j 
+# whenever regular[j] is True. 
+#
+def findRegularRecords(offsets, sensorBytes):
+
+    layout = recordLayout(sensorBytes)
+
+    # these records haven't been decoded yet, so they are all still in memory
+    store = G.recordBytes
+    first = offsets - store.base + store.start     # where they start in store.buf
+    lengths = store.buf[first + 2].astype(np.intp) + 4
+    sameLength = lengths == layout.itemsize
+
+    # gather the records that have the right length into one array
+    which = np.flatnonzero(sameLength)
+    packed = store.buf[first[which, None] + np.arange(layout.itemsize)].view(layout)[:, 0]
+
+    good = packed['nSens'] == len(sensorBytes)
+    for k, (sensor, nBytes) in enumerate(sensorBytes.items()):
+        good &= (packed['id'+str(k)] & 0x7F) == sensor
+        good &= packed['nValid'+str(k)] <= nBytes
+
+    regular = np.zeros(len(offsets), dtype=bool)
+    regular[which[good]] = True
+
+    # line the rows up with the records (irregular entries are never looked at)
+    rows = np.zeros(len(offsets), dtype=layout)
+    rows[which] = packed
+
+    return rows, regular
+
+
+#===================================================================
+# Decodes a run of regular dataFromRemote records (see findRegularRecords()) from
+# "remote", with record numbers "numbers". The valid bytes from each sensor are added 
+# to the bytearrays in the dictionary "payloads", and the sample counts to "sampleCounts"
+# (starting at row "row0"), exactly as decodeRecord() would do.
+#
+def decodeRecordBatch(remote, numbers, rows, payloads, sampleCounts, row0):
+
+    nRec = len(rows)
+    frames = rows['frame'].astype(np.intp)
+    rfs = rows['rf']
+
+    # things that decodeRecord() would have written to the log file
+    interesting = np.zeros(nRec, dtype=bool)
+
+    for k, (sensor, nBytes) in enumerate(remote.lastSensorBytes.items()):
+        nValid = rows['nValid'+str(k)].astype(np.intp)
+        interesting |= rows['id'+str(k)] > 0x7F       # overflow bit
+
+        if sensor in sensorDecoders:
+            aligned = nValid % sensorDecoders[sensor].blockSize == 0
+            interesting |= ~aligned
+
+            # pick out the valid bytes from each slot (these come out in record order)
+            valid = np.arange(nBytes) < np.where(aligned, nValid, 0)[:, None]
+            if sensor not in payloads:
+                payloads[sensor] = bytearray()
+            payloads[sensor].extend(rows['data'+str(k)][valid].tobytes())
+
+            sampleCounts[sensor][row0:row0 + nRec] = np.where(aligned, nValid, 0) // sensorDecoders[sensor].blockSize
+
+    if G.logData:
+        lastFrames = np.concatenate(([remote.lastFrame], frames[:-1]))
+        lastRFs = np.concatenate(([remote.lastRF], rfs[:-1]))
+        interesting |= frames - lastFrames > 1
+        interesting |= (numbers % 1000) == 0
+
+        # let decodeRecord() write the same messages it always has 
+        for j in np.flatnonzero(interesting).tolist():
+            remote.lastFrame = int(lastFrames[j])
+            remote.lastRF = int(lastRFs[j])
+            decodeRecord(remote, int(numbers[j]), rows[j].tobytes(), None)
+
+    remote.lastFrame = int(frames[-1])
+    remote.lastRF = int(rfs[-1])
 
 
 #======================================================================
@@ -244,316 +678,226 @@ def decodeDataPayloads():
 #
 # Inputs:
 #   sensor      the number of the sensor we are decoding as per sensorName()
-#   data        the data payload we are decoding
+#   data        the data payload we are decoding (bytes or list of bytes). This can
+#               contain any number of samples, for example all of the samples from
+#               this sensor in a batch of records
+#
+#   dataDict    the dictionary of ColumnStores to add the samples to (G.uncalDataDict,
+#               the one of remote 1, if it isn't given - see remoteClass.py)
 #
 # Output:
-#   The information is placed in a global dictionary G.uncalDataDict
-#   (see pyolabGlobals.py)
-#
-def extractSensorData(sensor,data):
-
-    # The different code segments below deal with data from different sensors. 
-    # Only sensors marked with '*' in the list below are extracted so far
-    # (I'm still working on the sensors labeled with '-')
-    #
-    #  * 'Accelerometer',
-    #  * 'Magnetometer',
-    #  * 'Gyroscope',
-    #  * 'Barometer',
-    #  * 'Microphone',
-    #  * 'Light',
-    #  * 'Force',
-    #  * 'Wheel',
-    #  - 'ECG3',
-    #  - 'Battery',
-    #  * 'HighGain',
-    #  * 'Analog7',
-    #  * 'Analog8',
-    #  * 'Analog9',
-    #  * 'Thermometer',
-    #  - 'ECG9'
-    #
-    # Note also that the extracted data is uncalibrated. 
-    # Examples of applying calibration constants cane be found 
-    # in Documentation/old_csharp_code.cs. 
-    #
-    # For some sensors these calibration constants are
-    # known (Analog and HighGain for example), for some they needs to be extracted 
-    # from the system with a getCalibration() call (barometer for example), and for others
-    # they need to be measured by the user (force probe & magnetometer for example).
-    # 
-    # The code below does not apply any calibration - it just extracts the uncalibrated data.
-    #
-
-
-    #-----------------------
-    # Accelerometer
-    # A 16 bit signed number for each of the three axes.
-    # Full scale depends on device settings. Default is 4g. 
-    # Calibration needed for both scale and offset. 
-    #
-    if sensorName(sensor) == 'Accelerometer':
-        # data comes in 6 byte blocks
-        if(len(data)%6 > 0):
-            if G.logData:
-                G.logFile.write("\nAccelerometer data not a multiple of 6 bytes")
-        else:
-            nsets = int(len(data)/6)
-            for i in range(nsets):
-                d = data[i*6:i*6+6]
-                d01 = np.int16(d[0]<<8 | d[1])
-                d23 = np.int16(d[2]<<8 | d[3])
-                d45 = np.int16(d[4]<<8 | d[5])
-                # the odd ordering & signs of the data below represent 
-                # the fact that the sensor is rotated on the PCB 
-                G.uncalDataDict[sensor].append([-d23,d01,d45])
-
-    #-----------------------
-    # Magnetometer
-    # A 16 bit signed number for each of the three axes.
-    # Full scale depends on device settings.
-    # Calibration needed for both scale and offset. 
-    #
-    if sensorName(sensor) == 'Magnetometer':
-        # data comes in 6 byte blocks
-        if(len(data)%6 > 0):
-            if G.logData:
-                G.logFile.write("\nMagnetometer data not a multiple of 6 bytes")
-        else:
-            nsets = int(len(data)/6)
-            for i in range(nsets):
-                d = data[i*6:i*6+6]
-                d01 = np.int16(d[0]<<8 | d[1])
-                d23 = np.int16(d[2]<<8 | d[3])
-                d45 = np.int16(d[4]<<8 | d[5])
-                G.uncalDataDict[sensor].append([-d01,-d23,-d45])
-
-    #-----------------------
-    # Gyroscope
-    # A 16 bit signed number for each of the three axes. Linear with omega.
-    # Full scale depends on device settings.
-    # Calibration needed for both scale and offset. 
-    #
-    if sensorName(sensor) == 'Gyroscope':
-        # data comes in 6 byte blocks
-        if(len(data)%6 > 0):
-            if G.logData:
-                G.logFile.write("\nGyroscope data not a multiple of 6 bytes")
-        else:
-            nsets = int(len(data)/6)
-            for i in range(nsets):
-                d = data[i*6:i*6+6]
-                d01 = np.int16(d[0]<<8 | d[1])
-                d23 = np.int16(d[2]<<8 | d[3])
-                d45 = np.int16(d[4]<<8 | d[5])
-                # the odd ordering & signs of the data below represent 
-                # the fact that the sensor is rotated on the PCB 
-                G.uncalDataDict[sensor].append([-d23,d01,d45])
-
-    #-----------------------
-    # Microphone. 
-    # Linear with intensity (I assume). Returns 16 bit unsigned number.  
-    #
-    if sensorName(sensor) == 'Microphone':
-        # data comes in 2 byte blocks
-        if(len(data)%2 > 0):
-            if G.logData:
-                G.logFile.write("\nMicrophone data not a multiple of 2 bytes")
-        else:
-            nsets = int(len(data)/2)
-            for i in range(nsets):
-                d = data[i*2:i*2+2]
-                d01 = np.uint16(d[0]<<8 | d[1])
-                G.uncalDataDict[sensor].append(d01)
-
-    #-----------------------
-    # Light
-    # Linear with intensity (I assume). Returns 16 bit unsigned number.   
-    #
-    if sensorName(sensor) == 'Light':
-        # data comes in 2 byte blocks
-        if(len(data)%2 > 0):
-            if G.logData:
-                G.logFile.write("\nLight data not a multiple of 2 bytes")
-        else:
-            nsets = int(len(data)/2)
-            for i in range(nsets):
-                d = data[i*2:i*2+2]
-                d01 = np.uint16(d[0]<<8 | d[1])
-                G.uncalDataDict[sensor].append(d01)
-
-    #-----------------------
-    # Force
-    # A 16 bit signed number derived by measuring the B-field of a magnet 
-    # that moves in response to an applied force. Linear with force. 
-    # Calibration needed for both scale and offset. 
-    #
-    if sensorName(sensor) == 'Force':
-        # data comes in 2 byte blocks
-        if(len(data)%2 > 0):
-            if G.logData:
-                G.logFile.write("\nForce data not a multiple of 2 bytes")
-        else:
-            nsets = int(len(data)/2)
-            for i in range(nsets):
-                d = data[i*2:i*2+2]
-                d01 = np.int16(d[0]<<8 | d[1])
-                G.uncalDataDict[sensor].append(d01)
-
-    #-----------------------
-    # Wheel
-    # A 16 bit signed number. Each measurement is the change of the wheels position 
-    # in 1mm increments since the last measurement. Measurement interval is 1/100 sec.  
-    #
-    if sensorName(sensor) == 'Wheel':
-        # data comes in 2 byte blocks
-        if(len(data)%2 > 0):
-            if G.logData:
-                G.logFile.write("\nWheel data not a multiple of 2 bytes")
-        else:
-            nsets = int(len(data)/2)
-            for i in range(nsets):
-                d = data[i*2:i*2+2]
-                d01 = np.int16(d[0]<<8 | d[1]) # dr
-                G.uncalDataDict[sensor].append(d01)
-
-    #-----------------------
-    # HighGain
-    # G+/G- feeds DC coupled differential op-amp w/ gain 1400
-    # Op-amp output feeds internal 12 bit ADC (raw ADC values [0 - 4095])
-    # Full scale count is +- 3V/2 = +- 1500 mV
-    # Zero offset 0x7FF (half full scale)
-    # Full scale deflection = 1500mV/1400 = 1.07 mV
-    # counts per volt = 2048 * 1400 / 1500
-    # 
-    if sensorName(sensor) == 'HighGain':
-        # data comes in 2 byte blocks
-        if(len(data)%2 > 0):
-            if G.logData:
-                G.logFile.write("\nHighGain data not a multiple of 2 bytes")
-        else:
-            nsets = int(len(data)/2)
-            for i in range(nsets):
-                d = data[i*2:i*2+2]
-                d01 = np.uint16(d[0]<<8 | d[1])
-                G.uncalDataDict[sensor].append(d01)
-
-    #-----------------------
-    # Analog7
-    # Feeds internal 12 bit ADC (raw ADC values [0 - 4095])
-    # Full scale corresponds to either 3.0V or 3.3V depending on configuration
-    # (see configName(); if configuration name contains '3V3' reference is 3.3V)
-    #
-    if sensorName(sensor) == 'Analog7':
-        # data comes in 2 byte blocks
-        if(len(data)%2 > 0):
-            if G.logData:
-                G.logFile.write("\nAnalog7 data not a multiple of 2 bytes")
-        else:
-            nsets = int(len(data)/2)
-            for i in range(nsets):
-                d = data[i*2:i*2+2]
-                d01 = np.uint16(d[0]<<8 | d[1])
-                G.uncalDataDict[sensor].append(d01)
-
-    #-----------------------
-    # Analog8
-    # Feeds internal 12 bit ADC (raw ADC values [0 - 4095])
-    # Full scale corresponds to either 3.0V or 3.3V depending on configuration
-    # (see configName(); if configuration name contains '3V3' reference is 3.3V)
-    #
-    if sensorName(sensor) == 'Analog8':
-        # data comes in 2 byte blocks
-        if(len(data)%2 > 0):
-            if G.logData:
-                G.logFile.write("\nAnalog8 data not a multiple of 2 bytes")
-        else:
-            nsets = int(len(data)/2)
-            for i in range(nsets):
-                d = data[i*2:i*2+2]
-                d01 = np.uint16(d[0]<<8 | d[1])
-                G.uncalDataDict[sensor].append(d01)
-
-    #-----------------------
-    # Analog9
-    # Feeds internal 12 bit ADC (raw ADC values [0 - 4095])
-    # Full scale corresponds to either 3.0V or 3.3V depending on configuration
-    # (see configName(); if configuration name contains '3V3' reference is 3.3V)
-    #
-    if sensorName(sensor) == 'Analog9':
-        # data comes in 2 byte blocks
-        if(len(data)%2 > 0):
-            if G.logData:
-                G.logFile.write("\nAnalog9 data not a multiple of 2 bytes")
-        else:
-            nsets = int(len(data)/2)
-            for i in range(nsets):
-                d = data[i*2:i*2+2]
-                d01 = np.uint16(d[0]<<8 | d[1])
-                G.uncalDataDict[sensor].append(d01)
-
-
-    #-----------------------
-    # Barometer
-    # The uncalibrated data read from the Barometer chip represents both
-    # pressure and temperature, but calibration is needed in order to turn
-    # these into useful numbers. The calibration constants are programmed into
-    # the barometer chip itself and can be extracted by sending the system a 
-    # "getCalibration()" request with the appropriate parameters. 
-    # (see IOLab_usb_interface_specs.pdf and IOLab_data_specs.pdf in Documentation/)
-    #
-    # from Mats old code (where i1 == d01 and i2 == d23 below):
-    #            // keep only the lowest 10 bits in each
-    #            i1 = (i1 >> 6) & (uint)0x3FF;
-    #            i2 = (i2 >> 6) & (uint)0x3FF;
-    #
-    #            // Apply calibration
-    #            s.cal.P = Pressure(i1, i2);
-    # 
-    # and see CalculateCalibrationConstants() and Pressure() in Documentation/old_csharp_code.cs
-    #
-    if sensorName(sensor) == 'Barometer':
-        # data comes in 4 byte blocks
-        if(len(data)%4 > 0):
-            if G.logData:
-                G.logFile.write("\nBarometer data not a multiple of 4 bytes")
-        else:
-            nsets = int(len(data)/4)
-            for i in range(nsets):
-                d = data[i*4:i*4+4]
-                d01 = np.uint16(d[0]<<8 | d[1])
-                d23 = np.uint16(d[2]<<8 | d[3])
-
-                G.uncalDataDict[sensor].append([d01,d23])
-
-
-    #-----------------------
-    # Thermometer
-    # The uncalibrated Thermometer data is oversampled 
-    # (it needs to be divided by 400, which is done in this code), 
-    # and then the result needs to be turned into a temperature by a linear function 
-    # for which we know the slope and intercept:
-    # cal = 30 + (raw - calAt30degrees)*(85-30)/(calAt85degrees-calAt30degrees)
-    #   where calAt30degrees = 2041 and calAt85degrees = 2426
-    # caution - these values are from some older code of Mats and should be 
-    # suspect until verified. 
-    #
-    if sensorName(sensor) == 'Thermometer':
-        # data comes in 4 byte blocks
-        if(len(data)%4 > 0):
-            if G.logData:
-                G.logFile.write("\nThermometer data not a multiple of 4 bytes")
-        else:
-            nsets = int(len(data)/4)
-            for i in range(nsets):
-                d = data[i*4:i*4+4]
-                d0123 = np.uint( d[0]<<24 | d[1]<<16 | d[2]<<8 | d[3] )
+#   The information is added to a global dictionary of ColumnStores G.uncalDataDict
+#   (see pyolabGlobals.py and storeClass.py). The decoded samples are also returned as a numpy
+#   array with one row per sample (or None if nothing was decoded).
+#
+# The work is done by the SensorDecoder registered for this sensor (see sensorDecoders
+# below). Sensors that don't have a decoder are ignored. 
+#
+def extractSensorData(sensor,data,dataDict=None):
+
+    if sensor not in sensorDecoders:
+        return None
 
-                G.uncalDataDict[sensor].append(d0123)
+    decoder = sensorDecoders[sensor]
+    if len(data) % decoder.blockSize > 0:
+        if G.logData:
+            G.logFile.write("\n" + decoder.name + " data not a multiple of " + str(decoder.blockSize) + " bytes")
+        return None
 
+    d = decoder.decode(bytes(data))
 
+    # save the new samples
+    if dataDict is None:
+        dataDict = G.uncalDataDict
+    dataDict[sensor].append(d)
 
+    return d
 
 
+#======================================================================
+# Adds (or replaces) the decoder used by extractSensorData() for sensor number "sensor". 
+# See decoderClass.py for a description of the parameters. For example, 
+#
+#   registerSensorDecoder(11, '>u2')                  # Battery, one 16 bit number per sample
+#   registerSensorDecoder(10, '>u2', 3, name='ECG3')  # three 16 bit numbers per sample
+#
+# If the stores in G.uncalDataDict have already been set up, an empty store for
+# this sensor is created (for each remote).
+#
+def registerSensorDecoder(sensor, dtype, width=1, axisMap=None, signs=None, decode=None, name=None):
+
+    if name is None:
+        name = sensorName(sensor)
+        if name == '':
+            name = 'Sensor' + str(sensor)
+
+    decoder = SensorDecoder(sensor, name, dtype, width, axisMap, signs, decode)
+    sensorDecoders[sensor] = decoder
+
+    for remote in G.remotes.values():
+        if len(remote.uncalDataDict) > 0:
+            remote.uncalDataDict[sensor] = decoder.makeStore()
+            remote.timeDataDict[sensor] = ColumnStore('float64')
+
+    return decoder
+
+
+#======================================================================
+# Dictionary of the SensorDecoders used by extractSensorData(), keyed by sensor number. 
+# The ones below are set up when this file is imported. Sensors marked with '-' 
+# are not decoded yet (use registerSensorDecoder() if you want them)
+#
+#  - 'ECG3',
+#  - 'Battery',
+#  - 'Digital',
+#  - 'ECG9'
+#
+# Note also that the extracted data is uncalibrated. 
+# Examples of applying calibration constants cane be found 
+# in Documentation/old_csharp_code.cs. 
+#
+# For some sensors these calibration constants are
+# known (Analog and HighGain for example), for some they needs to be extracted 
+# from the system with a getCalibration() call (barometer for example), and for others
+# they need to be measured by the user (force probe & magnetometer for example).
+# 
+# The decoders below do not apply any calibration - they just extract the uncalibrated data.
+#
+sensorDecoders = {}
+
+#-----------------------
+# Accelerometer
+# A 16 bit signed number for each of the three axes.
+# Full scale depends on device settings. Default is 4g. 
+# Calibration needed for both scale and offset. 
+#
+# data comes in 6 byte blocks
+# the odd ordering & signs of the data below represent 
+# the fact that the sensor is rotated on the PCB 
+registerSensorDecoder(1, '>i2', 3, axisMap=[1,0,2], signs=[-1,1,1])
+
+#-----------------------
+# Magnetometer
+# A 16 bit signed number for each of the three axes.
+# Full scale depends on device settings.
+# Calibration needed for both scale and offset. 
+#
+# data comes in 6 byte blocks
+registerSensorDecoder(2, '>i2', 3, signs=[-1,-1,-1])
+
+#-----------------------
+# Gyroscope
+# A 16 bit signed number for each of the three axes. Linear with omega.
+# Full scale depends on device settings.
+# Calibration needed for both scale and offset. 
+#
+# data comes in 6 byte blocks
+# the odd ordering & signs of the data below represent 
+# the fact that the sensor is rotated on the PCB 
+registerSensorDecoder(3, '>i2', 3, axisMap=[1,0,2], signs=[-1,1,1])
+
+#-----------------------
+# Microphone. 
+# Linear with intensity (I assume). Returns 16 bit unsigned number.  
+#
+# data comes in 2 byte blocks
+registerSensorDecoder(6, '>u2')
 
+#-----------------------
+# Light
+# Linear with intensity (I assume). Returns 16 bit unsigned number.   
+#
+# data comes in 2 byte blocks
+registerSensorDecoder(7, '>u2')
+
+#-----------------------
+# Force
+# A 16 bit signed number derived by measuring the B-field of a magnet 
+# that moves in response to an applied force. Linear with force. 
+# Calibration needed for both scale and offset. 
+#
+# data comes in 2 byte blocks
+registerSensorDecoder(8, '>i2')
 
+#-----------------------
+# Wheel
+# A 16 bit signed number. Each measurement is the change of the wheels position 
+# in 1mm increments since the last measurement. Measurement interval is 1/100 sec.  
+#
+# data comes in 2 byte blocks
+registerSensorDecoder(9, '>i2')
+
+#-----------------------
+# HighGain
+# G+/G- feeds DC coupled differential op-amp w/ gain 1400
+# Op-amp output feeds internal 12 bit ADC (raw ADC values [0 - 4095])
+# Full scale count is +- 3V/2 = +- 1500 mV
+# Zero offset 0x7FF (half full scale)
+# Full scale deflection = 1500mV/1400 = 1.07 mV
+# counts per volt = 2048 * 1400 / 1500
+# 
+# data comes in 2 byte blocks
+registerSensorDecoder(12, '>u2')
+
+#-----------------------
+# Analog7
+# Feeds internal 12 bit ADC (raw ADC values [0 - 4095])
+# Full scale corresponds to either 3.0V or 3.3V depending on configuration
+# (see configName(); if configuration name contains '3V3' reference is 3.3V)
+#
+# data comes in 2 byte blocks
+registerSensorDecoder(21, '>u2')
+
+#-----------------------
+# Analog8
+# Feeds internal 12 bit ADC (raw ADC values [0 - 4095])
+# Full scale corresponds to either 3.0V or 3.3V depending on configuration
+# (see configName(); if configuration name contains '3V3' reference is 3.3V)
+#
+# data comes in 2 byte blocks
+registerSensorDecoder(22, '>u2')
+
+#-----------------------
+# Analog9
+# Feeds internal 12 bit ADC (raw ADC values [0 - 4095])
+# Full scale corresponds to either 3.0V or 3.3V depending on configuration
+# (see configName(); if configuration name contains '3V3' reference is 3.3V)
+#
+# data comes in 2 byte blocks
+registerSensorDecoder(23, '>u2')
+
+#-----------------------
+# Barometer
+# The uncalibrated data read from the Barometer chip represents both
+# pressure and temperature, but calibration is needed in order to turn
+# these into useful numbers. The calibration constants are programmed into
+# the barometer chip itself and can be extracted by sending the system a 
+# "getCalibration()" request with the appropriate parameters. 
+# (see IOLab_usb_interface_specs.pdf and IOLab_data_specs.pdf in Documentation/)
+#
+# from Mats old code (where i1 == d01 and i2 == d23 below):
+#            // keep only the lowest 10 bits in each
+#            i1 = (i1 >> 6) & (uint)0x3FF;
+#            i2 = (i2 >> 6) & (uint)0x3FF;
+#
+#            // Apply calibration
+#            s.cal.P = Pressure(i1, i2);
+# 
+# and see CalculateCalibrationConstants() and Pressure() in Documentation/old_csharp_code.cs
+#
+# data comes in 4 byte blocks
+registerSensorDecoder(4, '>u2', 2)
+
+#-----------------------
+# Thermometer
+# The uncalibrated Thermometer data is oversampled 
+# (it needs to be divided by 400, which is done in this code), 
+# and then the result needs to be turned into a temperature by a linear function 
+# for which we know the slope and intercept:
+# cal = 30 + (raw - calAt30degrees)*(85-30)/(calAt85degrees-calAt30degrees)
+#   where calAt30degrees = 2041 and calAt85degrees = 2426
+# caution - these values are from some older code of Mats and should be 
+# suspect until verified. 
+#
+# data comes in 4 byte blocks
+registerSensorDecoder(26, '>u4')
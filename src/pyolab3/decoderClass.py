@@ -0,0 +1,80 @@
+#
+# This file is part of PyOLab. https://github.com/matsselen/pyolab
+# (C) 2017 Mats Selen <mats.selen@gmail.com>
+#
+# SPDX-License-Identifier:    BSD-3-Clause
+# (https://opensource.org/licenses/BSD-3-Clause)
+#
+
+# system stuff
+import numpy as np
+
+# local stuff
+from .storeClass import ColumnStore
+
+"""
+A SensorDecoder knows how to turn the payload bytes from one sensor into
+uncalibrated samples. Everything that can be worked out ahead of time
+(the sample size, the numpy types, the axis re-ordering) is done when
+the decoder is created, so decoding a payload is just a few numpy calls.
+
+The decoders in use are kept in the sensorDecoders dictionary in dataMethods.py,
+keyed by sensor number (see registerSensorDecoder() there).
+
+The parameters are:
+
+    sensor    sensor number as per sensorName()
+    name      sensor name (used in messages)
+    dtype     type of each number in the payload, for example '>i2' for big-endian
+              16 bit signed integers (see IOLab_data_specs.pdf for each sensor)
+    width     how many of these numbers make up one sample
+    axisMap   optional list saying which payload number ends up in each column,
+              for example [1,0,2] swaps the first two
+    signs     optional list of +1/-1 applied to each column (after axisMap)
+    decode    optional function decode(bytes) -> numpy array, for payloads that
+              can't be described by the above. It must return a whole number of
+              samples of type dtype (in native byte order) and width.
+
+"""
+
+class SensorDecoder(object):
+
+    def __init__(self, sensor, name, dtype, width=1, axisMap=None, signs=None, decode=None):
+        self.sensor    = sensor
+        self.name      = name
+        self.wireDtype = np.dtype(dtype)                            # as it comes from the remote
+        self.dtype     = self.wireDtype.newbyteorder('=')          # as it is stored
+        self.width     = width
+        self.blockSize = self.wireDtype.itemsize * width           # bytes per sample
+        self.axisMap   = None if axisMap is None else list(axisMap)
+        self.signs     = None if signs is None else np.array(signs, dtype=self.dtype)
+        self.decodeFunction = decode
+
+        # leave out the re-ordering if it doesn't do anything
+        if self.axisMap == list(range(width)):
+            self.axisMap = None
+
+    #======================================
+    # Returns the samples in "data" as a numpy array with one row per sample
+    # (or a 1-D array if width == 1). "data" must hold a whole number of samples.
+    def decode(self, data):
+
+        if self.decodeFunction is not None:
+            return self.decodeFunction(data)
+
+        d = np.frombuffer(data, dtype=self.wireDtype).astype(self.dtype)
+        if self.width > 1:
+            d = d.reshape(-1, self.width)
+        if self.axisMap is not None:
+            d = d[:, self.axisMap]
+        if self.signs is not None:
+            d *= self.signs
+        return d
+
+    #======================================
+    # returns an empty store that can hold the decoded samples
+    def makeStore(self):
+        return ColumnStore(self.dtype, self.width)
+
+    def __repr__(self):
+        return 'SensorDecoder(' + str(self.sensor) + ', ' + repr(self.name) + ', ' + repr(self.wireDtype.str) + ', width=' + str(self.width) + ')'
@@ -0,0 +1,302 @@
+#
+# This file is part of PyOLab. https://github.com/matsselen/pyolab
+# (C) 2017 Mats Selen <mats.selen@gmail.com>
+#
+# SPDX-License-Identifier:    BSD-3-Clause
+# (https://opensource.org/licenses/BSD-3-Clause)
+#
+
+# system stuff
+import os
+import tty
+import time
+import math
+import random
+import select
+import numpy as np
+from threading import Thread
+
+# local stuff
+from .iolabInfo import configName, sampleBytes
+
+"""
+An IOLabEmulator pretends to be an IOLab dongle with one remote, on a
+pseudo-terminal (so this only works on Linux & macOS). It answers the
+commands described in IOLab_usb_interface_specs.pdf and, once data
+acquisition is started, sends a dataFromRemote (0x41) record every 10 ms
+laid out as per the packet configuration of the current fixed
+configuration (see configName()). This makes it possible to run all of
+the pyolab code, threads and all, without any hardware:
+
+    emulator = IOLabEmulator()
+    startItUp(emulator.portName)
+    ...
+    shutItDown()
+    emulator.close()
+
+The sensor data are counters (each sensor counts up by one for every number
+it sends), which makes it easy to check that nothing was lost.
+
+Some trouble can be injected on purpose:
+
+    dropRate      chance per frame that the RF link drops out for 1-10 frames
+                  (the missing records are not sent, and rfStatusFromRemote (0x40)
+                  records report the disconnect and reconnect)
+    overflowRate  chance per sensor per record that the overflow bit is set
+    corruptRate   chance per record that one of its bytes is changed
+
+If the program reading the port falls behind and the pty fills up, bytes
+are thrown away (and counted in stats['bytesLost']) like a real dongle would.
+
+"""
+
+# calibration data returned by getCalibration (the values in Documentation/old_csharp_code.cs
+# for the barometer and in IOLab_data_specs.pdf for the thermometer)
+calibrationBytes = {4 : [0x44, 0x22, 0xad, 0x63, 0xbc, 0xda, 0x3a, 0xb8],
+                    26: [0x09, 0x7a, 0x07, 0xf9]}
+
+class IOLabEmulator(object):
+
+    def __init__(self, config=0, remote=1, dropRate=0.0, overflowRate=0.0, corruptRate=0.0, seed=None):
+
+        self.master, self.slave = os.openpty()
+        tty.setraw(self.slave)
+        os.set_blocking(self.master, False)
+        self.portName = os.ttyname(self.slave)
+
+        self.remote = remote
+        self.dropRate = dropRate
+        self.overflowRate = overflowRate
+        self.corruptRate = corruptRate
+        self.random = random.Random(seed)
+
+        self.setConfig(config)
+        self.sensorConfig = []       # key-value pairs from setSensorConfig
+        self.outputConfig = []       # key-value pairs from setOutputConfig
+        self.acquiring = False
+        self.frame = 0               # frame counter (the low byte goes in each record)
+        self.dropFrames = 0          # number of frames still to be dropped
+        self.commandBuffer = bytearray()
+
+        self.stats = {'commands': 0, 'frames': 0, 'records': 0, 'bytesSent': 0, 'bytesLost': 0,
+                      'framesDropped': 0, 'overflows': 0, 'corrupted': 0}
+
+        self.running = True
+        self.thread = Thread(target=self.run)
+        self.thread.start()
+
+    #======================================
+    # use fixed configuration "config": work out the packet configuration
+    # (each sensor gets room for one sample more than it needs per frame)
+    def setConfig(self, config):
+
+        self.config = config
+        self.slots = []              # [sensor, max data length, samples per frame]
+        self.sampleAcc = {}          # fractional samples carried over to the next frame
+        self.counters = {}           # the next number each sensor will send
+
+        info = configName(config)
+        if info == '':
+            return
+
+        for s in info[2]:
+            sensor = s['sensor']
+            perFrame = s['rate'] / 100.0
+            self.slots.append([sensor, sampleBytes[sensor] * (math.ceil(perFrame) + 1), perFrame])
+            self.sampleAcc[sensor] = 0.0
+            self.counters[sensor] = 0
+
+    #======================================
+    # the emulator thread: answer commands and send data every 10 ms
+    def run(self):
+
+        nextFrame = time.monotonic()
+        while self.running:
+
+            if self.acquiring:
+                wait = max(0.0, nextFrame - time.monotonic())
+            else:
+                wait = 0.05
+            ready, _, _ = select.select([self.master], [], [], wait)
+
+            if ready:
+                try:
+                    self.commandBuffer += os.read(self.master, 4096)
+                except (BlockingIOError, OSError):
+                    pass
+                wasAcquiring = self.acquiring
+                self.handleCommands()
+                if self.acquiring and not wasAcquiring:
+                    nextFrame = time.monotonic() + 0.010
+
+            # send all of the frames that are due (there can be more than one if we fell behind)
+            while self.acquiring and time.monotonic() >= nextFrame:
+                self.sendFrame()
+                nextFrame += 0.010
+
+    #======================================
+    # send bytes to the computer, throwing away what doesn't fit
+    def send(self, data):
+
+        try:
+            n = os.write(self.master, bytes(data))
+        except BlockingIOError:
+            n = 0
+        except OSError:
+            return
+        self.stats['bytesSent'] += n
+        self.stats['bytesLost'] += len(data) - n
+
+    def sendRecord(self, recType, payload):
+        self.send([0x02, recType, len(payload)] + list(payload) + [0x0A])
+
+    #======================================
+    # find complete command records in the bytes received so far and answer them
+    def handleCommands(self):
+
+        buf = self.commandBuffer
+        while len(buf) >= 4:
+            if buf[0] != 0x02:
+                del buf[0]
+                continue
+
+            n = buf[2] + 4
+            if len(buf) < n:
+                break
+            if buf[n-1] != 0x0A:
+                self.sendRecord(0xBB, [buf[1], 0x09])    # invalid packet EOP
+                del buf[0]
+                continue
+
+            command = buf[1]
+            payload = list(buf[3:n-1])
+            del buf[:n]
+            self.stats['commands'] += 1
+            self.answer(command, payload)
+
+    #======================================
+    # answer one command
+    def answer(self, command, payload):
+
+        ack = [command]
+        r = self.remote
+
+        if command == 0x14:             # getDongleStatus
+            mode = 5 if self.acquiring else 4
+            self.sendRecord(command, [0x01, 0x00, mode, 0x00, 0x00, 0x01])
+        elif command == 0x20:           # startData
+            self.acquiring = True
+            self.frame = 0              # the remote counts frames from here
+            self.sendRecord(0xAA, ack)
+        elif command == 0x21:           # stopData
+            self.acquiring = False
+            self.sendRecord(0xAA, ack)
+        elif command == 0x22:           # setSensorConfig
+            self.sensorConfig = payload[2:]
+            self.sendRecord(0xAA, ack)
+        elif command == 0x23:           # getSensorConfig
+            self.sendRecord(command, [r, len(self.sensorConfig) // 2] + self.sensorConfig)
+        elif command == 0x24:           # setOutputConfig
+            self.outputConfig = payload[2:]
+            self.sendRecord(0xAA, ack)
+        elif command == 0x25:           # getOutputConfig
+            self.sendRecord(command, [r, len(self.outputConfig) // 2] + self.outputConfig)
+        elif command == 0x26:           # setFixedConfig
+            if len(payload) == 2 and configName(payload[1]) != '' and not self.acquiring:
+                self.setConfig(payload[1])
+                self.sendRecord(0xAA, ack)
+            else:
+                self.sendRecord(0xBB, [command, 0x03])   # invalid payload data value
+        elif command == 0x27:           # getFixedConfig
+            self.sendRecord(command, [r, self.config])
+        elif command == 0x28:           # getPacketConfig
+            pc = [r, len(self.slots)]
+            for sensor, nBytes, perFrame in self.slots:
+                pc += [sensor, nBytes]
+            self.sendRecord(command, pc)
+        elif command == 0x29:           # getCalibration
+            sensor = payload[1] if len(payload) > 1 else 0
+            if sensor in calibrationBytes:
+                cal = calibrationBytes[sensor]
+                self.sendRecord(command, [r, sensor, len(cal)] + cal)
+            else:
+                self.sendRecord(0xBB, [command, 0x03])
+        elif command == 0x2A:           # getRemoteStatus
+            self.sendRecord(command, [r, 0x01, 0x00, 0x01, 0x00, 0x0b, 0x80])
+        elif command == 0x2B:           # powerDown
+            self.acquiring = False
+            self.sendRecord(0xAA, ack)
+        else:
+            self.sendRecord(0xBB, [command, 0x01])       # invalid command
+
+    #======================================
+    # send the data record for one frame (unless the RF link is down)
+    def sendFrame(self):
+
+        self.frame += 1
+        self.stats['frames'] += 1
+
+        # the samples are taken whether or not they make it to the computer
+        body = [self.remote, self.frame & 0xFF, self.frame & 0x03, len(self.slots)]
+        for sensor, nBytes, perFrame in self.slots:
+            self.sampleAcc[sensor] += perFrame
+            n = int(self.sampleAcc[sensor])
+            self.sampleAcc[sensor] -= n
+
+            data = self.makeSamples(sensor, n)
+            sensorId = sensor
+            if self.overflowRate > 0 and self.random.random() < self.overflowRate:
+                sensorId |= 0x80
+                self.stats['overflows'] += 1
+            body += [sensorId, len(data)] + data + [0] * (nBytes - len(data))
+        body.append(0xC0)            # RSSI
+
+        # RF drop-outs
+        if self.dropFrames == 0 and self.dropRate > 0 and self.random.random() < self.dropRate:
+            self.dropFrames = self.random.randint(1, 10)
+            self.sendRecord(0x40, [self.remote, 0])      # disconnected
+        if self.dropFrames > 0:
+            self.dropFrames -= 1
+            self.stats['framesDropped'] += 1
+            if self.dropFrames == 0:
+                self.sendRecord(0x40, [self.remote, 1])  # connected again
+            return
+
+        record = [0x02, 0x41, len(body)] + body + [0x0A]
+        if self.corruptRate > 0 and self.random.random() < self.corruptRate:
+            i = self.random.randrange(len(record))
+            record[i] ^= self.random.randrange(1, 256)
+            self.stats['corrupted'] += 1
+
+        self.send(record)
+        self.stats['records'] += 1
+
+    #======================================
+    # returns the bytes for the next n samples from sensor (a counter)
+    def makeSamples(self, sensor, n):
+
+        nBytes = sampleBytes[sensor] * n
+        if sensor == 13:
+            fmt = 'u1'
+        elif sensor == 26:
+            fmt = '>u4'
+        else:
+            fmt = '>u2'
+        nNumbers = nBytes // np.dtype(fmt).itemsize
+
+        start = self.counters[sensor]
+        self.counters[sensor] = start + nNumbers
+        numbers = np.arange(start, start + nNumbers) % (1 << (8 * np.dtype(fmt).itemsize))
+        return list(numbers.astype(fmt).tobytes())
+
+    #======================================
+    # stop the emulator and close the pty
+    def close(self):
+
+        self.running = False
+        self.thread.join()
+        os.close(self.master)
+        os.close(self.slave)
+
+    def __repr__(self):
+        return 'IOLabEmulator(' + self.portName + ', config=' + str(self.config) + ', ' + str(self.stats) + ')'
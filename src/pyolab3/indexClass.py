@@ -0,0 +1,160 @@
+#
+# This file is part of PyOLab. https://github.com/matsselen/pyolab
+# (C) 2017 Mats Selen <mats.selen@gmail.com>
+#
+# SPDX-License-Identifier:    BSD-3-Clause
+# (https://opensource.org/licenses/BSD-3-Clause)
+#
+
+# system stuff
+import numpy as np
+
+# local stuff
+from .storeClass import ColumnStore
+
+"""
+The RecordIndex (G.recordIndex) has one entry for every record received, in
+the order they arrived. Each entry is a row of a numpy structured array
+(recordIndexType) holding
+
+    recType     the record type
+    ordinal     where the record is in its list in G.recDict (G.recDict[recType][ordinal])
+    offset      the stream offset where the record starts (see recordClass.py)
+    time        when the last byte of the record arrived (time.monotonic_ns())
+
+so 21 bytes per record, kept in a ColumnStore. The columns can be looked at
+all at once (index.data()['recType'] etc), and select() uses them to find
+records without looping over them in python, for example
+
+    index.select(G.recType_NACK)                    all of the NACKs
+    index.select(0x41, start=a, stop=b)             data records starting between
+                                                    stream offsets a and b
+    index.select(after=n)                           everything from entry n on
+
+select() returns entry numbers, and records() turns these into the records
+themselves.
+
+For compatibility the index can also be used like the old G.allRecList (in fact
+G.allRecList is the index): len(index) is the number of records and index[i]
+is [recType, ordinal]. G.dataRecList and G.commRecList are RecordIndexViews
+that do the same for just the data records or just the others.
+
+"""
+
+recordIndexType = np.dtype([('recType', 'u1'), ('ordinal', 'u4'), ('offset', 'i8'), ('time', 'i8')])
+
+class RecordIndex(ColumnStore):
+
+    def __init__(self, recDict, size=1024):
+        ColumnStore.__init__(self, recordIndexType, 1, size)
+        self.recDict = recDict                # where the records are (G.recDict)
+
+    #======================================
+    # add entries for new records (all of the arguments are arrays of the same length)
+    def add(self, recTypes, ordinals, offsets, times):
+
+        entries = np.empty(len(recTypes), dtype=recordIndexType)
+        entries['recType'] = recTypes
+        entries['ordinal'] = ordinals
+        entries['offset']  = offsets
+        entries['time']    = times
+        self.append(entries)
+
+    #======================================
+    # Returns the numbers of the entries (still held in memory) for records
+    #   - of type recType (a number or a list of them), if it is given
+    #   - from entry number "after" on, if it is given
+    #   - that start at stream offsets from "start" up to (but not including) "stop"
+    def select(self, recType=None, after=None, start=None, stop=None):
+
+        d = self.data()
+        first = self.base
+        if after is not None and after > first:
+            d = d[after - first:]
+            first = after
+
+        # the offsets only ever go up, so the range can be found by bisection
+        if start is not None:
+            lo = np.searchsorted(d['offset'], start)
+            d = d[lo:]
+            first += lo
+        if stop is not None:
+            d = d[:np.searchsorted(d['offset'], stop)]
+
+        if recType is None:
+            return np.arange(first, first + len(d))
+        return np.flatnonzero(np.isin(d['recType'], recType)) + first
+
+    #======================================
+    # returns the records for entry numbers "entries" (see select())
+    def records(self, entries):
+        return [self.recDict[t][o] for t, o in self.pairs(entries)]
+
+    # [recType, ordinal] for each of the entry numbers in "entries"
+    def pairs(self, entries):
+        entries = np.asarray(entries, dtype=np.int64)
+        if len(entries) > 0 and entries.min() < self.base:
+            return [self[i] for i in entries.tolist()]
+        rows = self.data()[entries - self.base]
+        return [[t, o] for t, o in zip(rows['recType'].tolist(), rows['ordinal'].tolist())]
+
+    #======================================
+    # list-like access that gives [recType, ordinal] like the old G.allRecList
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            rows = ColumnStore.__getitem__(self, i)
+            return [[t, o] for t, o in zip(rows['recType'].tolist(), rows['ordinal'].tolist())]
+        recType, ordinal, offset, time = ColumnStore.__getitem__(self, i)
+        return [recType, ordinal]
+
+    def __iter__(self):
+        return iter(self.tolist())
+
+    def tolist(self):
+        rows = self.data()
+        return [[t, o] for t, o in zip(rows['recType'].tolist(), rows['ordinal'].tolist())]
+
+    def __repr__(self):
+        return 'RecordIndex(n=' + str(len(self)) + ', base=' + str(self.base) + ')'
+
+
+class RecordIndexView(object):
+
+    #======================================
+    # the entries of "index" for records of type recType (like the old G.dataRecList),
+    # or if others is True for all of the other records (like the old G.commRecList)
+    def __init__(self, index, recType, others=False):
+        self.index = index
+        self.recType = recType
+        self.others = others
+        self.rows = ColumnStore('int64', size=64)   # entry numbers (only used if others is True)
+
+    #======================================
+    # tells the view that entries "entries" are for records it includes
+    # (only needed if others is True)
+    def add(self, entries):
+        self.rows.append(entries)
+
+    def __len__(self):
+        if self.others:
+            return len(self.rows)
+        return len(self.index.recDict[self.recType])
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        if self.others:
+            return self.index[self.rows[i]]
+        if i < 0:
+            i += len(self)
+        if i < 0 or i >= len(self):
+            raise IndexError('record ' + str(i) + ' is out of range')
+        return [self.recType, i]
+
+    def __iter__(self):
+        if self.others:
+            return iter(self.index.pairs(self.rows.data()))
+        return iter([[self.recType, i] for i in range(self.index.recDict[self.recType].base, len(self))])
+
+    def __repr__(self):
+        return 'RecordIndexView(n=' + str(len(self)) + ')'
@@ -0,0 +1,59 @@
+#
+# This file is part of PyOLab. https://github.com/matsselen/pyolab
+# (C) 2017 Mats Selen <mats.selen@gmail.com>
+#
+# SPDX-License-Identifier:    BSD-3-Clause
+# (https://opensource.org/licenses/BSD-3-Clause)
+#
+
+"""
+A CommandPort stands in for the serial port in the user's process when pyolab
+runs in multiprocess mode (see processMethods.py), where the port itself belongs
+to the reader process. It has the parts of the pyserial interface that the
+commands in commMethods.py use, so it can be put in G.serialPort and startData(),
+setFixedConfig() etc work as usual: whatever is written to it is put in the
+queue "commands", and the reader process sends it to the dongle.
+
+Nothing can be read from it (the data go to the decoder processes), and the
+answers to commands come back through the decoders.
+
+"""
+
+class CommandPort(object):
+
+    def __init__(self, commands, portName=''):
+        self.commands = commands
+        self.portName = portName
+        self.timeout = None
+        self.is_open = True
+        self.written = 0      # number of bytes sent
+
+    #======================================
+    # pyserial look-alikes
+    def write(self, data):
+        data = bytes(data)
+        self.commands.put(data)
+        self.written += len(data)
+        return len(data)
+
+    def inWaiting(self):
+        return 0
+
+    @property
+    def in_waiting(self):
+        return 0
+
+    def read(self, n=1):
+        return b''
+
+    def readinto(self, b):
+        return 0
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.is_open = False
+
+    def __repr__(self):
+        return 'CommandPort(' + repr(self.portName) + ', written=' + str(self.written) + ')'
@@ -0,0 +1,509 @@
+#
+# This file is part of PyOLab. https://github.com/matsselen/pyolab
+# (C) 2017 Mats Selen <mats.selen@gmail.com>
+#
+# SPDX-License-Identifier:    BSD-3-Clause
+# (https://opensource.org/licenses/BSD-3-Clause)
+#
+
+# system stuff
+import os
+import time
+import queue
+import secrets
+import multiprocessing
+from threading import Thread
+from concurrent.futures import wait
+
+# local stuff
+from .pyolabGlobals import G, Globals, useGlobals, inSession
+from .sharedClass import SharedRing
+from .processClass import CommandPort
+from .clientClass import IOLabClient
+from .captureClass import CaptureWriter
+from .commMethods import openIOLabPort, getIOLabPortName, stopData, powerDown
+from .dataMethods import findRecords, findLastConfig, decodeDataPayloads, remoteStream
+from .retentionMethods import applyRetention
+from .publishMethods import publishData, stopPublishing
+from .statsMethods import updateStats
+from .calibrationMethods import loadCalibrationCache, setupRemoteCalibration
+from .setupMethods import setupGlobalVariables, userAnalysis
+
+"""
+These methods run pyolab in multiprocess mode, where the work that startItUp()
+does in threads is split between processes, so that nothing the user's code
+does (or the GIL) can hold up the reading of the serial port:
+
+    the reader process    reads the serial port into a SharedRing (see sharedClass.py)
+                          as fast as the data come, and sends the commands it is given.
+                          It never waits for anybody else.
+    decoder processes     copy the raw bytes from the ring, sort them into records and
+                          decode them just like analyzeData() does, and publish the
+                          samples in shared memory (see publishMethods.py)
+    the user's process    attaches to what is published read-only, with an IOLabClient
+                          for each remote (see clientClass.py), so that the columns are
+                          what it sees in G.uncalDataDict, G.timeDataDict and G.remotes[n],
+                          and calls analLoop() whenever new samples have been published
+
+It is used like startItUp() and shutItDown():
+
+    G.logData = False
+    startProcesses()
+    setFixedConfig(G.serialPort, 1, 1)
+    startData(G.serialPort)
+    ...
+    stopProcesses()
+
+or with an IOLabProcessSession (see sessionClass.py). With decoders=2 each remote
+gets a decoder process of its own (both sort the whole stream into records, but
+each only decodes the data records of its remote, see G.decodeRemotes).
+
+The first decoder also sends the records that aren't data records to the user's
+process, so G.recDict, the answers to commands, the configuration and the calibration
+constants are there as usual, and G.calDataDict calibrates the shared samples (each
+decoder also says which samples of its remotes were taken in which configuration).
+G.serialPort is a CommandPort (see processClass.py), and commands wait in the reader
+process until its next read returns (at most G.readTimeout). The data are published 
+under G.publishName (or a name made up for the session if that is None), so other 
+programs can use them too.
+
+Some things are different:
+  - the user's process can only get at the last G.sharedSamples samples of each
+    sensor (len() still counts all of them), so G.retention doesn't apply there
+  - the decoders only keep what they still need (see decoderRetention)
+  - G.dumpData writes the binary capture file (from the first decoder), never hex
+  - the processes are started with the 'spawn' method, so the user's main program
+    has to be importable (start things inside "if __name__ == '__main__':"), and
+    sensor decoders and calibrators that the user sets up only reach the decoders if
+    this is done when the main program is imported
+
+"""
+
+# the global variables that the reader and decoder processes get from the user's process
+processSettings = ['logData', 'readTimeout', 'readMinChunk', 'analMaxWait', 'batchDecode',
+                   'batchMinRecords', 'framePeriod', 'remoteNumbers', 'sharedSamples',
+                   'dumpData', 'captureFileName']
+
+# what the decoder processes keep (everything they decode is published, or
+# handed to the user's process, before it is thrown away)
+decoderRetention = {'records': ('samples', 100), 'uncal': ('samples', 0)}
+
+#===============================================
+# Starts pyolab in multiprocess mode (like startItUp() does with threads) using
+# the serial port called portName (or the first dongle found) and "decoders"
+# decoder processes. Returns True if everything started.
+#
+def startProcesses(portName=None, decoders=1):
+
+    if G.logData:
+        G.logFile = open(G.logFileName,'w') # file opened in pwd
+
+    if portName is None:
+        portName = getIOLabPortName()
+    if portName == '':
+        print("Can't open the comm port - is there a dongle plugged in?")
+        if G.logData:
+            G.logFile.write("\nCan't open the comm port - is there a dongle plugged in?")
+        return False
+
+    setupGlobalVariables()
+
+    # everything this session shares is named after it
+    name = 'iolab' + secrets.token_hex(4)
+    context = multiprocessing.get_context('spawn')
+    procs = {
+        'name'         : name,
+        'ring'         : SharedRing(name + 'r', G.sharedBufferSize, create=True),
+        'commands'     : context.Queue(),   # bytes for the reader process to send
+        'messages'     : context.Queue(),   # from the others to the user's process
+        'stopReader'   : context.Event(),
+        'stopDecoders' : context.Event(),
+        'publishName'  : name if G.publishName is None else G.publishName,
+        'clients'      : {},                # IOLabClients keyed by remote (see attachPublished())
+        'decoderStats' : {}                 # sent by each decoder when it is done
+        }
+    G.processes = procs
+
+    settings = {s: getattr(G, s) for s in processSettings}
+    procs['reader'] = context.Process(target=readerProcess, name='pyolab reader', daemon=True,
+                                      args=(portName, procs['ring'].name, procs['commands'],
+                                            procs['messages'], procs['stopReader'], settings))
+    procs['decoders'] = []
+    for i in range(decoders):
+        decoderSettings = dict(settings, logFileName=processFileName(G.logFileName, i),
+                               dumpData=G.dumpData and i == 0, publishName=procs['publishName'],
+                               decodeRemotes=None if decoders == 1 else G.remoteNumbers[i::decoders])
+        procs['decoders'].append(context.Process(target=decoderProcess, name='pyolab decoder ' + str(i),
+                                                 daemon=True, args=(i, name, procs['messages'],
+                                                                    procs['stopDecoders'], decoderSettings)))
+
+    G.analThread = None
+    for process in [procs['reader']] + procs['decoders']:
+        process.start()
+    if not waitForProcesses():
+        stopProcesses()
+        return False
+
+    # the commands go to the reader process, and their answers come back through
+    # the thread that looks after the user's analysis
+    G.serialPort = CommandPort(procs['commands'], portName)
+    G.analThread = Thread(target=inSession(sharedAnalysisThread))
+    G.analThread.start()
+
+    # set up the calibration constants for the remote, using the ones saved
+    # last time if there are any (see calibrationMethods.py)
+    if G.calibrationFile is not None:
+        loadCalibrationCache()
+        setupRemoteCalibration(G.serialPort)
+
+    # call the user code that is executed at the beginning of a job
+    userAnalysis().analStart()
+
+    return True
+
+#===============================================
+# Stops the remote and then the processes (like shutItDown() does with threads).
+# The data the user's process can see stay there until it lets go of them.
+#
+def stopProcesses():
+
+    procs = G.processes
+    if G.logData:
+        G.logFile.write("\nsignaling exit")
+
+    # stop the remote (and wait for the answers, while they can still get back to us)
+    if G.analThread is not None and G.analThread.is_alive():
+        if G.logData:
+            G.logFile.write("\npower down remote 1")
+        wait([stopData(G.serialPort), powerDown(G.serialPort,1)])
+
+    # the reader goes first, so the decoders get everything it read
+    procs['stopReader'].set()
+    procs['reader'].join()
+    procs['stopDecoders'].set()
+    for process in procs['decoders']:
+        process.join()
+
+    G.running = False
+    if G.analThread is not None:
+        G.analThread.join()
+    if G.logData:
+        G.logFile.write("\nall processes finished")
+        G.logFile.write("\nread statistics " + str(G.readStats))
+        G.logFile.write("\ndecoder statistics " + str(procs['decoderStats']))
+
+    procs['ring'].close()
+    procs['ring'].unlink()
+
+    # the decoders leave the names of what they published to us (so we could still find
+    # it while they were finishing), the data stay here until we let go of them
+    for remote in G.remoteNumbers:
+        client = procs['clients'].get(remote)
+        if client is None:
+            client = attachClient(remote)
+        if client is not None:
+            client.unlink()
+
+#======================================
+# Waits until the reader and decoders are ready to go. Returns False if
+# one of them failed (or died).
+#
+def waitForProcesses():
+
+    procs = G.processes
+    processes = [procs['reader']] + procs['decoders']
+    waiting = len(processes)
+    while waiting > 0:
+        try:
+            message = procs['messages'].get(True, 1.0)
+        except queue.Empty:
+            if all([process.is_alive() for process in processes]):
+                continue
+            message = ('failed', 'process', 'exited')
+
+        if message[0] == 'ready':
+            waiting -= 1
+        elif message[0] == 'failed':
+            print("The " + message[1] + " process failed: " + message[2])
+            if G.logData:
+                G.logFile.write("\nThe " + message[1] + " process failed: " + message[2])
+            return False
+
+    return True
+
+# the log file of decoder i (log.txt -> log_decoder0.txt)
+def processFileName(fileName, i):
+    root, ext = os.path.splitext(fileName)
+    return root + '_decoder' + str(i) + ext
+
+
+#=========================================
+# This is the reader process. It reads the serial port called portName into the
+# SharedRing called ringName until "stop" (an Event) is set, sending anything
+# that shows up in the queue "commands" to the dongle between reads.
+#
+def readerProcess(portName, ringName, commands, messages, stop, settings):
+
+    useGlobals(Globals(**settings))
+    try:
+        ring = SharedRing(ringName)
+        port = openIOLabPort(portName)
+    except Exception as e:
+        messages.put(('failed', 'reader', repr(e)))
+        return
+
+    # a blocking read returns after at most this long, which is also how
+    # long a command can wait to be sent
+    port.timeout = G.readTimeout
+    messages.put(('ready', 'reader'))
+
+    while not stop.is_set():
+        sendCommands(port, commands)
+        nwait = port.inWaiting()
+        ring.readFrom(port, max(nwait, G.readMinChunk), nwait)
+
+    sendCommands(port, commands)
+    port.close()
+    ring.close()
+
+# writes whatever is in the queue "commands" to the serial port
+def sendCommands(port, commands):
+
+    while True:
+        try:
+            port.write(commands.get_nowait())
+        except queue.Empty:
+            return
+
+
+#=========================================
+# This is decoder process number "index". It decodes the data in the SharedRing of
+# the session called "name" and publishes the samples (see publishMethods.py) until
+# "stop" is set, telling the user's process what it is doing through the queue "messages".
+#
+def decoderProcess(index, name, messages, stop, settings):
+
+    useGlobals(Globals(**settings))
+    G.retention = dict(decoderRetention)
+    if G.logData:
+        G.logFile = open(G.logFileName,'w') # file opened in pwd
+
+    try:
+        ring = SharedRing(name + 'r')
+    except Exception as e:
+        messages.put(('failed', 'decoder', repr(e)))
+        return
+
+    setupGlobalVariables()
+    if G.dumpData:
+        G.captureWriter = CaptureWriter(G.captureFileName)
+        G.dataBuffer.addListener(G.captureWriter.add)
+
+    # what this decoder has done so far
+    decoder = {
+        'index'     : index,
+        'name'      : name,
+        'messages'  : messages,
+        'seq'       : 0,     # the last chunk of the ring copied
+        'pos'       : 0,     # the stream offset (in the ring) of the next byte to copy
+        'lostBytes' : 0,     # bytes written over in the ring before they were copied
+        'forwarded' : 0,     # the number of records in G.commRecList sent on
+        'configs'   : {}     # the number of configuration changes sent on for each remote
+        }
+    messages.put(('ready', 'decoder'))
+
+    # once told to stop, keep going until everything the reader read is done
+    while True:
+        stopping = stop.is_set()
+        if copyFromRing(ring, decoder) > 0:
+            decodeShared(decoder)
+        elif stopping:
+            break
+        else:
+            time.sleep(G.analMaxWait)
+
+    stopPublishing(unlink=False)
+    messages.put(('stats', index, {'bytes': decoder['pos'], 'lostBytes': decoder['lostBytes'],
+                                   'records': len(G.recordIndex)}))
+    if G.captureWriter is not None:
+        G.dataBuffer.removeListener(G.captureWriter.add)
+        G.captureWriter.close()
+    if G.logData:
+        G.logFile.write("\nExiting decoder " + str(index))
+        G.logFile.close()
+    ring.close()
+
+#======================================
+# Copies the chunks of "ring" that this decoder hasn't seen yet to G.dataBuffer
+# (with the times they arrived). Returns the number of bytes copied.
+#
+def copyFromRing(ring, decoder):
+
+    nNew = 0
+    for seq, offset, length, arrived in ring.chunksSince(decoder['seq']):
+        start, data = ring.read(decoder['pos'], offset + length)
+        if start > decoder['pos']:
+            decoder['lostBytes'] += start - decoder['pos']
+            if G.logData:
+                G.logFile.write("\nlost " + str(start - decoder['pos']) + " bytes (the decoder fell behind the reader)")
+
+        if len(data) > 0:
+            G.dataBuffer.write(data, arrived)
+        decoder['pos'] = start + len(data)
+        decoder['seq'] = seq
+        nNew += len(data)
+
+    return nNew
+
+#======================================
+# What analyzeData() does, except that the results go to the user's process
+#
+def decodeShared(decoder):
+
+    findRecords(G.dataBuffer.writePos)
+    findLastConfig()
+    decodeDataPayloads()
+
+    if decoder['index'] == 0:
+        forwardRecords(decoder)
+    forwardConfigStarts(decoder)
+    if publishData():
+        decoder['messages'].put(('data', decoder['index']))
+
+    applyRetention()
+
+#======================================
+# Sends the records that aren't data records (the answers to commands,
+# configuration, etc) to the user's process
+#
+def forwardRecords(decoder):
+
+    records = G.commRecList
+    if len(records) > decoder['forwarded']:
+        data = [bytes(G.recDict[recType][i]) for recType, i in records[decoder['forwarded']:len(records)]]
+        decoder['messages'].put(('records', b''.join(data)))
+        decoder['forwarded'] = len(records)
+
+#======================================
+# Sends where the samples taken in each fixed configuration start (remote.configStarts)
+# to the user's process, which calibrates the samples but doesn't decode them.
+# This goes before the samples are published.
+#
+def forwardConfigStarts(decoder):
+
+    for remote in G.remotes.values():
+        nChanges = max([len(starts) for starts in remote.configStarts.values()] + [0])
+        if nChanges > decoder['configs'].get(remote.remote, 0):
+            starts = dict([(sensor, list(starts)) for sensor, starts in remote.configStarts.items()])
+            decoder['messages'].put(('configStarts', remote.remote, starts))
+            decoder['configs'][remote.remote] = nChanges
+
+
+#=========================================
+# This runs in a thread of the user's process (G.analThread). It takes care of
+# the messages from the other processes, and calls the user's analLoop()
+# whenever new data have shown up.
+#
+def sharedAnalysisThread():
+
+    if G.logData:
+        G.logFile.write("\nIn sharedAnalysisThread")
+
+    # keep looping as long as G.running is True
+    while G.running:
+        if receiveMessages(G.readTimeout):
+            userAnalysis().analLoop()
+
+    # whatever came in while the processes were finishing
+    if receiveMessages(0):
+        userAnalysis().analLoop()
+
+    if G.logData:
+        G.logFile.write("\nExiting sharedAnalysisThread")
+
+    # user code that is called at the end
+    userAnalysis().analEnd()
+
+#======================================
+# Waits up to "timeout" seconds for messages from the other processes, and deals
+# with all of the ones that are there. Returns True if any of them brought new data.
+#
+def receiveMessages(timeout):
+
+    messages = G.processes['messages']
+    newData = False
+    try:
+        message = messages.get(True, timeout)
+        while True:
+            newData = receiveMessage(message) or newData
+            message = messages.get_nowait()
+    except queue.Empty:
+        pass
+
+    attachPublished()
+    G.readStats.update(G.processes['ring'].readStats())
+    if newData:
+        updateStats()
+    return newData
+
+#======================================
+# Deals with one message. Returns True if it brought new data.
+#
+def receiveMessage(message):
+
+    what = message[0]
+    if what == 'data':
+        return True
+
+    if what == 'records':
+        # sort them into records the usual way (this also answers commands etc)
+        G.dataBuffer.write(message[1])
+        findRecords(G.dataBuffer.writePos)
+        findLastConfig()
+        return True
+
+    if what == 'configStarts':
+        remoteStream(message[1]).configStarts = message[2]
+
+    if what == 'stats':
+        G.processes['decoderStats'][message[1]] = message[2]
+
+    return False
+
+#======================================
+# Makes the columns the decoders have published the stores of G.remotes, 
+# and keeps the status of each remote (lost frames etc) up to date
+#
+def attachPublished():
+
+    clients = G.processes['clients']
+    for stream in list(G.remotes.values()):
+        client = clients.get(stream.remote)
+        if client is None:
+            client = attachClient(stream.remote)
+            if client is None:
+                continue            # nothing published for it yet
+            clients[stream.remote] = client
+            sensors = list(client.uncalDataDict) + list(client.timeDataDict) + client.update()
+        else:
+            sensors = client.update()
+
+        for sensor in sensors:
+            if sensor in client.uncalDataDict:
+                stream.uncalDataDict[sensor] = client.uncalDataDict[sensor]
+            if sensor in client.timeDataDict:
+                stream.timeDataDict[sensor] = client.timeDataDict[sensor]
+
+        status = client.status()
+        stream.lostFrames = status['lostFrames']
+        stream.lastFrameCount = status['lastFrameCount']
+        stream.lastFrameTime = status['lastFrameTime']
+
+# returns an IOLabClient for what is published for remote number "remote" 
+# (or None if nothing is). The processes share a resource tracker, so it tracks.
+def attachClient(remote):
+
+    try:
+        return IOLabClient(G.processes['publishName'], remote, track=True)
+    except FileNotFoundError:
+        return None
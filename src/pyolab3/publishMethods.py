@@ -0,0 +1,104 @@
+#
+# This file is part of PyOLab. https://github.com/matsselen/pyolab
+# (C) 2017 Mats Selen <mats.selen@gmail.com>
+#
+# SPDX-License-Identifier:    BSD-3-Clause
+# (https://opensource.org/licenses/BSD-3-Clause)
+#
+
+# local stuff
+from .pyolabGlobals import G
+from .sharedClass import SharedColumn, SharedCatalog
+
+"""
+These methods publish the decoded data in shared memory, so that other programs
+on the same computer (dashboards, loggers, other analysis scripts) can use the
+data from the same dongle while it is taking data. Nothing is published unless
+G.publishName is set, for example
+
+    G.publishName = 'iolab'
+    startItUp()
+
+after which every remote that sends data gets a SharedCatalog called iolab_<remote>
+listing its columns, and each sensor gets two SharedColumns (see sharedClass.py):
+
+    iolab_1_u12     the uncalibrated samples of sensor 12 of remote 1 (uncalDataDict)
+    iolab_1_t12     the times they were taken (timeDataDict)
+
+The samples are published by analyzeData() as soon as they have been decoded (the
+times first, so no sample shows up before its time does), and the last G.sharedSamples
+of each sensor are kept. An IOLabClient (see clientClass.py) reads them:
+
+    client = IOLabClient('iolab')
+    first, samples, times = client.since(12, n)
+
+When shutItDown() is called the names go away, but programs that are already
+using the data can keep reading what is there.
+
+"""
+
+#======================================
+# Publishes the samples decoded since the last time (of the remotes in G.decodeRemotes,
+# or all of them). Returns True if there was anything new.
+#
+def publishData():
+
+    if G.publishName is None:
+        return False
+
+    published = False
+    for remote in G.remotes.values():
+        if G.decodeRemotes is not None and remote.remote not in G.decodeRemotes:
+            continue
+
+        publisher = G.publishers.get(remote.remote)
+        for kind, stores in (('time', remote.timeDataDict), ('uncal', remote.uncalDataDict)):
+            for sensor, store in stores.items():
+                if len(store) == 0:
+                    continue
+                if publisher is None:
+                    publisher = startPublishing(remote.remote)
+
+                column = publisher['columns'].get((kind, sensor))
+                nDone = 0 if column is None else len(column)
+                if len(store) > nDone:
+                    if column is None:
+                        nDone = store.base
+                        column = SharedColumn(publisher['catalog'].columnName(kind, sensor), store.dtype,
+                                              store.width, G.sharedSamples, nDone, create=True)
+                        publisher['columns'][(kind, sensor)] = column
+                        publisher['catalog'].add(kind, sensor)
+                    column.append(store.since(nDone), remote.lastFixedConfig)
+                    published = True
+
+        if publisher is not None:
+            publisher['catalog'].setStatus(remote.lastFixedConfig, remote.lostFrames,
+                                           remote.lastFrameCount, remote.lastFrameTime)
+
+    return published
+
+#======================================
+# Sets up the catalog of remote number "remote" (see G.publishers)
+#
+def startPublishing(remote):
+
+    catalog = SharedCatalog(G.publishName + '_' + str(remote), create=True)
+    G.publishers[remote] = {'catalog': catalog, 'columns': {}}
+    if G.logData:
+        G.logFile.write("\npublishing the data of remote " + str(remote) + " as " + catalog.name)
+    return G.publishers[remote]
+
+#======================================
+# Stops publishing. If unlink is True the names go away (programs that are
+# using the data can keep doing so), otherwise whoever reads them has to
+# unlink them (see stopProcesses() in processMethods.py).
+#
+def stopPublishing(unlink=True):
+
+    for publisher in G.publishers.values():
+        publisher['catalog'].finish()
+        for column in [publisher['catalog']] + list(publisher['columns'].values()):
+            if unlink:
+                column.unlink()
+            column.close()
+    G.publishers = {}
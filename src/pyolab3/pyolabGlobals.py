@@ -6,43 +6,151 @@
 # (https://opensource.org/licenses/BSD-3-Clause)
 #
 
+# system stuff
+import copy
+from threading import Lock, local
+
+# local stuff
+from .bufferClass import RingBuffer
+from .remoteClass import RemoteStream
+
 """
 Global variables used by the pyolab library.
 These expose data acquired by the system, as well as control 
 parameters for the system and for this analysis code. 
 
+Each IOLab dongle in use has its own set of these (an IOLabSession, see 
+sessionClass.py, is one), and G is whichever set belongs to the code using it:
+the threads that read and analyze the data of a session (and the user code they
+call) see that session's variables, as does code in a "with session:" block.
+Everywhere else G is the default set (defaultGlobals), which is what startItUp()
+and shutItDown() use when there is only one dongle, so for that G works just like
+it always has:
+
+    G.logData = False
+    startItUp()
+    ...
+    G.uncalDataDict[1].since(n)
+
 """
 
-class G(object):
+#=======================================================================
+# A global variable that is really the one of remote 1 (see remoteClass.py)
+def remoteOne(name):
+    return property(lambda self: getattr(self.remotes[1], name),
+                    lambda self, value: setattr(self.remotes[1], name, value))
+
+
+class Globals(object):
 
     # control varialbles
-    sleepTimeRead = 0.025 # time to sleep each read loop
-    sleepTimeAnal = 0.110 # time to sleep each analysis loop
+    sleepTimeRead = 0.025 # time to sleep each read loop (when readMode is 'poll')
+    analMinBytes  = 256   # the analysis thread wakes up when there are this many new bytes...
+    analMaxWait   = 0.005 # ...or this long (seconds) after the first new byte arrived
     sleepCommand  = 0.100 # time to sleep after a command is sent
+    commandTimeout = 0.5  # how long to wait for the response to a command (see issueCommand())
+    commandRetries = 1    # how many times to re-send a command that wasn't answered
+    readMode      = 'block' # 'block': wait on the serial port for data, 'poll': check every sleepTimeRead
+    readTimeout   = 0.050 # longest a blocking read waits before giving up (seconds)
+    readMinChunk  = 1     # number of bytes a blocking read waits for (unless it times out)
     dumpData    = False  # if True the base analysis code dumps data to a file
+    dumpFormat  = 'binary' # 'binary': capture file (see captureMethods.py), 'hex': the old text format
+    captureFileName = 'data.iolab' # name of the capture file (the hex file is always 'data.txt')
     logData     = True   # if True code writes info/error messages to a file
     running     = True   # used to signal treads to quit
-    configIsSet = False  # is it?
+    configIsSet = remoteOne('configIsSet') # is it?
 
     # ports & files & threads
     serialPort = None    # pointer to the virtual com port
     outputFile = None    # file handle for output
+    captureWriter = None # writes the capture file (see captureClass.py)
     logFile    = None    # file handle for message logging file
     readThread = None    # pointer to data reading thread
     analThread = None    # pointer to data analysis thread
+    analysis   = None    # the user's AnalysisClass for this set of globals (None to use AnalysisClass.handle)
+    logFileName = 'log.txt'  # name of the message logging file
+    hexFileName = 'data.txt' # name of the hex output file (see dumpFormat)
+
+    # publishing the decoded data in shared memory (see publishMethods.py)
+    publishName = None   # the name the data are published under (None to not publish them)
+    publishers  = {}     # what is being published for each remote - don't mess with this
+    sharedSamples = 0x40000 # number of samples of each sensor kept in shared memory
+
+    # running statistics of the sensors (see statsMethods.py)
+    runningStats = False  # keep them (in G.statsDict)
+    statsWindows = []     # and for the last this many seconds (a list, for example [1.0, 10.0])
+    statsBuckets = 20     # the windows move in steps of 1/statsBuckets of their length
+
+    # serving the decoded data over a Unix-domain socket (see serverMethods.py)
+    serverPath  = None   # the path of the socket (None to not serve the data)
+    server      = None   # the IOLabServer (see serverClass.py) - don't mess with this
+    serverQueueLength = 64     # batches of each sensor a subscriber can fall behind by before serverPolicy kicks in
+    serverPolicy      = 'drop' # then 'drop' the oldest batch, or 'coalesce' the new samples into a waiting one
+    serverMaxSamples  = 0x10000 # the most samples a coalesced batch holds
+
+    # multiprocess mode (see processMethods.py)
+    processes   = None   # the reader and decoder processes and what they share (a dictionary)
+    sharedBufferSize = 0x100000 # bytes of raw data the reader process can get ahead of the decoders
+
+    # calibration constants kept for each remote (see calibrationMethods.py)
+    calibrationFile  = None  # where they are saved, for example 'calibration.json' (None to not use a file)
+    calibrationCache = {}  # what is in the file, keyed by remote ID
+    remoteID   = None    # ID of the remote being used (once it is known)
+    calibrators = {}     # this session's copies of the SensorCalibrators, keyed by sensor
+
+    # commands waiting for a response (see issueCommand() in commMethods.py)
+    pendingCommands = {} # lists of pending commands keyed by (command number, remote)
+    lateAnswers = []     # [key, expiry time] of answers still to come to commands that were sent again
+    commandLock = None   # protects pendingCommands and writes to the serial port (a Lock)
 
     # raw data retrieval and analysis - don't mess with these
-    dataList = []        # data received from the serial port
-    dataPointer = 0      # pointer to the next raw byte to be analyzed
-    nextData    = 0      # used by findRecords()
+    bufferSize  = 0x10000   # initial size of the raw data buffer (bytes)
+    dataBuffer  = None   # data received from the serial port (a RingBuffer, see bufferClass.py)
+    dataPointer = 0      # stream offset of the next raw byte to be analyzed
+    nextData    = 0      # stream offset used by findRecords()
     nextRecord  = 0      # used by decodeDataPayloads()
-    lastFrame   = 0      # used in dataMethods for debugging
-    lastRF      = 0      # used in dataMethods for debugging
+    batchDecode = True   # decode runs of regular data records all at once (see decodeDataPayloads())
+    batchMinRecords = 16 # ...but only when at least this many new records are waiting
+    lastFrame   = remoteOne('lastFrame') # frame byte of the last data record decoded
+    lastRF      = remoteOne('lastRF')    # used in dataMethods for debugging
+
+    # sample times (see timingMethods.py)
+    framePeriod = 0.010  # the remote sends one data record every frame (seconds)
+    lastFrameCount = remoteOne('lastFrameCount') # frame count (not wrapped) of the last data record decoded
+    lastFrameTime  = remoteOne('lastFrameTime')  # when that record arrived (time.monotonic_ns())
+    lostFrames  = remoteOne('lostFrames')        # number of frames that never arrived
+
+    # how much old data to keep (see retentionMethods.py)
+    retention    = {}    # policies keyed by store, for example {'uncal': ('seconds', 600)}
+    retentionDir = 'retention' # where stores with a 'spill' policy write old data
+    retentionMarks = {}  # used by the 'seconds' policy - don't mess with this
+
+    # statistics kept by readData() (see recordRead() in setupMethods.py)
+    readStats = {
+        'reads'      : 0,   # number of reads from the serial port
+        'emptyReads' : 0,   # reads that timed out without getting anything
+        'bytes'      : 0,   # total number of bytes read
+        'largestRead': 0,   # the most bytes gotten in a single read
+        'readSizes'  : {},  # histogram of read sizes: key k counts reads of k/2 to k-1 bytes
+        'maxWaiting' : 0,   # high-water mark of bytes waiting in the serial driver
+        'maxUnread'  : 0    # high-water mark of unanalyzed bytes in G.dataBuffer
+    }
 
     # used by data analysis
-    lastFixedConfig  = 0        # the last fixed config record received
-    lastPacketConfig = []       # the last packet config record received
-    lastSensorBytes  = {}       # dictionary of maximum byte-counts keyed by sensor
+    lastFixedConfig  = remoteOne('lastFixedConfig')  # the last fixed config record received
+    lastPacketConfig = remoteOne('lastPacketConfig') # the last packet config record received
+    lastSensorBytes  = remoteOne('lastSensorBytes')  # dictionary of maximum byte-counts keyed by sensor
+
+    # Each remote has its own configuration, decoding state and data (a RemoteStream, see 
+    # remoteClass.py). The variables above that say "remoteOne" are the ones of remote 1,
+    # as are uncalDataDict, timeDataDict and calDataDict below. 
+    remotes = {}              # RemoteStreams keyed by remote number
+    remoteNumbers = [1, 2]    # the remotes a dongle can have (data records that say they are 
+                              # from anything else are taken to be from remote 1)
+    decodeRemotes = None      # the remotes whose data records are decoded (None for all of them)
+    nextFixedConfig  = 0      # the next getFixedConfig record findLastConfig() looks at
+    nextPacketConfig = 0      # and the next getPacketConfig record
+    nextACK          = 0      # and the next ACK record
 
     
     #  Here is a description of the various commands and record types.
@@ -118,6 +226,10 @@ class G(object):
     # this will a list of the record types that findRecords() will look for
     recTypeList = []
 
+    # as initialized in setupGlobalVariables(), called by startItUp(), 
+    # this will be a 256 entry lookup table that is True for the record types in recTypeList
+    recTypeLUT = None
+
     #
     # dictionary of supported commands (so far at least)
     cmdTypeDict = {
@@ -144,36 +256,139 @@ class G(object):
     # The following dictionaries are basically the key outputs of the system, and provide
     # various ways for the user to extract these data.
 
+    recordBytes = None
+    # The bytes of all of the records received, numbered by their position in the stream of 
+    # data from the serial port (a ColumnStore of bytes, see storeClass.py & recordClass.py)
+
     recDict = {}  
     # Dictionary that stores received records, keyed by record type as listed above
     # (for example, asynchronous data records from the remote have type 0x41 =  65)
-    # Each record is stored as a list, starting with SOP = 0x2 and ending with EOP = 0xa.
+    # Each record is a Record (see recordClass.py) that can be used like a list of its bytes, 
+    # starting with SOP = 0x2 and ending with EOP = 0xa.
     # See Documentation/IOLab_SensorData_Summary.pdf for a summary of engineering docs on this.
     # See Documentation/record_example_1.pdf for some examples.
     # Find more detailed documentation at Documentation/IOLab_usb_interface_specs.pdf
     # and Documentation/IOLab_data_specs.pdf
+    # The lists are RecordLists (see recordClass.py), so that old records can be thrown away 
+    # without changing the index of the others (see retentionMethods.py)
+
+    recordIndex = None
+    # One entry per record received, in order, holding its type, index in recDict, stream 
+    # offset and arrival time in numpy arrays that can be searched quickly (see indexClass.py)
 
     allRecList = []
     # list of all records received in order. Each entry is a list [recType, index], 
-    # so that the record can be found at recDict[recType][index] 
+    # so that the record can be found at recDict[recType][index] (this is recordIndex)
 
     commRecList = []
     # list of all command records received in order. Each entry is a list [recType, index], 
-    # so that the record can be found at recDict[recType][index] 
+    # so that the record can be found at recDict[recType][index] (a view of recordIndex)
 
     dataRecList = []
     # list of all data records received in order. Each entry is a list [recType, index], 
-    # so that the record can be found at recDict[recType][index] 
+    # so that the record can be found at recDict[recType][index] (a view of recordIndex)
 
-    uncalDataDict = {}
+    uncalDataDict = remoteOne('uncalDataDict')
     # Dictionary that stores uncalibrated data from sensors, keyed by sensor number. 
-    # Each key returns a list of numbers, or a list of lists if data for a sensor involves
-    # more than a single number, such as the accelerometer for example, which returns 
-    # values for all 3 axes. (If you want to know details have a look at the Indesign documents 
+    # Each key returns a ColumnStore (see storeClass.py) that can be used like a list of numbers, 
+    # or a list of lists if data for a sensor involves more than a single number, such as the 
+    # accelerometer for example, which returns values for all 3 axes. Use .data() or .since(n)
+    # to get the samples as a numpy array (with one row per sample) without copying them.
+    # (If you want to know details have a look at the Indesign documents 
     # See Documentation/record_example_2.pdf for some examples.
     # Find detailed documentation at Documentation/IOLab_data_specs.pdf
 
+    timeDataDict = remoteOne('timeDataDict')
+    # Dictionary that stores the time (in seconds since the first frame) when each sample in 
+    # uncalDataDict was taken, keyed by sensor number. Each key returns a ColumnStore of float64 
+    # with the same sample numbers as the one in uncalDataDict (see timingMethods.py).
+
+    calDataDict = remoteOne('calDataDict')
+    # Dictionary that stores calibrated data from sensors (in physical units), keyed by sensor 
+    # number. Each key returns a CalibratedStore (see calibratorClass.py) that is used the same 
+    # way as the stores in uncalDataDict, with the same sample numbers. Samples are calibrated 
+    # the first time they are looked at. See calibrationMethods.py for the units and constants.
+
+    statsDict = remoteOne('statsDict')
+    # Dictionary of the running statistics (count, mean, var, std, rms, min and max of each axis) 
+    # of the samples in uncalDataDict, keyed by sensor number, when G.runningStats is True. Each 
+    # key returns a SensorStats (see statsClass.py), and looking at it costs nothing.
+
+    # (uncalDataDict, timeDataDict and calDataDict hold the data of remote 1. The data of 
+    # remote 2, if there is one, is in G.remotes[2].uncalDataDict etc, see remoteClass.py)
+
+    #=======================================================================
+    # Every set of globals gets its own copies of the dictionaries, lists, buffer 
+    # and lock above, and any of the control variables can be changed, for example
+    #   Globals(logData=False, readMode='poll')
+    def __init__(self, **settings):
+
+        for name, value in vars(Globals).items():
+            if isinstance(value, (dict, list)):
+                setattr(self, name, copy.deepcopy(value))
+        self.commandLock = Lock()
+        self.remotes = {1: RemoteStream(1)}
+
+        for name, value in settings.items():
+            if not hasattr(Globals, name):
+                raise AttributeError("there is no global variable called " + name)
+            setattr(self, name, value)
+
+        self.dataBuffer = RingBuffer(self.bufferSize)
+
+
+#=======================================================================
+# the globals used when no session is in use (the same as the old G class)
+defaultGlobals = Globals()
+
+# the set of globals each thread is using
+class CurrentGlobals(local):
+    globals = defaultGlobals
+
+current = CurrentGlobals()
+
+#======================================
+# Makes "session" (a Globals or an IOLabSession, or None for defaultGlobals) the 
+# set of globals this thread uses, and returns the one it was using before
+def useGlobals(session):
+
+    before = current.globals
+    current.globals = defaultGlobals if session is None else session
+    return before
+
+#======================================
+# Returns the set of globals this thread is using. Every G.name looks this up
+# (several hundred ns), so code that runs for every read or record gets it once
+#   g = currentGlobals()
+# and uses g.name from then on (see findRecords() in dataMethods.py).
+def currentGlobals():
+    return current.globals
+
+#======================================
+# Returns a version of "function" that uses the globals of the thread calling
+# inSession() rather than those of the thread it ends up being run in
+# (for the targets of threads and timers)
+def inSession(function):
+
+    session = current.globals
+    def run(*args, **kwargs):
+        current.globals = session
+        return function(*args, **kwargs)
+    return run
+
+
+class SessionGlobals(object):
+    __slots__ = ()
 
+    # G.name is the variable "name" of whatever globals this thread is using
+    # (every lookup is passed on, which is quicker than only passing on the failed ones)
+    def __getattribute__(self, name):
+        return getattr(current.globals, name)
 
+    def __setattr__(self, name, value):
+        setattr(current.globals, name, value)
 
+    def __repr__(self):
+        return 'G(' + repr(current.globals) + ')'
 
+G = SessionGlobals()
@@ -0,0 +1,149 @@
+#
+# This file is part of PyOLab. https://github.com/matsselen/pyolab
+# (C) 2017 Mats Selen <mats.selen@gmail.com>
+#
+# SPDX-License-Identifier:    BSD-3-Clause
+# (https://opensource.org/licenses/BSD-3-Clause)
+#
+
+# local stuff
+from .storeClass import ColumnStore
+
+"""
+The records found by findRecords() are not copied into lists of their own.
+Their bytes stay where they are in G.recordBytes, a ColumnStore of bytes
+numbered by their position in the stream of data received from the serial
+port, and each list in G.recDict is a RecordList that just holds the positions
+(offsets) where its records start - 8 bytes per record.
+
+Getting a record from a RecordList (G.recDict[recType][i]) gives a Record,
+which is a small view of the bytes. A Record can be used like the lists that
+were used before (rec[i], rec[i:j], len(rec), for b in rec, rec == [...],
+printing it), and also has:
+
+    rec.recType, rec.byteCount     the record type and byte count (BC)
+    rec.payload                    the bytes between BC and EOP (a numpy view)
+    rec.remote                     the first byte of the payload (for records that have one)
+    rec.frame, rec.rf, rec.nSens   frame counter, RF info and number of sensors
+                                   (only meaningful for dataFromRemote records)
+    rec.array()                    all of the bytes (a numpy view, no copying)
+    bytes(rec), rec.tolist()       copies of the bytes
+
+A RecordList keeps the numbering of a ColumnStore, so discarding old records
+(see retentionMethods.py) doesn't change the index of the others. Its data() and
+since() give the offsets themselves as numpy arrays.
+
+"""
+
+class Record(object):
+
+    __slots__ = ('store', 'offset', 'length')
+
+    def __init__(self, store, offset):
+        self.store  = store                  # the ColumnStore holding the bytes
+        self.offset = offset                 # where the record starts in it
+        self.length = store[offset + 2] + 4  # SOP, type, BC, payload, EOP
+
+    #======================================
+    # the bytes of the record as a numpy array (a view if they are in memory)
+    def array(self):
+        return self.store[self.offset:self.offset + self.length]
+
+    def __array__(self, dtype=None, copy=None):
+        if dtype is None:
+            return self.array()
+        return self.array().astype(dtype)
+
+    #======================================
+    # list-like access
+    def __len__(self):
+        return self.length
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return self.array()[i].tolist()
+        if i < 0:
+            i += self.length
+        if i < 0 or i >= self.length:
+            raise IndexError('record index out of range')
+        return self.store[self.offset + i]
+
+    def __iter__(self):
+        return iter(self.tolist())
+
+    def __eq__(self, other):
+        if isinstance(other, Record):
+            return self.tolist() == other.tolist()
+        if isinstance(other, (list, tuple, bytes, bytearray)):
+            return self.tolist() == list(other)
+        return NotImplemented
+
+    __hash__ = None
+
+    def tolist(self):
+        return self.array().tolist()
+
+    def __bytes__(self):
+        return self.array().tobytes()
+
+    def __repr__(self):
+        return repr(self.tolist())
+
+    #======================================
+    # fields (see Documentation/IOLab_usb_interface_specs.pdf)
+    @property
+    def recType(self):
+        return self[1]
+
+    @property
+    def byteCount(self):
+        return self.length - 4
+
+    @property
+    def payload(self):
+        return self.array()[3:-1]
+
+    @property
+    def remote(self):
+        return self[3]
+
+    @property
+    def frame(self):
+        return self[4]
+
+    @property
+    def rf(self):
+        return self[5]
+
+    @property
+    def nSens(self):
+        return self[6]
+
+
+class RecordList(ColumnStore):
+
+    def __init__(self, recordBytes, size=64):
+        ColumnStore.__init__(self, 'int64', 1, size)
+        self.recordBytes = recordBytes       # the ColumnStore the offsets point into
+
+    #======================================
+    # add the records starting at "offsets" (in recordBytes)
+    def extend(self, offsets):
+        self.append(offsets)
+
+    #======================================
+    # list-like access that gives Records
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            offsets = ColumnStore.__getitem__(self, i)
+            return [Record(self.recordBytes, offset) for offset in offsets.tolist()]
+        return Record(self.recordBytes, ColumnStore.__getitem__(self, i))
+
+    def __iter__(self):
+        return iter([Record(self.recordBytes, offset) for offset in self.data().tolist()])
+
+    def tolist(self):
+        return [rec.tolist() for rec in self]
+
+    def __repr__(self):
+        return 'RecordList(n=' + str(len(self)) + ', base=' + str(self.base) + ')'
@@ -0,0 +1,79 @@
+#
+# This file is part of PyOLab. https://github.com/matsselen/pyolab
+# (C) 2017 Mats Selen <mats.selen@gmail.com>
+#
+# SPDX-License-Identifier:    BSD-3-Clause
+# (https://opensource.org/licenses/BSD-3-Clause)
+#
+
+# local stuff
+from .storeClass import ColumnStore
+
+"""
+A dongle can talk to two remotes at once, and each one sends its own
+dataFromRemote records (byte 3 of every record says which remote it came from).
+A RemoteStream holds everything needed to decode the records of one remote,
+and what has been decoded from them. They are kept in G.remotes, keyed by
+remote number (see remoteStream() in dataMethods.py), and are:
+
+    remote              the remote number (1 or 2)
+    lastFixedConfig     the last fixed configuration of this remote
+    lastPacketConfig    the last packet config record of this remote
+    lastSensorBytes     dictionary of maximum byte-counts keyed by sensor (the layout
+                        of this remote's data records)
+    configIsSet         True once a packet configuration has been received
+    lastFrame, lastRF   frame byte and RF info of the last record decoded
+    lastFrameCount      frame count (not wrapped) of the last record decoded, lastFrameTime
+                        when it arrived, and lostFrames the number of frames that never
+                        arrived (see timingMethods.py)
+    restarts            the stream offsets of the config and startData records that came
+                        since then, after which the remote starts counting frames over
+    configChanges       the stream offsets where the fixed configuration changed, and the
+                        new configurations, until the data records around them are decoded
+    configStarts        for each sensor, a list of the sample numbers where each fixed
+                        configuration started, and the configurations (see calibratorClass.py)
+    pending             the numbers (in G.recDict[0x41]) of the data records from this
+                        remote that are waiting to be decoded (a ColumnStore: pending.base
+                        is the number of its records that have been decoded)
+    uncalDataDict       the decoded samples of each sensor, the times they were taken,
+    timeDataDict        and the calibrated samples, laid out as described in pyolabGlobals.py
+    calDataDict         (the samples of every remote are calibrated with the constants
+                        of the session, see calibrationMethods.py)
+    statsDict           the running statistics of each sensor (see statsMethods.py)
+
+The variables of remote 1 are also G's (G.lastSensorBytes is G.remotes[1].lastSensorBytes,
+G.uncalDataDict is G.remotes[1].uncalDataDict, and so on), so code that only uses
+one remote doesn't need to know about any of this.
+
+"""
+
+class RemoteStream(object):
+
+    def __init__(self, remote):
+        self.remote = remote
+
+        # configuration (see findLastConfig())
+        self.lastFixedConfig  = 0
+        self.lastPacketConfig = []
+        self.lastSensorBytes  = {}
+        self.configIsSet      = False
+
+        # where decoding is up to (see decodeDataPayloads() and timingMethods.py)
+        self.lastFrame      = 0
+        self.lastRF         = 0
+        self.lastFrameCount = None
+        self.lastFrameTime  = 0
+        self.lostFrames     = 0
+        self.restarts       = []
+        self.configChanges  = []
+        self.configStarts   = {}
+        self.pending        = ColumnStore('int64', size=256)
+
+        # the decoded data (see setupRemoteStores())
+        self.uncalDataDict = {}
+        self.timeDataDict  = {}
+        self.calDataDict   = {}
+        self.statsDict     = {}
+
+    def __repr__(self):
+        return 'RemoteStream(' + str(self.remote) + ', config=' + str(self.lastFixedConfig) + ')'
@@ -0,0 +1,151 @@
+#
+# This file is part of PyOLab. https://github.com/matsselen/pyolab
+# (C) 2017 Mats Selen <mats.selen@gmail.com>
+#
+# SPDX-License-Identifier:    BSD-3-Clause
+# (https://opensource.org/licenses/BSD-3-Clause)
+#
+
+# system stuff
+import time
+from collections import deque
+
+"""
+A ReplayPort stands in for the serial port when replaying recorded data
+(see replayMethods.py). It has the parts of the pyserial interface that
+pyolab uses (inWaiting(), read(), readinto(), write() and timeout), so it
+can be put in G.serialPort and the usual code will read from it.
+
+The data are given as a list of (time, bytes) chunks, where time is in
+nanoseconds. The speed says how quickly the chunks become available:
+
+    'fast'       as fast as they can be read, blockSize bytes at a time
+    'realtime'   each chunk shows up when its time comes
+    N (number)   N times faster than real time
+
+readChunks() hands out the chunks that have become available whole, each with
+the time it arrived at when it was recorded (moved so that the first chunk
+arrived when the replay started), which is what replayCapture() gives the raw
+data buffer. That way the timing code sees the same gaps between records as it
+did when the data were taken, whatever the speed.
+
+Anything written to the port (commands) is kept in the list "written".
+
+"""
+
+class ReplayPort(object):
+
+    def __init__(self, chunks, speed='fast', blockSize=0x4000):
+        self.chunks = chunks
+        self.blockSize = blockSize
+        self.timeout = None
+        self.is_open = True
+        self.written = []
+
+        if speed == 'fast':
+            self.factor = None
+        elif speed == 'realtime':
+            self.factor = 1.0
+        else:
+            self.factor = float(speed)
+
+        self.nextChunk = 0            # the next chunk to become available
+        self.ready = deque()          # chunks (time, bytes) that have become available...
+        self.nReady = 0               # ...and the number of bytes in them that haven't been read
+        self.startTime = None         # when the replay started (set by the first read)
+        self.startNs = None           # the same, in nanoseconds (see readChunks())
+
+    #======================================
+    # time (seconds from the start of the replay) when chunk i becomes available
+    def _due(self, i):
+        return (self.chunks[i][0] - self.chunks[0][0]) * 1e-9 / self.factor
+
+    #======================================
+    # move the chunks whose time has come to self.ready
+    def _release(self):
+
+        if self.startTime is None:
+            self.startTime = time.monotonic()
+            self.startNs = time.monotonic_ns()
+
+        if self.factor is None:
+            while self.nextChunk < len(self.chunks) and self.nReady < self.blockSize:
+                self._take()
+        else:
+            now = time.monotonic() - self.startTime
+            while self.nextChunk < len(self.chunks) and self._due(self.nextChunk) <= now:
+                self._take()
+
+    def _take(self):
+        t, data = self.chunks[self.nextChunk]
+        self.ready.append((self.startNs + t - self.chunks[0][0], data))
+        self.nReady += len(data)
+        self.nextChunk += 1
+
+    # wait (no longer than the timeout) for the next chunk if nothing is available
+    def _wait(self):
+
+        self._release()
+        if self.nReady == 0 and self.factor is not None and not self.done():
+            wait = self._due(self.nextChunk) - (time.monotonic() - self.startTime)
+            if self.timeout is not None:
+                wait = min(wait, self.timeout)
+            if wait > 0:
+                time.sleep(wait)
+            self._release()
+
+    #======================================
+    # Returns a list of (time, bytes) of the chunks that are available (waiting for
+    # the next one like read() does), with their times in nanoseconds on the
+    # time.monotonic_ns() clock, as if they had arrived during this replay 
+    def readChunks(self):
+
+        self._wait()
+        chunks = list(self.ready)
+        self.ready.clear()
+        self.nReady = 0
+        return chunks
+
+    #======================================
+    # pyserial look-alikes
+    def inWaiting(self):
+        self._release()
+        return self.nReady
+
+    @property
+    def in_waiting(self):
+        return self.inWaiting()
+
+    def read(self, n=1):
+
+        self._wait()
+        pieces = []
+        while n > 0 and len(self.ready) > 0:
+            t, data = self.ready[0]
+            if len(data) > n:
+                self.ready[0] = (t, data[n:])
+                data = data[:n]
+            else:
+                self.ready.popleft()
+            pieces.append(data)
+            n -= len(data)
+        data = b''.join(pieces)
+        self.nReady -= len(data)
+        return data
+
+    def readinto(self, b):
+        data = self.read(len(b))
+        b[:len(data)] = data
+        return len(data)
+
+    def write(self, data):
+        self.written.append(bytes(data))
+        return len(data)
+
+    def close(self):
+        self.is_open = False
+
+    #======================================
+    # True once every byte has been read
+    def done(self):
+        return self.nextChunk == len(self.chunks) and self.nReady == 0
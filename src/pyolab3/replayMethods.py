@@ -0,0 +1,193 @@
+#
+# This file is part of PyOLab. https://github.com/matsselen/pyolab
+# (C) 2017 Mats Selen <mats.selen@gmail.com>
+#
+# SPDX-License-Identifier:    BSD-3-Clause
+# (https://opensource.org/licenses/BSD-3-Clause)
+#
+
+# system stuff
+import re
+import ast
+import time
+
+# local stuff
+from .pyolabGlobals import G
+from .analClass import AnalysisClass
+from .replayClass import ReplayPort
+from .captureMethods import captureMagic, readCapture
+from .setupMethods import setupGlobalVariables, recordRead, analyzeData, userAnalysis
+
+"""
+These methods replay recorded data through the same code that handles
+live data (readData, findRecords, findLastConfig, decodeDataPayloads and
+the user's analLoop), with a ReplayPort (see replayClass.py) standing in
+for the serial port. No IOLab hardware is needed. For example
+
+    stats = replayCapture('data.iolab')            # as fast as possible
+    stats = replayCapture('data.txt', 'realtime')
+    stats = replayCapture('data.iolab', 10)        # 10 times real time
+
+Three kinds of files can be replayed:
+
+  - capture files written when G.dumpData is set (see captureMethods.py)
+  - the old hex text dumps ("data.txt")
+  - lists of records like the ones in Documentation/example_data.txt, where
+    each data record is printed without its first two bytes and its last byte.
+    "setFixedConfig(n)" and "New packet configuration" lines are turned into
+    the getFixedConfig and getPacketConfig records that would have been received.
+
+Only capture files know when each byte arrived. For the others the records
+are assumed to arrive one frame (framePeriod seconds) per data record. Either
+way the data go into G.dataBuffer with those times (see replayCapture()), not
+the times they are replayed at.
+
+"""
+
+framePeriod = 0.010    # the remote sends one data record every 10 ms
+
+#======================================
+# Splits a stream of bytes into pieces that each end where a record ends
+# (anything that isn't part of a record is left at the start of the next piece).
+# Returns a list of (recType, piece), where recType is the type of the record
+# at the end of the piece (or None for leftovers at the end of the stream).
+#
+def splitRecords(data):
+
+    pieces = []
+    start = 0
+    i = 0
+    while i < len(data) - 3:
+        end = i + data[i+2] + 4
+        if data[i] == 0x02 and end <= len(data) and data[end-1] == 0x0A:
+            pieces.append((data[i+1], data[start:end]))
+            start = i = end
+        else:
+            i += 1
+
+    if start < len(data):
+        pieces.append((None, data[start:]))
+    return pieces
+
+#======================================
+# Gives each piece of the stream (see splitRecords()) a time: the clock moves ahead by
+# framePeriod after every data record. Returns a list of (time, bytes) chunks
+# with the time in nanoseconds.
+#
+def timeRecords(pieces):
+
+    chunks = []
+    t = 0
+    for recType, piece in pieces:
+        chunks.append((t, bytes(piece)))
+        if recType == G.recType_dataFromRemote:
+            t += int(framePeriod * 1e9)
+    return chunks
+
+#======================================
+# Reads a file of records printed as python lists (see example_data.txt)
+# and returns the records.
+#
+def readRecordLists(text, remote=1):
+
+    records = []
+    nextLine = ''
+    for line in text.splitlines():
+        line = line.strip()
+
+        m = re.search(r'setFixedConfig\((\d+)\)', line)
+        if m:
+            # the remote would answer with a getFixedConfig record
+            records.append([0x02, G.recType_getFixedConfig, 2, remote, int(m.group(1)), 0x0A])
+        elif line.startswith('New packet configuration'):
+            nextLine = 'packet'
+        elif line.startswith('New sensor configuration'):
+            nextLine = 'sensor'
+        elif line.startswith('['):
+            values = ast.literal_eval(line)
+            if nextLine == 'packet':
+                records.append([0x02, G.recType_getPacketConfig, len(values) + 1, remote] + values + [0x0A])
+            elif nextLine == '' and len(values) > 0 and isinstance(values[0], int) and values[0] + 1 == len(values):
+                records.append([0x02, G.recType_dataFromRemote] + values + [0x0A])
+            nextLine = ''
+
+    return records
+
+#======================================
+# Reads the file fileName (any of the kinds described above) and returns
+# a list of (time, bytes) chunks that can be given to a ReplayPort.
+#
+def loadReplay(fileName):
+
+    with open(fileName, 'rb') as f:
+        magic = f.read(len(captureMagic))
+
+    if magic == captureMagic:
+        return [(t, data) for seq, t, data in readCapture(fileName)]
+
+    text = open(fileName).read()
+    if text.lstrip().startswith('[') or '\n[' in text:
+        return timeRecords([(rec[1], rec) for rec in readRecordLists(text)])
+
+    data = bytes([int(x, 16) for x in text.split()])
+    return timeRecords(splitRecords(data))
+
+#======================================
+# Replays the file fileName through the usual analysis code at the given
+# speed ('fast', 'realtime' or a number, see replayClass.py). The global
+# data structures (G.recDict, G.uncalDataDict, ...) are set up from scratch
+# and hold the results when this returns.
+#
+# Returns a dictionary with the number of bytes, records and samples (from all
+# remotes) processed, how long it took, and the rates. These are printed if
+# "report" is True.
+#
+def replayCapture(fileName, speed='fast', report=True):
+
+    chunks = loadReplay(fileName)
+
+    # the analysis code calls the user's analLoop(), so there has to be one
+    if userAnalysis() == '':
+        AnalysisClass(lambda: None, lambda: None, lambda: None)
+
+    setupGlobalVariables()
+    firstByte = G.dataBuffer.writePos
+    G.serialPort = ReplayPort(chunks, speed)
+    G.serialPort.timeout = G.readTimeout
+
+    # each chunk goes in with the time it arrived when it was recorded (see
+    # ReplayPort.readChunks()), so the timing code sees the same gaps it did then
+    startTime = time.perf_counter()
+    while not G.serialPort.done():
+        chunks = G.serialPort.readChunks()
+        for t, data in chunks:
+            G.dataBuffer.write(data, t)
+            recordRead(len(data), len(data))
+        if len(chunks) > 0:
+            G.dataPointer = analyzeData()
+    seconds = time.perf_counter() - startTime
+
+    nSamples = 0
+    for remote in G.remotes.values():
+        for sensor in remote.uncalDataDict:
+            nSamples += len(remote.uncalDataDict[sensor])
+
+    stats = {
+        'bytes'         : G.dataBuffer.writePos - firstByte,
+        'records'       : len(G.allRecList),
+        'dataRecords'   : len(G.dataRecList),
+        'samples'       : nSamples,
+        'seconds'       : seconds,
+    }
+    stats['bytesPerSec']   = stats['bytes'] / seconds if seconds > 0 else 0
+    stats['recordsPerSec'] = stats['records'] / seconds if seconds > 0 else 0
+    stats['samplesPerSec'] = stats['samples'] / seconds if seconds > 0 else 0
+
+    if report:
+        print("replayed " + fileName + " (" + str(speed) + "): " + str(stats['bytes']) + " bytes, " +
+              str(stats['records']) + " records, " + str(stats['samples']) + " samples in " +
+              "%.3f" % seconds + " s")
+        print("   %.0f records/s, %.0f samples/s, %.0f bytes/s" %
+              (stats['recordsPerSec'], stats['samplesPerSec'], stats['bytesPerSec']))
+
+    return stats
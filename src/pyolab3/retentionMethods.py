@@ -0,0 +1,184 @@
+#
+# This file is part of PyOLab. https://github.com/matsselen/pyolab
+# (C) 2017 Mats Selen <mats.selen@gmail.com>
+#
+# SPDX-License-Identifier:    BSD-3-Clause
+# (https://opensource.org/licenses/BSD-3-Clause)
+#
+
+# system stuff
+import os
+import time
+from collections import deque
+
+# local stuff
+from .pyolabGlobals import G
+
+"""
+These methods keep the memory used by a long run bounded by throwing away
+old records and samples, as set up in the dictionary G.retention. They are
+called by analyzeData() after the user's analLoop() has seen the new data.
+
+G.retention holds a policy for each kind of store:
+
+    'records'                 every list in G.recDict, plus G.recordIndex
+                              and G.commRecList
+    'uncal'                   every store in G.uncalDataDict (and those of the other
+                              remotes, see remoteClass.py)
+    ('records', recType)      just G.recDict[recType]
+    ('uncal', sensor)         just G.uncalDataDict[sensor] (and this sensor of the
+                              other remotes)
+    ('uncal', sensor, remote) just this sensor of remote number "remote"
+    'allRecList' or 'commRecList'    just G.recordIndex (which is G.allRecList)
+                              or just G.commRecList
+
+and each policy is one of:
+
+    None                      keep everything in memory (the default)
+    ('seconds', N)            keep what arrived in the last N seconds
+    ('samples', N)            keep the last N samples (or records)
+    ('spill', N)              keep the last N in memory and write the rest to
+                              files in the directory G.retentionDir, from where
+                              they can still be read (see storeClass.py)
+
+For example, to run overnight keeping 10 minutes of sensor data, the last
+1000 records of each type, and every record on disk:
+
+    G.retention = {'uncal': ('seconds', 600), 'records': ('samples', 1000),
+                   ('records', G.recType_dataFromRemote): ('spill', 1000)}
+
+The sample times in G.timeDataDict follow the policy of the samples they belong to.
+The files that stores of remotes other than remote 1 spill to have the remote number
+at the end of their names (uncal_1_2.bin is the accelerometer of remote 2).
+
+Discarding things doesn't change the numbers of the ones that are left
+(len(G.uncalDataDict[1]) is still the number of samples ever received, etc),
+so counters like G.nextRecord or a user's "last sample I looked at" stay valid.
+Data records that haven't been decoded yet, and the latest record of each type,
+are never discarded - unless they are from a remote whose packet configuration
+isn't known yet, which could otherwise hold on to them forever.
+
+The raw bytes don't need a policy: G.dataBuffer (see bufferClass.py) only holds
+the bytes that haven't been sorted into records yet.
+
+"""
+
+#======================================
+# Throws away (or spills) whatever the policies in G.retention say should go.
+#
+def applyRetention():
+
+    if len(G.retention) == 0:
+        return
+
+    now = time.monotonic()
+
+    for recType, store in G.recDict.items():
+        # keep the latest record of each type, and any data records still to be decoded
+        limit = len(store) - 1
+        if recType == G.recType_dataFromRemote:
+            limit = min(limit, firstPendingRecord())
+        retain(store, ('records', recType), 'records', limit, now)
+
+    # the bytes before the first record still in memory can go too
+    # (to the spill file if any records are being spilled)
+    upTo = len(G.recordBytes)
+    spill = False
+    for store in G.recDict.values():
+        if store.n > 0:
+            upTo = min(upTo, store.data()[0])
+        spill = spill or store.spillName is not None
+    if spill and G.recordBytes.spillName is None:
+        startSpill(G.recordBytes, 'recordBytes')
+    if upTo > G.recordBytes.base:
+        G.recordBytes.discard(upTo)
+
+    # the record index (G.dataRecList is worked out from G.recDict, so it needs nothing)
+    retain(G.recordIndex, 'allRecList', 'records', len(G.recordIndex), now)
+    retain(G.commRecList.rows, 'commRecList', 'records', len(G.commRecList.rows), now)
+
+    for remote in G.remotes.values():
+        # (remote 1 is the one in G.uncalDataDict)
+        tag = () if remote.remote == 1 else (remote.remote,)
+
+        for sensor, store in remote.uncalDataDict.items():
+            retain(store, ('uncal', sensor) + tag, 'uncal', len(store), now)
+
+        # the sample times go when the samples do
+        for sensor, store in remote.timeDataDict.items():
+            samples = remote.uncalDataDict[sensor]
+            if samples.spillName is not None and store.spillName is None:
+                startSpill(store, ('time', sensor) + tag)
+            if samples.base > store.base:
+                store.discard(samples.base)
+
+#======================================
+# Returns the number (in G.recDict) of the first data record still waiting to 
+# be decoded by a remote that knows how to decode it (see decodeDataPayloads())
+#
+def firstPendingRecord():
+
+    first = G.nextRecord
+    for remote in G.remotes.values():
+        pending = remote.pending
+        if len(pending) > pending.base and len(remote.lastSensorBytes) > 0:
+            first = min(first, int(pending[pending.base]))
+    return first
+
+#======================================
+# Applies the policy for "key" (or for "kind" if there isn't one for key)
+# to store, never discarding anything from number "limit" on.
+#
+def retain(store, key, kind, limit, now):
+
+    policy = G.retention.get(kind)
+    if isinstance(key, tuple) and len(key) > 2:
+        policy = G.retention.get(key[:2], policy)   # ('uncal', sensor) is for every remote
+    policy = G.retention.get(key, policy)
+    if policy is None:
+        return
+
+    what, amount = policy
+    if what == 'samples':
+        upTo = len(store) - amount
+
+    elif what == 'seconds':
+        # remember how big the store was at different times (about 100 times
+        # per "amount" seconds), and throw away what was there "amount" seconds ago
+        marks = G.retentionMarks.setdefault(key, deque())
+        if len(marks) == 0 or now - marks[-1][0] >= amount / 100.0:
+            marks.append((now, len(store)))
+        upTo = 0
+        while len(marks) > 0 and marks[0][0] <= now - amount:
+            upTo = marks.popleft()[1]
+
+    elif what == 'spill':
+        if store.spillName is None:
+            startSpill(store, key)
+        upTo = len(store) - amount
+
+    else:
+        raise ValueError("unknown retention policy " + str(policy) + " for " + str(key))
+
+    upTo = min(upTo, limit)
+    if upTo > store.base:
+        store.discard(upTo)
+
+#======================================
+# Sets up store (called "key" in G.retention) to spill to a file in G.retentionDir.
+# The bytes of the records (G.recordBytes) go to recordBytes.bin, exactly as they 
+# were received, the lists in G.recDict write the offsets of their records, and 
+# G.recordIndex writes its entries.
+#
+def startSpill(store, key):
+
+    if not os.path.isdir(G.retentionDir):
+        os.makedirs(G.retentionDir)
+
+    if isinstance(key, tuple):
+        fileName = '_'.join(str(k) for k in key)
+    else:
+        fileName = key
+    fileName = os.path.join(G.retentionDir, fileName + '.bin')
+
+    store.spill(fileName)
@@ -0,0 +1,404 @@
+#
+# This file is part of PyOLab. https://github.com/matsselen/pyolab
+# (C) 2017 Mats Selen <mats.selen@gmail.com>
+#
+# SPDX-License-Identifier:    BSD-3-Clause
+# (https://opensource.org/licenses/BSD-3-Clause)
+#
+
+# system stuff
+import os
+import time
+import socket
+import struct
+import selectors
+from collections import deque
+from threading import Thread, Lock
+import numpy as np
+
+"""
+An IOLabServer hands the decoded samples to any number of subscribers over a
+Unix-domain socket (see serverMethods.py for how it is fed, and IOLabSubscriber
+in clientClass.py for the other end). It has a thread of its own that accepts
+subscribers and does all of the sending, so whoever feeds it only has to copy
+the new samples once (into a SampleBatch) and put them in the queues of the
+subscribers that want them.
+
+Everything sent either way is a frame: a header (frameHeader) followed by
+"size" bytes.
+
+    kind      B   frameData, frameStatus or frameSubscribe
+    remote    B   the remote the frame is about (0 means all of them in frameSubscribe)
+    sensor    B   the sensor the samples came from (frameData)
+    width     B   the number of numbers in each sample
+    dtype     4s  the numpy type of these numbers (for example b'<i2')
+    count     I   the number of samples
+    first     Q   the sample number of the first one (numbered like G.uncalDataDict)
+    size      I   the number of bytes that follow
+
+frameData       the times of the samples (count float64s) followed by the samples
+                themselves (count x width numbers of type dtype)
+frameStatus     the status of a remote (statusFormat: lastFixedConfig, lostFrames,
+                lastFrameCount and lastFrameTime), sent when a subscriber starts
+                and whenever the configuration or the number of lost frames changes
+frameSubscribe  sent by a subscriber: it wants the samples of the sensors listed in
+                the payload (one byte each, none for all of them) of the remote,
+                on top of what it already gets
+
+Each subscriber has a queue that can hold queueLength batches of each sensor.
+When a subscriber can't keep up and queueLength batches of a sensor are waiting,
+the policy says what gives (for that sensor only, the others aren't affected):
+
+    'drop'      the oldest batch of the sensor is thrown away (the subscriber sees
+                the gap in the sample numbers)
+    'coalesce'  the new samples are added to the batch of the same sensor that is
+                already waiting, so nothing is lost until it holds maxSamples
+                (after which the oldest samples are thrown away)
+
+Either way, a slow subscriber never holds up the others, or whoever feeds the server.
+
+"""
+
+# the frames
+frameHeader    = struct.Struct('<BBBB4sIQI')
+statusFormat   = struct.Struct('<qqqq')
+frameData      = 1
+frameStatus    = 2
+frameSubscribe = 3
+
+serverPolicies = ['drop', 'coalesce']
+
+#======================================================================
+# The new samples of one sensor, in the form they are sent in. The same batch
+# goes to every subscriber that wants it, so its frame is only put together once.
+#
+class SampleBatch(object):
+
+    def __init__(self, remote, sensor, first, times, samples):
+        samples = np.ascontiguousarray(samples)
+        self.remote  = remote
+        self.sensor  = sensor
+        self.first   = first
+        self.count   = len(samples)
+        self.width   = 1 if samples.ndim == 1 else samples.shape[1]
+        self.dtype   = samples.dtype.str
+        self.times   = np.ascontiguousarray(times, np.float64).tobytes()
+        self.samples = samples.tobytes()
+        self._frame  = None
+
+    @property
+    def key(self):
+        return (self.remote, self.sensor)
+
+    #======================================
+    # the header and the data, ready to send
+    def frame(self):
+        if self._frame is None:
+            size = len(self.times) + len(self.samples)
+            self._frame = frameHeader.pack(frameData, self.remote, self.sensor, self.width,
+                                           self.dtype.encode(), self.count, self.first, size) + self.times + self.samples
+        return self._frame
+
+    #======================================
+    # Returns a batch holding the samples of this one followed by those of "later",
+    # keeping the newest maxSamples of them (and the number of samples thrown away).
+    # If there are samples missing between the two, only the later ones are kept.
+    def merge(self, later, maxSamples):
+
+        if later.first != self.first + self.count:
+            return later, self.count
+
+        merged = SampleBatch.__new__(SampleBatch)
+        merged.__dict__.update(later.__dict__)
+        merged.first   = self.first
+        merged.count   = self.count + later.count
+        merged.times   = self.times + later.times
+        merged.samples = self.samples + later.samples
+        merged._frame  = None
+
+        lost = merged.count - maxSamples
+        if lost > 0:
+            merged.first += lost
+            merged.count -= lost
+            merged.times = merged.times[lost * 8:]
+            merged.samples = merged.samples[lost * (len(later.samples) // later.count):]
+        return merged, max(lost, 0)
+
+    def __repr__(self):
+        return ('SampleBatch(remote=' + str(self.remote) + ', sensor=' + str(self.sensor) +
+                ', first=' + str(self.first) + ', count=' + str(self.count) + ')')
+
+#======================================================================
+# the server's end of the connection to one subscriber
+#
+class Subscriber(object):
+
+    def __init__(self, sock):
+        self.sock = sock
+        self.wanted = {}          # the sensors wanted from each remote (None for all of them)
+        self.queue = deque()      # frames (bytes) and SampleBatches waiting to be sent
+        self.waiting = {}         # the number of SampleBatches in the queue, keyed by (remote, sensor)
+        self.sending = None       # what is left of the frame being sent (a memoryview)
+        self.received = bytearray()
+        self.stats = {'batches': 0, 'bytes': 0, 'dropped': 0, 'coalesced': 0}
+
+    def wants(self, remote, sensor):
+        for r in (remote, 0):
+            if r in self.wanted and (self.wanted[r] is None or sensor in self.wanted[r]):
+                return True
+        return False
+
+    def subscribe(self, remote, sensors):
+        if len(sensors) == 0 or self.wanted.get(remote, ()) is None:
+            self.wanted[remote] = None
+        else:
+            self.wanted[remote] = self.wanted.get(remote, set()) | set(sensors)
+
+    #======================================
+    # Queues a batch, making room according to "policy" if queueLength batches
+    # of the same sensor are already waiting (the other sensors aren't touched)
+    def put(self, batch, queueLength, policy, maxSamples):
+
+        key = batch.key
+        if self.waiting.get(key, 0) >= queueLength:
+            if policy == 'coalesce':
+                # add it to the newest batch of this sensor
+                for i in range(len(self.queue) - 1, -1, -1):
+                    waiting = self.queue[i]
+                    if isinstance(waiting, SampleBatch) and waiting.key == key:
+                        self.queue[i], lost = waiting.merge(batch, maxSamples)
+                        self.stats['coalesced'] += 1
+                        self.stats['dropped'] += lost
+                        return
+
+            # throw away the oldest batch of this sensor
+            for i in range(len(self.queue)):
+                waiting = self.queue[i]
+                if isinstance(waiting, SampleBatch) and waiting.key == key:
+                    self.stats['dropped'] += waiting.count
+                    del self.queue[i]
+                    self.waiting[key] -= 1
+                    break
+
+        self.queue.append(batch)
+        self.waiting[key] = self.waiting.get(key, 0) + 1
+
+    #======================================
+    # sends as much as the socket takes without waiting. Returns False once
+    # there is nothing left to send.
+    def send(self):
+
+        while True:
+            if self.sending is None:
+                if len(self.queue) == 0:
+                    return False
+                frame = self.queue.popleft()
+                if isinstance(frame, SampleBatch):
+                    self.waiting[frame.key] -= 1
+                    self.stats['batches'] += 1
+                    frame = frame.frame()
+                self.sending = memoryview(frame)
+
+            n = self.sock.send(self.sending)
+            self.stats['bytes'] += n
+            self.sending = self.sending[n:] if n < len(self.sending) else None
+            if self.sending is not None:
+                return True
+
+    #======================================
+    # takes the frames the subscriber has sent us. Returns False once it has gone.
+    def receive(self):
+
+        data = self.sock.recv(4096)
+        if len(data) == 0:
+            return False
+
+        self.received += data
+        while len(self.received) >= frameHeader.size:
+            kind, remote, sensor, width, dtype, count, first, size = frameHeader.unpack_from(self.received)
+            if len(self.received) < frameHeader.size + size:
+                break
+            payload = bytes(self.received[frameHeader.size:frameHeader.size + size])
+            del self.received[:frameHeader.size + size]
+            if kind == frameSubscribe:
+                self.subscribe(remote, list(payload))
+        return True
+
+    def close(self):
+        self.sock.close()
+
+
+#======================================================================
+# The server itself. It listens on the Unix-domain socket called "path"
+# (a file left over from before is replaced).
+#
+class IOLabServer(object):
+
+    def __init__(self, path, queueLength=64, policy='drop', maxSamples=0x10000):
+
+        if policy not in serverPolicies:
+            raise ValueError("policy must be one of " + str(serverPolicies))
+
+        self.path = path
+        self.queueLength = queueLength
+        self.policy = policy
+        self.maxSamples = maxSamples
+        self.served = {}          # the next sample to serve of each (remote, sensor) - see serveData()
+        self.status = {}          # the last status frame of each remote
+        self.subscribers = {}     # keyed by socket
+        self.lock = Lock()        # protects the subscribers and their queues
+        self.stats = {'subscribers': 0, 'batches': 0, 'dropped': 0, 'coalesced': 0}
+
+        if os.path.exists(path):
+            os.unlink(path)
+        self.listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.listener.bind(path)
+        self.listener.listen(64)
+        self.listener.setblocking(False)
+
+        # writing a byte to wakeUp gets the attention of the server thread
+        self.wakeUp, self.wokenUp = socket.socketpair()
+        self.wakeUp.setblocking(False)
+        self.wokenUp.setblocking(False)
+
+        self.selector = selectors.DefaultSelector()
+        self.selector.register(self.listener, selectors.EVENT_READ)
+        self.selector.register(self.wokenUp, selectors.EVENT_READ)
+
+        self.running = True
+        self.thread = Thread(target=self.serve)
+        self.thread.daemon = True
+        self.thread.start()
+
+    #======================================
+    # True if anybody wants the samples of "sensor" of "remote"
+    def wanted(self, remote, sensor):
+        with self.lock:
+            return any([s.wants(remote, sensor) for s in self.subscribers.values()])
+
+    #======================================
+    # hands a list of SampleBatches to the subscribers that want them
+    def push(self, batches):
+
+        with self.lock:
+            for subscriber in self.subscribers.values():
+                for batch in batches:
+                    if subscriber.wants(batch.remote, batch.sensor):
+                        subscriber.put(batch, self.queueLength, self.policy, self.maxSamples)
+            self.stats['batches'] += len(batches)
+        self.wake()
+
+    #======================================
+    # sends the status of "remote" to everybody (and to those who subscribe later)
+    def setStatus(self, remote, lastFixedConfig, lostFrames, lastFrameCount, lastFrameTime):
+
+        payload = statusFormat.pack(lastFixedConfig, lostFrames,
+                                    -1 if lastFrameCount is None else lastFrameCount, lastFrameTime)
+        frame = frameHeader.pack(frameStatus, remote, 0, 0, b'', 0, 0, len(payload)) + payload
+        with self.lock:
+            self.status[remote] = frame
+            for subscriber in self.subscribers.values():
+                subscriber.queue.append(frame)
+        self.wake()
+
+    def wake(self):
+        try:
+            self.wakeUp.send(b'x')
+        except (BlockingIOError, OSError):
+            pass                  # it has plenty of wake-ups already (or has stopped)
+
+    #=========================================
+    # This is the server thread. It accepts subscribers, takes their subscriptions,
+    # and sends them what is in their queues, until close() is called.
+    def serve(self):
+
+        while self.running:
+            for key, events in self.selector.select(1.0):
+                sock = key.fileobj
+                if sock is self.listener:
+                    self.accept()
+                elif sock is self.wokenUp:
+                    try:
+                        sock.recv(4096)
+                    except BlockingIOError:
+                        pass
+                else:
+                    self.service(sock, events)
+
+            # whoever has something waiting should be woken when it can be sent
+            with self.lock:
+                for sock, subscriber in self.subscribers.items():
+                    events = selectors.EVENT_READ
+                    if len(subscriber.queue) > 0 or subscriber.sending is not None:
+                        events |= selectors.EVENT_WRITE
+                    if self.selector.get_key(sock).events != events:
+                        self.selector.modify(sock, events)
+
+    def accept(self):
+
+        try:
+            sock, address = self.listener.accept()
+        except BlockingIOError:
+            return
+        sock.setblocking(False)
+        subscriber = Subscriber(sock)
+        with self.lock:
+            self.subscribers[sock] = subscriber
+            subscriber.queue.extend(self.status.values())
+            self.stats['subscribers'] += 1
+        self.selector.register(sock, selectors.EVENT_READ | selectors.EVENT_WRITE)
+
+    def service(self, sock, events):
+
+        subscriber = self.subscribers[sock]
+        try:
+            if events & selectors.EVENT_READ:
+                with self.lock:
+                    alive = subscriber.receive()
+                if not alive:
+                    return self.drop(sock)
+            if events & selectors.EVENT_WRITE:
+                with self.lock:
+                    subscriber.send()
+        except BlockingIOError:
+            pass
+        except OSError:
+            self.drop(sock)
+
+    # forgets a subscriber that has gone away
+    def drop(self, sock):
+        self.selector.unregister(sock)
+        with self.lock:
+            subscriber = self.subscribers.pop(sock)
+            self.stats['dropped'] += subscriber.stats['dropped']
+            self.stats['coalesced'] += subscriber.stats['coalesced']
+        subscriber.close()
+
+    #======================================
+    # Stops the server, giving the subscribers up to "timeout" seconds to
+    # take what is still waiting for them.
+    def close(self, timeout=1.0):
+
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            with self.lock:
+                waiting = any([len(s.queue) > 0 or s.sending is not None for s in self.subscribers.values()])
+            if not waiting:
+                break
+            self.wake()
+            time.sleep(0.01)
+
+        self.running = False
+        self.wake()
+        self.thread.join()
+        for sock in list(self.subscribers):
+            self.drop(sock)
+        self.selector.close()
+        self.listener.close()
+        self.wakeUp.close()
+        self.wokenUp.close()
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+    def __repr__(self):
+        return 'IOLabServer(' + repr(self.path) + ', subscribers=' + str(len(self.subscribers)) + ', ' + str(self.stats) + ')'
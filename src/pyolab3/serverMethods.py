@@ -0,0 +1,90 @@
+#
+# This file is part of PyOLab. https://github.com/matsselen/pyolab
+# (C) 2017 Mats Selen <mats.selen@gmail.com>
+#
+# SPDX-License-Identifier:    BSD-3-Clause
+# (https://opensource.org/licenses/BSD-3-Clause)
+#
+
+# local stuff
+from .pyolabGlobals import G
+from .serverClass import IOLabServer, SampleBatch
+
+"""
+These methods serve the decoded data over a Unix-domain socket, for programs
+that would rather read a socket than map shared memory (see publishMethods.py
+for that). Nothing is served unless G.serverPath is set, for example
+
+    G.serverPath = '/tmp/iolab.sock'
+    startItUp()
+
+after which any number of programs can connect and subscribe to the sensors
+they want (see IOLabSubscriber in clientClass.py):
+
+    subscriber = IOLabSubscriber('/tmp/iolab.sock', remote=1, sensors=[1, 12])
+    remote, sensor, first, samples, times = subscriber.receive()
+
+analyzeData() hands the server the samples of each sensor somebody wants as soon
+as they have been decoded, and the server's own thread sends them (see serverClass.py
+for the frames, and what happens to subscribers that can't keep up, which is set
+by G.serverQueueLength, G.serverPolicy and G.serverMaxSamples).
+
+The server is part of the usual threads (startItUp()). In multiprocess mode the
+decoded data are published in shared memory instead (see processMethods.py).
+
+"""
+
+#======================================
+# Starts the server (called by startItUp() when G.serverPath is set)
+#
+def startServing():
+
+    G.server = IOLabServer(G.serverPath, G.serverQueueLength, G.serverPolicy, G.serverMaxSamples)
+    if G.logData:
+        G.logFile.write("\nserving the data on " + G.serverPath)
+
+#======================================
+# Hands the samples decoded since the last time to the server (the ones
+# nobody is subscribed to are skipped). Returns True if there were any.
+#
+def serveData():
+
+    server = G.server
+    if server is None:
+        return False
+
+    batches = []
+    for remote in G.remotes.values():
+
+        # let the subscribers know when the configuration changes or frames are lost
+        status = (remote.lastFixedConfig, remote.lostFrames)
+        if server.served.get(remote.remote) != status:
+            server.served[remote.remote] = status
+            server.setStatus(remote.remote, remote.lastFixedConfig, remote.lostFrames,
+                             remote.lastFrameCount, remote.lastFrameTime)
+
+        for sensor, store in remote.uncalDataDict.items():
+            times = remote.timeDataDict[sensor]
+            nDone = min(len(store), len(times))
+            first = server.served.get((remote.remote, sensor), 0)
+            if nDone > first:
+                server.served[(remote.remote, sensor)] = nDone
+                if server.wanted(remote.remote, sensor):
+                    first = max(first, store.base, times.base)
+                    batches.append(SampleBatch(remote.remote, sensor, first, times.since(first)[:nDone - first],
+                                               store.since(first)[:nDone - first]))
+
+    if len(batches) > 0:
+        server.push(batches)
+    return len(batches) > 0
+
+#======================================
+# Stops the server (the subscribers get what is still waiting for them first)
+#
+def stopServing():
+
+    if G.server is not None:
+        G.server.close()
+        if G.logData:
+            G.logFile.write("\n" + str(G.server))
+        G.server = None
@@ -0,0 +1,229 @@
+#
+# This file is part of PyOLab. https://github.com/matsselen/pyolab
+# (C) 2017 Mats Selen <mats.selen@gmail.com>
+#
+# SPDX-License-Identifier:    BSD-3-Clause
+# (https://opensource.org/licenses/BSD-3-Clause)
+#
+
+# system stuff
+import os
+from threading import Thread
+
+# local stuff
+from .pyolabGlobals import Globals, useGlobals
+from .setupMethods import startItUp, shutItDown
+from .processMethods import startProcesses, stopProcesses
+from .commMethods import getIOLabPortNames
+
+"""
+An IOLabSession is everything needed to run one IOLab dongle: its serial port,
+buffers, threads and decoded data. It has all of the global variables described
+in pyolabGlobals.py as its own attributes (session.uncalDataDict, session.readStats,
+...), and the threads it starts, along with the user code they call, see these
+as G (so userMethods.py etc work the same for every session). For example
+
+    session = IOLabSession('/dev/ttyACM1', 'rack2', AnalysisClass(start, end, loop), logData=False)
+    session.start()
+    with session:
+        setFixedConfig(G.serialPort, 1, 1)    # G is this session in the "with" block
+        startData(G.serialPort)
+    ...
+    session.uncalDataDict[1].since(n)
+    session.stop()
+
+The parameters are:
+
+    portName    the serial port of the dongle (None to find one, like startItUp())
+    name        used to give the session its own files: log_<name>.txt, data_<name>.iolab,
+                data_<name>.txt and retention_<name>/ (None to use the usual names)
+    analysis    the AnalysisClass whose methods it calls (None to use the last one created)
+    settings    any of the control variables in pyolabGlobals.py, for example logData=False
+
+Code that doesn't use sessions keeps working as before, with G being the default
+set of globals (defaultGlobals in pyolabGlobals.py).
+
+An IOLabSessionManager starts a session for each dongle plugged in (or for each of
+the ports it is given), so that several of them can take data at the same time:
+
+    manager = IOLabSessionManager(analysis=AnalysisClass(start, end, loop), logData=False)
+    manager.start()
+    manager.run(lambda: setFixedConfig(G.serialPort, 1, 1))
+    manager.run(lambda: startData(G.serialPort))
+    ...
+    manager.stop()
+
+The sessions of a manager are threads of one process, so they only overlap while
+waiting on their serial ports: the decoding (and the user's analLoop()) of all of
+them shares one core, because of the GIL. If the dongles together send more than 
+one core can decode, give each one an IOLabProcessSession instead.
+
+An IOLabProcessSession is the same as an IOLabSession, except that it runs pyolab
+in multiprocess mode (see processMethods.py): the serial port is read by a process
+of its own and the data are decoded by "decoders" other processes, so the user's
+code in this one can never make the reader fall behind.
+
+    session = IOLabProcessSession(analysis=AnalysisClass(start, end, loop), decoders=2)
+
+"""
+
+class IOLabSession(Globals):
+
+    def __init__(self, portName=None, name=None, analysis=None, **settings):
+
+        # each named session writes its own files (unless it is told otherwise)
+        if name is not None:
+            settings.setdefault('logFileName', 'log_' + name + '.txt')
+            settings.setdefault('hexFileName', 'data_' + name + '.txt')
+            settings.setdefault('captureFileName', 'data_' + name + '.iolab')
+            settings.setdefault('retentionDir', 'retention_' + name)
+
+        Globals.__init__(self, **settings)
+        self.portName = portName
+        self.name     = name
+        self.analysis = analysis
+        self.outer    = []        # the globals used before "with session:" (see __enter__())
+
+    #======================================
+    # opens the port and starts the threads (see startItUp()). Returns True if it worked.
+    def start(self):
+
+        self.running = True
+        with self:
+            return startItUp(self.portName)
+
+    #======================================
+    # stops the threads and the remote (see shutItDown())
+    def stop(self):
+
+        if self.readThread is None:
+            return
+        with self:
+            shutItDown()
+
+    #======================================
+    # calls function(*args, **kwargs) with G being this session, and returns what it returns
+    def run(self, function, *args, **kwargs):
+
+        with self:
+            return function(*args, **kwargs)
+
+    # "with session:" makes G this session in the current thread
+    def __enter__(self):
+        self.outer.append(useGlobals(self))
+        return self
+
+    def __exit__(self, *exception):
+        useGlobals(self.outer.pop())
+        return False
+
+    def __repr__(self):
+        return 'IOLabSession(' + repr(self.portName) + ', ' + repr(self.name) + ')'
+
+
+class IOLabProcessSession(IOLabSession):
+
+    def __init__(self, portName=None, name=None, analysis=None, decoders=1, **settings):
+        IOLabSession.__init__(self, portName, name, analysis, **settings)
+        self.decoders = decoders
+
+    #======================================
+    # starts the processes (see startProcesses()). Returns True if it worked.
+    def start(self):
+
+        self.running = True
+        with self:
+            return startProcesses(self.portName, self.decoders)
+
+    #======================================
+    # stops the remote and the processes (see stopProcesses())
+    def stop(self):
+
+        if self.processes is None or not self.running:
+            return
+        with self:
+            stopProcesses()
+
+    def __repr__(self):
+        return 'IOLabProcessSession(' + repr(self.portName) + ', ' + repr(self.name) + ', decoders=' + str(self.decoders) + ')'
+
+
+class IOLabSessionManager(object):
+
+    #======================================
+    # makes a session for each port in portNames (or for each dongle found if that is None),
+    # named after the port. analysis and settings are given to every session (see above)
+    def __init__(self, portNames=None, analysis=None, **settings):
+
+        if portNames is None:
+            portNames = getIOLabPortNames()
+
+        self.sessions = []
+        for portName in portNames:
+            name = os.path.basename(portName)
+            if name in [session.name for session in self.sessions]:
+                name += '_' + str(len(self.sessions))
+            self.sessions.append(IOLabSession(portName, name, analysis, **settings))
+
+    #======================================
+    # starts all of the sessions. Returns True if they all started.
+    def start(self):
+        return all(self.forEach(IOLabSession.start))
+
+    #======================================
+    # stops all of the sessions
+    def stop(self):
+        self.forEach(IOLabSession.stop)
+
+    #======================================
+    # calls function(*args, **kwargs) in every session (with G being that session),
+    # and returns a list of what they returned
+    def run(self, function, *args, **kwargs):
+        return self.forEach(lambda session: session.run(function, *args, **kwargs))
+
+    #======================================
+    # Calls method(session) for every session at the same time (each in its own thread,
+    # since most of them wait on their dongle), and returns a list of what they returned.
+    def forEach(self, method):
+
+        results = [None] * len(self.sessions)
+
+        def runOne(i):
+            results[i] = method(self.sessions[i])
+
+        threads = [Thread(target=runOne, args=(i,)) for i in range(len(self.sessions))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        return results
+
+    #======================================
+    # the read statistics (see G.readStats) added up over all of the sessions
+    def readStats(self):
+
+        totals = {}
+        for session in self.sessions:
+            for key, value in session.readStats.items():
+                if key == 'readSizes':
+                    sizes = totals.setdefault(key, {})
+                    for size, count in value.items():
+                        sizes[size] = sizes.get(size, 0) + count
+                elif key in ('reads', 'emptyReads', 'bytes'):
+                    totals[key] = totals.get(key, 0) + value
+                else:
+                    totals[key] = max(totals.get(key, 0), value)
+        return totals
+
+    def __len__(self):
+        return len(self.sessions)
+
+    def __getitem__(self, i):
+        return self.sessions[i]
+
+    def __iter__(self):
+        return iter(self.sessions)
+
+    def __repr__(self):
+        return 'IOLabSessionManager(' + repr([session.portName for session in self.sessions]) + ')'
@@ -9,12 +9,23 @@
 # system stuff
 import time
 import numpy as np
+from threading import Thread
 
 # local stuff
 from .analClass import AnalysisClass
-from .pyolabGlobals import G
+from .storeClass import ColumnStore
+from .recordClass import RecordList
+from .indexClass import RecordIndex, RecordIndexView
+from .captureClass import CaptureWriter
+from .pyolabGlobals import G, inSession, currentGlobals
 from .commMethods import *
 from .dataMethods import *
+from .captureMethods import *
+from .retentionMethods import applyRetention
+from .publishMethods import publishData, stopPublishing
+from .serverMethods import startServing, serveData, stopServing
+from .statsMethods import updateStats
+from .calibrationMethods import loadCalibrationCache, setupRemoteCalibration
 
 """
 These methods are focused on setting up the IOLab system, initializing the 
@@ -30,6 +41,10 @@ def setupGlobalVariables():
     # set up list of valid record types
     G.recTypeList = list(G.recTypeDict.keys())
 
+    # and a lookup table that is True for each valid record type (used by findRecords)
+    G.recTypeLUT = np.zeros(256, dtype=bool)
+    G.recTypeLUT[G.recTypeList] = True
+
     # initialize dictionary to go from command names to numbers
     for keyNum in G.cmdTypeDict:
         G.cmdTypeNumDict[G.cmdTypeDict[keyNum]] = keyNum
@@ -38,54 +53,92 @@ def setupGlobalVariables():
     for keyNum in G.recTypeDict:
         G.recTypeNumDict[G.recTypeDict[keyNum]] = keyNum
 
-    # dictionary that will hold data records received on serial port
+    # start with a clean slate (this matters if we are starting over, 
+    # for example when replaying a capture file)
+    G.dataBuffer.clear()
+    G.dataPointer = G.dataBuffer.writePos
+    G.nextData    = G.dataBuffer.writePos
+    G.nextRecord  = 0
+    G.nextFixedConfig  = 0
+    G.nextPacketConfig = 0
+    G.nextACK          = 0
+    G.retentionMarks = {}
+    G.remoteID = None
+
+    # the bytes of the records received on the serial port (numbered by stream offset), 
+    # and the dictionary of lists of records (see recordClass.py)
+    G.recordBytes = ColumnStore('uint8', size=G.bufferSize, base=G.dataBuffer.writePos)
     for recType in G.recTypeList:
-        G.recDict[recType] = []
+        G.recDict[recType] = RecordList(G.recordBytes)
+
+    # the index of all of the records in the order they arrived (see indexClass.py)
+    G.recordIndex = RecordIndex(G.recDict)
+    G.allRecList  = G.recordIndex
+    G.dataRecList = RecordIndexView(G.recordIndex, G.recType_dataFromRemote)
+    G.commRecList = RecordIndexView(G.recordIndex, G.recType_dataFromRemote, others=True)
 
-    # set up the of lists that will hold uncalibrated sensor data
-    sensorList = sensorName('SensorList')
-    for sensNum in sensorList:
-        G.uncalDataDict[sensNum] = []
+    # the decoding state and data of each remote (see remoteClass.py), starting 
+    # with remote 1 (the others are set up when we first hear from them)
+    G.remotes = {}
+    remoteStream(1)
 
 #===============================================
 # This starts up the pyolab software framework by:   
 #   1) setting up the serial port that the IOLab Dongle is plugged into
+#      (or the port called portName if one is given, for example an IOLabEmulator)
 #   2) launching asynchronous threads to read data and analyze data 
 # 
-def startItUp():
+def startItUp(portName=None):
 
     # open log file if needed
     if G.logData:
-        G.logFile = open('log.txt','w') # file opened in pwd
-    # open output file if needed
-    if G.dumpData:
-        G.outputFile = open('data.txt','w') # file opened in pwd
+        G.logFile = open(G.logFileName,'w') # file opened in pwd
+    # open output file if needed (the binary capture file is opened once the
+    # raw data buffer has been set up, see below)
+    if G.dumpData and G.dumpFormat == 'hex':
+        G.outputFile = open(G.hexFileName,'w') # file opened in pwd
 
     # Start by finding the serial port that the IOLab dongle is plugged into
-    portName = getIOLabPortName()
+    if portName is None:
+        portName = getIOLabPortName()
     
     # Open this port if one was found, otherwise quit. 
     if portName != '':
 
         G.serialPort = openIOLabPort(portName)
 
+        # create some useful global lists & dictionaries 
+        # (this has to happen before the threads start using them)
+        setupGlobalVariables()
+
+        # write the raw data to the capture file as they arrive
+        if G.dumpData and G.dumpFormat != 'hex':
+            G.captureWriter = CaptureWriter(G.captureFileName) # file opened in pwd
+            G.dataBuffer.addListener(G.captureWriter.add)
+
+        # let other programs subscribe to the data (if G.serverPath is set)
+        if G.serverPath is not None:
+            startServing()
+
         # create and launch a thread that gets data from the serial port
         # this will keep running until the global variable "G.running" is set to False
-        G.readThread = Thread(target=readDataThread)
+        # (the threads use the same globals as we do, see pyolabGlobals.py)
+        G.readThread = Thread(target=inSession(readDataThread))
         G.readThread.start()
 
         # create and launch a thread that analyzes data
         # this will keep running until the global variable "G.running" is set to False
-        G.analThread = Thread(target=analyzeDataThread)
+        G.analThread = Thread(target=inSession(analyzeDataThread))
         G.analThread.start()
 
-        # set up some more stuff that will be needed for analysis:
-
-        # create some useful global lists & dictionaries
-        setupGlobalVariables()
+        # set up the calibration constants for the remote, using the ones saved 
+        # last time if there are any (see calibrationMethods.py)
+        if G.calibrationFile is not None:
+            loadCalibrationCache()
+            setupRemoteCalibration(G.serialPort)
 
         # call the user code that is executed at the beginning of a job
-        AnalysisClass.handle.analStart()
+        userAnalysis().analStart()
 
         return True
 
@@ -108,6 +161,7 @@ def shutItDown():
 
     #signal that we want to quit
     G.running = False
+    G.dataBuffer.close()    # wakes up the analysis thread if it is waiting for data
     if G.logData:
         G.logFile.write("\nsignaling exit")
 
@@ -116,6 +170,8 @@ def shutItDown():
     G.analThread.join()
     if G.logData:
         G.logFile.write("\nall threads finished")
+    stopPublishing()
+    stopServing()
 
     if G.logData:
         G.logFile.write("\npower down remote 1")
@@ -124,98 +180,173 @@ def shutItDown():
     powerDown(G.serialPort,1)
 
 
+#===============================================
+# Returns the user's AnalysisClass (see analClass.py) that this session calls:
+# G.analysis if it is set, otherwise the last one created
+#
+def userAnalysis():
+
+    if G.analysis is not None:
+        return G.analysis
+    return AnalysisClass.handle
+
+
 #=========================================
 # This will run in a separate thread to read data from the serial port. 
 # It calls readData(), which does the actual work.
 #
+# If G.readMode is 'block' the thread waits on the serial port itself, so data 
+# is handed off as soon as it arrives and the thread sleeps while the remote is quiet. 
+# If G.readMode is 'poll' it checks for data every G.sleepTimeRead seconds.
+#
 def readDataThread():
 
     if G.logData:
-        G.logFile.write("\nIn readDataThread: " + str(G.sleepTimeRead))
-  
+        G.logFile.write("\nIn readDataThread: " + G.readMode + " " + str(G.sleepTimeRead))
+
+    if G.readMode == 'block':
+        # a blocking read returns after at most this long, which is also 
+        # how quickly the thread notices G.running going False
+        G.serialPort.timeout = G.readTimeout
+
     # keep looping as long as G.running is True
     while G.running:
-        newdata = readData()
-        G.dataList.extend(newdata)
-        time.sleep(G.sleepTimeRead)
+        if G.readMode == 'block':
+            readDataBlocking()
+        else:
+            readData()
+            time.sleep(G.sleepTimeRead)
 
     if G.logData:
         G.logFile.write("\nExiting readDataThread")
+        G.logFile.write("\nread statistics " + str(G.readStats))
 
 
 #======================================
-# Called by readDataThread, which means that this method
+# Called by readDataThread in 'poll' mode, which means that this method
 # is basically called several times per second to get incoming data from the
-# serial port.
+# serial port. The bytes go straight into G.dataBuffer (see bufferClass.py).
+# Returns the number of bytes read. 
 #
 def readData():
 
-    # This part loads raw serial data into a list. 
-    rawList = []
+    nRead = 0
     while G.serialPort.inWaiting() > 0:
         nwait = G.serialPort.inWaiting()
-        raw = G.serialPort.read(nwait)
-        rawList.append(raw)
+        n = G.dataBuffer.readFrom(G.serialPort, nwait)
+        recordRead(nwait, n)
+        nRead += n
+
+    return nRead
+
+
+#======================================
+# Called by readDataThread in 'block' mode. Asks the serial port for everything 
+# that is waiting, or G.readMinChunk bytes if that is more, and waits until they 
+# arrive or until G.readTimeout (the serial port timeout) runs out. 
+# Returns the number of bytes read. 
+#
+def readDataBlocking():
+
+    g = currentGlobals()
+
+    nwait = g.serialPort.inWaiting()
+    n = g.dataBuffer.readFrom(g.serialPort, max(nwait, g.readMinChunk))
+    recordRead(nwait, n)
+
+    return n
 
-        # since the pyserial input buffer seems to be limited to just over 1000 bytes, 
-        # send a warning if we are getting too close so we can reduce "sleepTime"
-        if nwait > 1000: 
-            if G.logData:
-                G.logFile.write("\n" + str(nwait) + ": careful with that buffer, Eugene")
 
-    # This part takes the raw data and turns in into a list of bytes. 
-    dList = []
-    while len(rawList) > 0:
-        for i in range(0,len(rawList[0])):
-            dList.append(rawList[0][i])   
-        del rawList[0]
+#======================================
+# Keeps track of how big the reads are and how full the buffers get (see G.readStats). 
+# nwait is the number of bytes that were waiting in the serial driver before the read 
+# and nRead is the number of bytes we got. If maxWaiting gets near the size of the driver 
+# buffer (just over 1000 bytes on some systems) we are in danger of losing data.
+#
+def recordRead(nwait, nRead):
+
+    g = currentGlobals()
+
+    stats = g.readStats
+    stats['reads'] += 1
+    stats['bytes'] += nRead
+    if nRead == 0:
+        stats['emptyReads'] += 1
+    else:
+        size = 1 << nRead.bit_length()
+        stats['readSizes'][size] = stats['readSizes'].get(size, 0) + 1
+        stats['largestRead'] = max(stats['largestRead'], nRead)
 
-    # Return the list of bytes
-    return dList
+    stats['maxWaiting'] = max(stats['maxWaiting'], nwait)
+    stats['maxUnread'] = max(stats['maxUnread'], len(g.dataBuffer))
+
+    # since the pyserial input buffer seems to be limited to just over 1000 bytes, 
+    # send a warning if we are getting too close so we can reduce "sleepTime"
+    if nwait > 1000: 
+        if g.logData:
+            g.logFile.write("\n" + str(nwait) + ": careful with that buffer, Eugene")
 
 
 #=========================================
 # This will run in a separate thread to analyze data
 # It calls analyzeData(), which does the actual work.
 #
+# The thread sleeps until readDataThread hands it new data (see waitForData() in
+# bufferClass.py). Once something arrives it waits up to G.analMaxWait seconds for 
+# at least G.analMinBytes bytes, so that data are analyzed in reasonable batches 
+# without much delay. 
+#
 def analyzeDataThread():
 
     if G.logData:
-        G.logFile.write("\nIn analyzeDataThread: " + str(G.sleepTimeAnal))
+        G.logFile.write("\nIn analyzeDataThread: " + str(G.analMinBytes) + " bytes / " + str(G.analMaxWait) + " sec")
 
     # keep looping as long as G.running is True
     while G.running:
+        G.dataBuffer.waitForData(G.dataPointer, G.analMinBytes, G.analMaxWait)
         newPointer = analyzeData()
         G.dataPointer = newPointer
-        time.sleep(G.sleepTimeAnal)
 
     if G.logData:
         G.logFile.write("\nExiting analyzeDataThread")
 
     # user code that is called at the end
-    AnalysisClass.handle.analEnd()
+    userAnalysis().analEnd()
 
-    if G.dumpData:
+    if G.outputFile is not None:
         G.outputFile.close()
+    if G.captureWriter is not None:
+        G.dataBuffer.removeListener(G.captureWriter.add)
+        G.captureWriter.close()
+        if G.logData:
+            G.logFile.write("\n" + str(G.captureWriter))
 
 #======================================================================
-# It is called by analyzeDataThread several times per second on a timer. 
-# Each time this method is called there may be new data present in dataList
+# It is called by analyzeDataThread whenever new data have arrived. 
+# Each time this method is called there may be new data present in G.dataBuffer
 # since this is filled asynchronously as data packets arrive to the serial port. 
 #
 def analyzeData():
 
+    g = currentGlobals()
+
     # for now just print the data to "outputfile". You should do something 
     # more interesting here (like actually analyzing data for example)
 
-    # dataLength is the length of the dataList "now"
+    # dataLength is the number of bytes received "now"
     # G.dataPointer was the value of dataLength the last time this was called,
     # which means that data between these two values is new.
-    dataLength = len(G.dataList)
-    if dataLength > G.dataPointer:
+    dataLength = g.dataBuffer.writePos
+    if dataLength > g.dataPointer:
+
+        # write data to the hex output file if the dumpData flag is set
+        # (this has to happen before findRecords() releases the bytes). 
+        # The binary capture file is written as the data arrive (see startItUp()).
+        if g.outputFile is not None:
+            g.outputFile.write(hexDump(g.dataBuffer.getBytes(g.dataPointer,dataLength)))
 
         # analyze the raw data stream and sort it into records. 
-        findRecords()
+        findRecords(dataLength)
 
         # look for a change in configuration
         findLastConfig()
@@ -223,15 +354,20 @@ def analyzeData():
         # extract sensor data information from the data records
         decodeDataPayloads()
 
+        # keep the statistics of each sensor up to date (if G.runningStats is True)
+        updateStats()
+
+        # let other programs see the new data (if G.publishName is set)
+        publishData()
+
+        # and hand them to the programs subscribed to them (if G.serverPath is set)
+        serveData()
+
         # call user analysis code
-        AnalysisClass.handle.analLoop()
-
-        # write data to an output file if the dumpData flag is set
-        if G.dumpData:
-            dataString = ''
-            for i in range(G.dataPointer,dataLength):
-                dataString += hex(G.dataList[i])[2:] + ' '
-            G.outputFile.write(dataString)
+        userAnalysis().analLoop()
+
+        # throw away old data if G.retention says so
+        applyRetention()
 
     return dataLength
 
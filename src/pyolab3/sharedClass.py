@@ -0,0 +1,522 @@
+#
+# This file is part of PyOLab. https://github.com/matsselen/pyolab
+# (C) 2017 Mats Selen <mats.selen@gmail.com>
+#
+# SPDX-License-Identifier:    BSD-3-Clause
+# (https://opensource.org/licenses/BSD-3-Clause)
+#
+
+# system stuff
+import os
+import time
+import weakref
+import numpy as np
+from multiprocessing import shared_memory, resource_tracker
+
+"""
+These are the containers used to hand data between processes when pyolab runs
+in multiprocess mode (see processMethods.py). Both live in shared memory
+(multiprocessing.shared_memory) and are found by name, and both have exactly
+one process writing to them. The writer never waits for anyone: when the
+storage is full the oldest data are simply written over, and a reader that
+has fallen that far behind finds out that it has lost them.
+
+A SharedRing holds the raw bytes read from the serial port. The reader process
+reads straight into it, and the decoder processes copy what they haven't seen
+yet into their own G.dataBuffer. Positions are stream offsets (the number of
+bytes written since the ring was made), like in bufferClass.py, and every read
+is recorded as a numbered chunk (seq, offset, length, time) so the decoders know
+when each byte arrived. It also keeps the read statistics of the reader process
+(the parts of G.readStats it can keep, see readStats()).
+
+A SharedColumn holds the decoded samples of one sensor (the numbers in
+uncalDataDict, or their times in timeDataDict) as they are published (see
+publishMethods.py). Its header holds the write cursor (the number of samples
+ever written) and the fixed configuration they were taken with. Other processes
+attach to it read-only and can use it like a ColumnStore (see storeClass.py):
+len(column) is the number of samples ever written, column.base the first one
+that is still there, and since(n) or data() return copies of them. view(n)
+gets them without copying, straight out of the shared memory.
+
+A SharedCatalog lists the columns published for one remote (so that readers can
+find them) along with the status of the remote (its fixed configuration, lost
+frames etc). 
+
+    ring = SharedRing('iolab_ring', 1 << 20, create=True)   # in one process
+    ring = SharedRing('iolab_ring')                         # in the others
+
+The process that made a container (create=True) doesn't own the memory any more
+than the others do: it is freed once unlink() has been called and every process
+has closed it. Processes that aren't started by the writer should attach with
+track=False (see sharedMemory()). Making a container with a name that is
+already taken raises FileExistsError, except for a SharedCatalog whose writer
+has finished, which is replaced along with its columns.
+
+"""
+
+# the slots of the header of a SharedRing
+ringWritePos   = 0   # stream offset of the next byte to be written
+ringClaim      = 1   # stream offset up to which the writer might be writing right now
+ringSeq        = 2   # number of chunks written so far
+ringSize       = 3   # bytes of storage
+ringHistory    = 4   # number of chunks remembered
+ringStats      = 5   # reads, emptyReads, largestRead, maxWaiting
+ringStatNames  = ['reads', 'emptyReads', 'largestRead', 'maxWaiting']
+ringReadSizes  = 16  # histogram of read sizes: slot ringReadSizes + b counts reads of 2**(b-1) to 2**b - 1 bytes
+ringSizeBins   = 48
+ringHeaderSize = 64  # int64s
+
+class SharedRing(object):
+
+    def __init__(self, name, size=0x100000, chunkHistory=4096, create=False):
+
+        nHeader = ringHeaderSize * 8
+        if create:
+            self.shm = sharedMemory(name, nHeader + chunkHistory * 24 + size)
+        else:
+            self.shm = sharedMemory(name)
+
+        self.header = np.ndarray((ringHeaderSize,), np.int64, self.shm.buf)
+        if create:
+            self.header[:] = 0
+            self.header[ringSize] = size
+            self.header[ringHistory] = chunkHistory
+
+        self.name = name
+        self.size = int(self.header[ringSize])
+        self.chunkHistory = int(self.header[ringHistory])
+        self.chunks = np.ndarray((self.chunkHistory, 3), np.int64, self.shm.buf, nHeader)  # offset, length, time
+        self.view = self.shm.buf[nHeader + self.chunkHistory * 24:nHeader + self.chunkHistory * 24 + self.size]
+
+    @property
+    def writePos(self):
+        return int(self.header[ringWritePos])
+
+    #======================================
+    # read up to n bytes from the serial port "port" directly into the ring (never more
+    # than fit before the end of the storage, the next read carries on from the start).
+    # nwait is the number of bytes that were waiting in the serial driver (for the
+    # statistics). Returns the number of bytes read. Only the writer may call this.
+    def readFrom(self, port, n, nwait=0):
+
+        pos = int(self.header[ringWritePos])
+        i = pos % self.size
+        n = max(min(n, self.size - i), 1)
+
+        # readers mustn't trust anything this might be writing over
+        self.header[ringClaim] = pos + n
+        mv = self.view[i:i + n]
+        try:
+            nRead = port.readinto(mv) or 0
+        finally:
+            mv.release()
+
+        self._commit(pos, nRead)
+
+        header = self.header
+        header[ringStats] += 1
+        if nRead == 0:
+            header[ringStats + 1] += 1
+        else:
+            header[ringReadSizes + min(nRead.bit_length(), ringSizeBins - 1)] += 1
+        header[ringStats + 2] = max(header[ringStats + 2], nRead)
+        header[ringStats + 3] = max(header[ringStats + 3], nwait)
+        return nRead
+
+    #======================================
+    # copy the bytes in "data" to the ring. Only the writer may call this.
+    def write(self, data):
+
+        data = memoryview(data).cast('B')
+        pos = int(self.header[ringWritePos])
+        done = 0
+        while done < len(data):
+            i = (pos + done) % self.size
+            n = min(len(data) - done, self.size - i)
+            self.header[ringClaim] = pos + done + n
+            self.view[i:i + n] = data[done:done + n]
+            done += n
+        self._commit(pos, len(data))
+        return len(data)
+
+    #======================================
+    # account for n new bytes at stream offset pos (the chunk is only counted once
+    # the write position has moved, so a reader who sees a chunk can read its bytes)
+    def _commit(self, pos, n):
+
+        if n > 0:
+            seq = int(self.header[ringSeq]) + 1
+            self.chunks[seq % self.chunkHistory] = (pos, n, time.monotonic_ns())
+            self.header[ringWritePos] = pos + n
+            self.header[ringSeq] = seq
+        self.header[ringClaim] = pos + n
+
+    #======================================
+    # returns (start, data) where "data" is a bytes copy of what is in the ring
+    # between stream offsets start and stop, and start is where it really starts
+    # (later than asked for if the bytes before it have been written over)
+    def read(self, start, stop):
+
+        stop = min(stop, int(self.header[ringWritePos]))
+        start = max(start, stop - self.size)
+        if stop <= start:
+            return stop, b''
+
+        i = start % self.size
+        j = i + stop - start
+        if j <= self.size:
+            data = bytes(self.view[i:j])
+        else:
+            data = bytes(self.view[i:]) + bytes(self.view[:j - self.size])
+
+        # throw away anything the writer might have got to while we were copying
+        first = max(start, int(self.header[ringClaim]) - self.size)
+        if first > start:
+            return first, data[first - start:]
+        return start, data
+
+    #======================================
+    # returns a list of (seq, offset, length, time) for the chunks after number "seq"
+    # (only the most recent chunkHistory chunks are remembered)
+    def chunksSince(self, seq):
+
+        last = int(self.header[ringSeq])
+        first = max(seq + 1, last - self.chunkHistory + 1)
+        if last < first:
+            return []
+
+        numbers = np.arange(first, last + 1)
+        rows = self.chunks[numbers % self.chunkHistory].tolist()
+
+        # the writer could have reused some of the slots while we were copying
+        keep = numbers > int(self.header[ringSeq]) + 1 - self.chunkHistory
+        return [(s, r[0], r[1], r[2]) for s, r, k in zip(numbers.tolist(), rows, keep.tolist()) if k]
+
+    #======================================
+    # the read statistics kept by readFrom() (see G.readStats), plus the number of bytes
+    def readStats(self):
+
+        stats = dict(zip(ringStatNames, self.header[ringStats:ringStats + len(ringStatNames)].tolist()))
+        stats['bytes'] = self.writePos
+        sizes = self.header[ringReadSizes:ringReadSizes + ringSizeBins].tolist()
+        stats['readSizes'] = dict([(1 << b, n) for b, n in enumerate(sizes) if n > 0])
+        return stats
+
+    #======================================
+    # stop using the ring (in this process), and free the memory once everyone has
+    def close(self):
+
+        self.view.release()
+        self.header = self.chunks = None
+        self.shm.close()
+
+    def unlink(self):
+        unlinkShared(self.shm)
+
+    def __repr__(self):
+        return 'SharedRing(' + repr(self.name) + ', size=' + str(self.size) + ', writePos=' + str(self.writePos) + ')'
+
+
+# the slots of the header of a SharedColumn (the numpy dtype is written after them)
+columnCount      = 0   # number of samples ever written (the write cursor)
+columnClaim      = 1   # number of samples there will be once the write going on is done
+columnCapacity   = 2   # number of samples that fit
+columnWidth      = 3   # numbers per sample
+columnConfig     = 4   # the fixed configuration of the remote when the last sample was written
+columnStart      = 5   # the number of the first sample (if it didn't start at 0)
+columnHeaderSize = 6   # int64s (bytes 48-63 hold the dtype, as a string like '<i2')
+
+class SharedColumn(object):
+
+    def __init__(self, name, dtype=None, width=1, capacity=0x40000, base=0, create=False, track=True):
+
+        if create:
+            dtype = np.dtype(dtype)
+            self.shm = sharedMemory(name, 64 + capacity * width * dtype.itemsize)
+        else:
+            self.shm = sharedMemory(name, track=track)
+
+        # The header, the samples and every view handed out are views of this one
+        # array, so the memory is closed (in this process) once it is gone: when the
+        # column has been closed and the last of those views has been dropped. (It
+        # holds on to the memory through a memoryview of its own, that is let go of
+        # before the SharedMemory is closed. Views still left when the process exits
+        # just go with it.)
+        memory = np.frombuffer(self.shm.buf, np.uint8)
+        weakref.finalize(memory.base, self.shm.close).atexit = False
+        if create:
+            memory[:columnHeaderSize * 8].view(np.int64)[:] = (base, base, capacity, width, 0, base)
+            memory[48:64] = np.frombuffer(dtype.str.encode().ljust(16, b'\0'), np.uint8)
+
+        self.name     = name
+        self.header   = memory[:columnHeaderSize * 8].view(np.int64)
+        self.capacity = int(self.header[columnCapacity])
+        self.width    = int(self.header[columnWidth])
+        self.dtype    = np.dtype(memory[48:64].tobytes().rstrip(b'\0').decode())
+        self.start    = int(self.header[columnStart])
+
+        shape = (self.capacity, self.width) if self.width > 1 else (self.capacity,)
+        self.buf = memory[64:64 + self.capacity * self.width * self.dtype.itemsize].view(self.dtype).reshape(shape)
+        if not create:
+            self.buf.flags.writeable = False
+
+    #======================================
+    # add the samples in "chunk" to the end of the column (only the last "capacity" of
+    # them if there are more), taken with fixed configuration "config" if it is given.
+    # Only the writer may call this.
+    def append(self, chunk, config=None):
+
+        chunk = np.asarray(chunk, dtype=self.dtype)
+        count = int(self.header[columnCount])
+        nNew = len(chunk)
+        if nNew > self.capacity:
+            chunk = chunk[nNew - self.capacity:]
+        n = len(chunk)
+
+        # readers mustn't trust the samples this is about to write over
+        self.header[columnClaim] = count + nNew
+        i = (count + nNew - n) % self.capacity
+        first = min(n, self.capacity - i)
+        self.buf[i:i + first] = chunk[:first]
+        self.buf[:n - first] = chunk[first:]
+        if config is not None:
+            self.header[columnConfig] = config
+        self.header[columnCount] = count + nNew
+
+    @property
+    def config(self):
+        return int(self.header[columnConfig])
+
+    #======================================
+    # Returns (first, rows) where rows is a view (no copying) of the samples starting 
+    # with sample number "first" (or the oldest one still there if that is later) up 
+    # to sample stop-1 (or the newest one), or up to the end of the storage if they
+    # go around it (in which case asking again for the ones after these gets the rest).
+    # The writer carries on writing into the same memory, so once you are done with
+    # the samples check that overwritten(first) is still False.
+    def view(self, first, stop=None):
+
+        count = int(self.header[columnCount])
+        if stop is not None:
+            count = min(count, stop)
+        first = max(first, int(self.header[columnClaim]) - self.capacity, self.start)
+        if count <= first:
+            return first, self.buf[:0]
+        i = first % self.capacity
+        return first, self.buf[i:min(i + count - first, self.capacity)]
+
+    # True if the writer could have written over sample number "first" (or later ones)
+    def overwritten(self, first):
+        return int(self.header[columnClaim]) - self.capacity > first
+
+    #======================================
+    # the same things a ColumnStore has (the samples are copies, see above)
+    @property
+    def base(self):
+        return max(int(self.header[columnCount]) - self.capacity, self.start)
+
+    def __len__(self):
+        return int(self.header[columnCount])
+
+    def data(self):
+        return self.since(0)
+
+    #======================================
+    # returns a copy of the samples starting with sample number "first"
+    # (skipping the ones that have been written over)
+    def since(self, first):
+
+        count = int(self.header[columnCount])
+        first = max(first, count - self.capacity, self.start)
+        i = first % self.capacity
+        j = i + max(count - first, 0)
+        if j <= self.capacity:
+            rows = self.buf[i:j].copy()
+        else:
+            rows = np.concatenate((self.buf[i:], self.buf[:j - self.capacity]))
+
+        # drop the ones the writer might have got to while we were copying
+        lost = int(self.header[columnClaim]) - self.capacity - first
+        if lost > 0:
+            rows = rows[lost:]
+        return rows
+
+    def __getitem__(self, i):
+        count = len(self)
+        if isinstance(i, slice):
+            first, last, step = i.indices(count)
+            if first < self.base:
+                raise IndexError('sample ' + str(first) + ' has been written over')
+            return self.since(first)[:max(last - first, 0):step]
+        if i < 0:
+            i += count
+        if i >= count:
+            raise IndexError('sample ' + str(i) + ' is out of range')
+        if i < self.base:
+            raise IndexError('sample ' + str(i) + ' has been written over')
+        return self.buf[i % self.capacity].tolist()
+
+    def __iter__(self):
+        return iter(self.data().tolist())
+
+    def tolist(self):
+        return self.data().tolist()
+
+    #======================================
+    # stop using the column (in this process), and free the memory once everyone has
+    # (views of it that are still around keep it until they are dropped, see __init__)
+    def close(self):
+
+        self.buf = self.header = None
+
+    def unlink(self):
+        unlinkShared(self.shm)
+
+    def __repr__(self):
+        return 'SharedColumn(' + repr(self.name) + ', ' + str(self.dtype) + ', width=' + str(self.width) + ', n=' + str(len(self)) + ')'
+
+
+# the slots of the header of a SharedCatalog (followed by its entries)
+catalogCount     = 0   # number of columns
+catalogWriter    = 1   # process ID of the writer
+catalogDone      = 2   # 1 once the writer has stopped
+catalogStatus    = 3   # the slots from here on hold the status (see catalogStatusNames)
+catalogStatusNames = ['lastFixedConfig', 'lostFrames', 'lastFrameCount', 'lastFrameTime']
+catalogHeaderSize = 16  # int64s
+catalogKinds = ['uncal', 'time']
+
+class SharedCatalog(object):
+
+    def __init__(self, name, maxColumns=256, create=False, track=True):
+
+        if create:
+            size = (catalogHeaderSize + 2 * maxColumns) * 8
+            try:
+                self.shm = sharedMemory(name, size)
+            except FileExistsError:
+                # a catalog (and the columns in it) left over by a writer that has
+                # stopped is replaced, but not one that is still being written
+                old = SharedCatalog(name)
+                try:
+                    if not old.done:
+                        raise FileExistsError(repr(name) + ' is being published by process ' + str(old.writer) +
+                                              ' (if that has gone away, unlink it with SharedCatalog(' + repr(name) + ').unlink())')
+                    for kind, sensor in old.columns():
+                        unlinkName(old.columnName(kind, sensor))
+                    old.unlink()
+                finally:
+                    old.close()
+                self.shm = sharedMemory(name, size)
+        else:
+            self.shm = sharedMemory(name, track=track)
+
+        self.name = name
+        self.header = np.ndarray((catalogHeaderSize,), np.int64, self.shm.buf)
+        self.entries = np.ndarray(((self.shm.size // 8 - catalogHeaderSize) // 2, 2), np.int64, self.shm.buf, catalogHeaderSize * 8)
+        if create:
+            self.header[:] = 0
+            self.header[catalogWriter] = os.getpid()
+            self.header[catalogStatus + 2] = -1
+
+    #======================================
+    # the name of the SharedColumn holding the samples of "sensor" ('uncal') or their times ('time')
+    def columnName(self, kind, sensor):
+        return self.name + '_' + kind[0] + str(sensor)
+
+    #======================================
+    # adds the column for "sensor" of kind 'uncal' or 'time' to the list
+    # (once it has been made). Only the writer may call this.
+    def add(self, kind, sensor):
+
+        n = int(self.header[catalogCount])
+        self.entries[n] = (catalogKinds.index(kind), sensor)
+        self.header[catalogCount] = n + 1
+
+    # returns a list of (kind, sensor) of the columns from number "first" on
+    def columns(self, first=0):
+        n = int(self.header[catalogCount])
+        return [(catalogKinds[k], s) for k, s in self.entries[first:n].tolist()]
+
+    def __len__(self):
+        return int(self.header[catalogCount])
+
+    #======================================
+    # the status of the remote (the variables in catalogStatusNames). 
+    # Only the writer may call setStatus().
+    def setStatus(self, lastFixedConfig, lostFrames, lastFrameCount, lastFrameTime):
+        self.header[catalogStatus:catalogStatus + 4] = (lastFixedConfig, lostFrames, 
+                                                        -1 if lastFrameCount is None else lastFrameCount, lastFrameTime)
+
+    def status(self):
+        status = dict(zip(catalogStatusNames, self.header[catalogStatus:catalogStatus + 4].tolist()))
+        if status['lastFrameCount'] < 0:
+            status['lastFrameCount'] = None
+        return status
+
+    #======================================
+    # the writer says it has stopped (done is True from then on)
+    def finish(self):
+        self.header[catalogDone] = 1
+
+    @property
+    def done(self):
+        return bool(self.header[catalogDone])
+
+    @property
+    def writer(self):
+        return int(self.header[catalogWriter])
+
+    def close(self):
+
+        self.header = self.entries = None
+        self.shm.close()
+
+    def unlink(self):
+        unlinkShared(self.shm)
+
+    def __repr__(self):
+        return 'SharedCatalog(' + repr(self.name) + ', columns=' + str(len(self)) + ')'
+
+
+#======================================
+# Makes the shared memory called "name" (size bytes, raising FileExistsError if
+# there already is some by that name), or opens it if size is 0.
+# Memory opened with track=False isn't handed to the resource tracker of this 
+# process (which would otherwise free it when this process exits, taking it away
+# from everyone else). The tracker only remembers each name once, so memory this
+# process made or opened with track=True stays with it (a reader in the same
+# process as the writer mustn't take the writer's memory away from the tracker).
+def sharedMemory(name, size=0, track=True):
+
+    if size > 0:
+        shm = shared_memory.SharedMemory(name, True, size)
+        trackedNames.add(shm._name)
+        return shm
+
+    shm = shared_memory.SharedMemory(name)
+    if track:
+        trackedNames.add(shm._name)
+    elif shm._name not in trackedNames:
+        resource_tracker.unregister(shm._name, 'shared_memory')
+    return shm
+
+# the names of the shared memory the resource tracker of this process looks after
+trackedNames = set()
+
+#======================================
+# Frees the shared memory "shm" once everyone has closed it (and takes it away
+# from the resource tracker, see sharedMemory())
+def unlinkShared(shm):
+
+    trackedNames.discard(shm._name)
+    shm.unlink()
+
+# the same for the shared memory called "name", if there is any
+def unlinkName(name):
+
+    try:
+        shm = sharedMemory(name)
+    except FileNotFoundError:
+        return
+    shm.close()
+    unlinkShared(shm)
@@ -0,0 +1,263 @@
+#
+# This file is part of PyOLab. https://github.com/matsselen/pyolab
+# (C) 2017 Mats Selen <mats.selen@gmail.com>
+#
+# SPDX-License-Identifier:    BSD-3-Clause
+# (https://opensource.org/licenses/BSD-3-Clause)
+#
+
+# system stuff
+import time
+import numpy as np
+
+"""
+These classes keep statistics of the samples of a sensor as they are decoded
+(see statsMethods.py), so that nobody has to go over the samples again to get
+them. Each chunk of samples is summarized with a handful of numpy reductions,
+and the summaries are combined the way Welford's method does it (Chan's formula
+for merging two sets of samples), so the variance stays accurate however many
+samples there are. Looking at the statistics costs nothing.
+
+RunningStats holds count, mean, var (the variance, like np.var), std, rms, min
+and max, each with one number per axis of the sensor (or a single number for
+sensors that only have one).
+
+WindowStats keeps the same statistics for the samples taken in the last "window"
+seconds. The time is cut into nBuckets buckets per window, each with its own
+statistics, and whenever samples are added the buckets still in the window are
+combined (all at once), so the window moves in steps of window/nBuckets seconds.
+It also moves when nothing is added: looking at the statistics at time "now"
+leaves out the buckets that have gone out of the window by then, so a sensor
+that stops sending ends up with an empty window rather than its last one.
+
+SensorStats holds both for one sensor: the statistics of all of the samples
+(its own count, mean etc) and those of each of its windows, at the time now
+(the time of the newest sample plus however long ago it was added).
+
+    stats = G.statsDict[1]          # the accelerometer of remote 1
+    stats.mean                      # [x, y, z] averaged over every sample so far
+    stats.window(1.0).rms           # [x, y, z] RMS of the last second
+
+"""
+
+class RunningStats(object):
+
+    def __init__(self, width=1):
+        self.width = width
+        self.n     = 0
+        self.mu    = np.zeros(width)
+        self.m2    = np.zeros(width)          # sum of the squared differences from the mean
+        self.sumSq = np.zeros(width)
+        self.low   = np.full(width, np.inf)
+        self.high  = np.full(width, -np.inf)
+
+    #======================================
+    # adds a chunk of samples (one row per sample)
+    def add(self, samples):
+
+        x = np.asarray(samples, np.float64).reshape(-1, self.width)
+        n = len(x)
+        if n == 0:
+            return
+        mu = x.mean(0)
+        self.combine(n, mu, ((x - mu)**2).sum(0), (x * x).sum(0), x.min(0), x.max(0))
+
+    # adds the statistics of another RunningStats
+    def merge(self, other):
+        if other.n > 0:
+            self.combine(other.n, other.mu, other.m2, other.sumSq, other.low, other.high)
+
+    # Chan's formula for the mean and m2 of two sets of samples put together
+    def combine(self, n, mu, m2, sumSq, low, high):
+
+        total = self.n + n
+        delta = mu - self.mu
+        self.mu = self.mu + delta * (n / total)
+        self.m2 = self.m2 + m2 + delta * delta * (self.n * n / total)
+        self.n = total
+        self.sumSq = self.sumSq + sumSq
+        self.low = np.minimum(self.low, low)
+        self.high = np.maximum(self.high, high)
+
+    #======================================
+    # the statistics (arrays with one number per axis, or a number if there is only one)
+    def value(self, v):
+        if self.n == 0:
+            v = np.full(self.width, np.nan)
+        return v[0] if self.width == 1 else v
+
+    @property
+    def count(self):
+        return self.n
+
+    @property
+    def mean(self):
+        return self.value(self.mu)
+
+    @property
+    def var(self):
+        return self.value(self.m2 / max(self.n, 1))
+
+    @property
+    def std(self):
+        return self.value(np.sqrt(self.m2 / max(self.n, 1)))
+
+    @property
+    def rms(self):
+        return self.value(np.sqrt(self.sumSq / max(self.n, 1)))
+
+    @property
+    def min(self):
+        return self.value(self.low)
+
+    @property
+    def max(self):
+        return self.value(self.high)
+
+    def __repr__(self):
+        return 'RunningStats(count=' + str(self.n) + ', mean=' + str(self.mean) + ', std=' + str(self.std) + ')'
+
+#======================================================================
+# the statistics of the last "window" seconds
+#
+class WindowStats(object):
+
+    def __init__(self, width=1, window=1.0, nBuckets=20):
+        self.width = width
+        self.window = window
+        self.nBuckets = nBuckets
+        self.bucketWidth = window / nBuckets
+
+        # the buckets are kept in slot (bucket number % nBuckets), where the bucket
+        # number is the time of its samples / bucketWidth
+        self.ids   = np.full(nBuckets, np.iinfo(np.int64).min)
+        self.n     = np.zeros(nBuckets)
+        self.mu    = np.zeros((nBuckets, width))
+        self.m2    = np.zeros((nBuckets, width))
+        self.sumSq = np.zeros((nBuckets, width))
+        self.low   = np.zeros((nBuckets, width))
+        self.high  = np.zeros((nBuckets, width))
+
+        self.newest = None                # the bucket number of the newest sample
+        self.end = None                   # the last bucket of the window self.stats is of
+        self.stats = RunningStats(width)  # what is in the window
+
+    #======================================
+    # adds a chunk of samples taken at "times" (in order, as in G.timeDataDict)
+    def add(self, samples, times):
+
+        if len(times) == 0:
+            return
+        x = np.asarray(samples, np.float64).reshape(-1, self.width)
+        bucket = np.floor(np.asarray(times) / self.bucketWidth).astype(np.int64)
+        last = int(bucket[-1])
+
+        # only the samples of the last nBuckets buckets matter
+        keep = int(np.searchsorted(bucket, last - self.nBuckets, 'right'))
+        x, bucket = x[keep:], bucket[keep:]
+
+        # the samples of each bucket the chunk touches are next to each other
+        starts = np.concatenate(([0], np.flatnonzero(np.diff(bucket)) + 1))
+        counts = np.diff(np.append(starts, len(x))).astype(np.float64)
+        means  = np.add.reduceat(x, starts) / counts[:, None]
+        m2s    = np.add.reduceat((x - np.repeat(means, counts.astype(np.int64), axis=0))**2, starts)
+        sumSqs = np.add.reduceat(x * x, starts)
+        lows   = np.minimum.reduceat(x, starts)
+        highs  = np.maximum.reduceat(x, starts)
+
+        # empty the slots of buckets that have left the window
+        ids = bucket[starts]
+        slots = ids % self.nBuckets
+        stale = self.ids[slots] != ids
+        if stale.any():
+            s = slots[stale]
+            self.ids[s] = ids[stale]
+            self.n[s] = 0
+            self.mu[s] = self.m2[s] = self.sumSq[s] = 0
+            self.low[s] = np.inf
+            self.high[s] = -np.inf
+
+        # and add the new samples to their buckets (Chan's formula, like RunningStats)
+        n = self.n[slots]
+        total = n + counts
+        delta = means - self.mu[slots]
+        self.mu[slots] += delta * (counts / total)[:, None]
+        self.m2[slots] += m2s + delta * delta * (n * counts / total)[:, None]
+        self.n[slots] = total
+        self.sumSq[slots] += sumSqs
+        self.low[slots] = np.minimum(self.low[slots], lows)
+        self.high[slots] = np.maximum(self.high[slots], highs)
+
+        self.newest = last
+        self.combine(self.newest)
+
+    #======================================
+    # the statistics of the window at time "now" (seconds, like the times of
+    # the samples), or at the time of the newest sample if that is later
+    def at(self, now):
+
+        if now is not None and self.newest is not None:
+            end = max(int(np.floor(now / self.bucketWidth)), self.newest)
+            if end != self.end:
+                self.combine(end)
+        return self.stats
+
+    # put the buckets that are in the window ending with bucket number "end" together
+    def combine(self, end):
+
+        self.end = end
+        inWindow = (self.ids > end - self.nBuckets) & (self.n > 0)
+        stats = RunningStats(self.width)
+        if inWindow.any():
+            n = self.n[inWindow]
+            mu = self.mu[inWindow]
+            stats.n = int(n.sum())
+            stats.mu = (n[:, None] * mu).sum(0) / stats.n
+            stats.m2 = (self.m2[inWindow] + n[:, None] * (mu - stats.mu)**2).sum(0)
+            stats.sumSq = self.sumSq[inWindow].sum(0)
+            stats.low = self.low[inWindow].min(0)
+            stats.high = self.high[inWindow].max(0)
+        self.stats = stats
+
+    def __repr__(self):
+        return 'WindowStats(' + str(self.window) + ' s, ' + repr(self.stats) + ')'
+
+#======================================================================
+# The statistics of one sensor: its own are those of every sample so far,
+# and window(seconds) has those of the last few seconds.
+#
+class SensorStats(RunningStats):
+
+    def __init__(self, width=1, windows=(), nBuckets=20):
+        RunningStats.__init__(self, width)
+        self.windows = {}
+        for seconds in windows:
+            self.windows[seconds] = WindowStats(width, seconds, nBuckets)
+        self.next = 0             # the sample number of the next sample to add (see updateStats())
+        self.lastTime = None      # the time of the newest sample (seconds, like G.timeDataDict)
+        self.lastAdded = None     # and when it was added (time.monotonic())
+
+    #======================================
+    # adds the chunk of samples taken at "times", starting with sample number "first"
+    def addChunk(self, samples, times, first):
+        samples = np.asarray(samples, np.float64)
+        self.add(samples)
+        for window in self.windows.values():
+            window.add(samples, times)
+        self.next = first + len(times)
+        if len(times) > 0:
+            self.lastTime = float(times[-1])
+            self.lastAdded = time.monotonic()
+
+    # the time now, on the clock of the samples
+    def now(self):
+        if self.lastTime is None:
+            return None
+        return self.lastTime + (time.monotonic() - self.lastAdded)
+
+    # the statistics of the window that is "seconds" long, at time "now" (or now() if it isn't given)
+    def window(self, seconds, now=None):
+        return self.windows[seconds].at(self.now() if now is None else now)
+
+    def __repr__(self):
+        return 'SensorStats(count=' + str(self.n) + ', mean=' + str(self.mean) + ', windows=' + str(sorted(self.windows)) + ')'
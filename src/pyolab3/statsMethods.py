@@ -0,0 +1,59 @@
+#
+# This file is part of PyOLab. https://github.com/matsselen/pyolab
+# (C) 2017 Mats Selen <mats.selen@gmail.com>
+#
+# SPDX-License-Identifier:    BSD-3-Clause
+# (https://opensource.org/licenses/BSD-3-Clause)
+#
+
+# local stuff
+from .pyolabGlobals import G
+from .statsClass import SensorStats
+
+"""
+These methods keep running statistics of every sensor (count, mean, variance,
+min, max and RMS of each axis) as the samples are decoded, so analysis code can
+just look them up instead of going over the samples every time it is called.
+They are kept when G.runningStats is True:
+
+    G.runningStats = True
+    G.statsWindows = [1.0]          # also keep them for the last second
+    startItUp()
+
+and then, in analLoop() for example,
+
+    G.statsDict[21].mean            # the average of all of the A7 samples so far
+    G.statsDict[21].window(1.0).mean   # and of the ones from the last second
+    G.statsDict[1].window(1.0).std  # [x, y, z] of the accelerometer
+
+G.statsDict has a SensorStats (see statsClass.py) for each sensor that has sent
+samples, keyed by sensor number (each remote has its own, see remoteClass.py).
+They are the statistics of the uncalibrated samples in G.uncalDataDict, and the
+windows go by the times in G.timeDataDict.
+
+"""
+
+#======================================
+# Adds the samples decoded since the last time to the statistics of their
+# sensors (called by analyzeData() in setupMethods.py)
+#
+def updateStats():
+
+    if not G.runningStats:
+        return
+
+    for remote in G.remotes.values():
+        for sensor, store in remote.uncalDataDict.items():
+            times = remote.timeDataDict[sensor]
+            nDone = min(len(store), len(times))
+
+            stats = remote.statsDict.get(sensor)
+            if stats is None:
+                if nDone == 0:
+                    continue
+                stats = SensorStats(store.width, G.statsWindows, G.statsBuckets)
+                remote.statsDict[sensor] = stats
+
+            if nDone > stats.next:
+                first = max(stats.next, store.base, times.base)
+                stats.addChunk(store.since(first)[:nDone - first], times.since(first)[:nDone - first], first)
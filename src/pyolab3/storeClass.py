@@ -0,0 +1,195 @@
+#
+# This file is part of PyOLab. https://github.com/matsselen/pyolab
+# (C) 2017 Mats Selen <mats.selen@gmail.com>
+#
+# SPDX-License-Identifier:    BSD-3-Clause
+# (https://opensource.org/licenses/BSD-3-Clause)
+#
+
+# system stuff
+import numpy as np
+
+"""
+This is the container used to store decoded data, for example the
+uncalibrated sensor data in G.uncalDataDict.
+
+Each store holds samples of a single numpy type ("dtype"), with "width"
+numbers per sample (3 for the accelerometer, 1 for an analog input, etc).
+The samples are kept in one numpy array that is bigger than it needs to be,
+and when it fills up it is replaced by one twice as big, so adding data
+costs the same on average no matter how big the store gets.
+
+The fast way to get at the data is with:
+
+    store.data()      all of the samples held in memory
+    store.since(n)    the samples starting with sample n
+
+These return numpy views (no copying), with one row per sample if width > 1.
+A view keeps showing the samples that were there when it was made, even after
+more samples are added.
+
+The store can also be used like the lists that were used before (len(store),
+store[i], for x in store), in which case you get plain python numbers or lists.
+
+Old samples can be thrown away with discard() to keep the memory use bounded
+(see retentionMethods.py). Samples keep their numbers when this happens: 
+len(store) is still the number of samples ever added and store[i] is still 
+sample i, so counters like "the last sample I looked at" stay valid. The first 
+sample still held in memory is number store.base. (Samples can also be numbered
+from something other than 0 by giving "base" when the store is made, in which case
+len(store) is the number the next sample will get.) If spill() has been called 
+the samples that are thrown away are written to a file first, and reading them
+(store[i], store[i:j] or since()) gets them from there. Otherwise asking for a 
+sample that is gone raises an IndexError, and since() skips them.
+
+The samples are usually added by one thread while others look at them, so where
+they are (buf, start, n and base) is kept in the single tuple "state" that is
+replaced all at once, and a reader always gets a buffer and positions that go
+together.
+
+"""
+
+class ColumnStore(object):
+
+    def __init__(self, dtype, width=1, size=1024, base=0):
+        self.dtype = np.dtype(dtype)
+        self.width = width
+        self.state = (np.empty(self._shape(size), dtype=self.dtype), 0, 0, base)
+        self.spillName = None # file that discarded samples are written to
+
+    def _shape(self, size):
+        if self.width > 1:
+            return (size, self.width)
+        return (size,)
+
+    # (see state above)
+    @property
+    def buf(self):
+        return self.state[0]    # the storage
+
+    @property
+    def start(self):
+        return self.state[1]    # where the samples start in buf
+
+    @property
+    def n(self):
+        return self.state[2]    # number of samples held in memory
+
+    @property
+    def base(self):
+        return self.state[3]    # the number of the first sample held in memory
+
+    #======================================
+    # add the samples in "chunk" (anything numpy can turn into an array
+    # with one row per sample) to the end of the store
+    def append(self, chunk):
+
+        chunk = np.asarray(chunk, dtype=self.dtype).reshape(self._shape(-1))
+        nNew = len(chunk)
+        buf, start, n, base = self.state
+        if start + n + nNew > len(buf):
+            # the new buffer is at least 1.5 times as big as what goes in it, so the copying
+            # averages out even when old samples are being discarded as fast as new ones come
+            size = max(len(buf), 1)
+            while (n + nNew) * 3 > size * 2:
+                size *= 2
+            newBuf = np.empty(self._shape(size), dtype=self.dtype)
+            newBuf[:n] = buf[start:start + n]
+            buf, start = newBuf, 0
+
+        buf[start + n:start + n + nNew] = chunk
+        self.state = (buf, start, n + nNew, base)
+
+    #======================================
+    # returns a view of all of the samples held in memory
+    def data(self):
+        buf, start, n, base = self.state
+        return buf[start:start + n]
+
+    #======================================
+    # returns the samples starting with sample number "first" (a view, unless 
+    # some of them have to be read back from the spill file)
+    def since(self, first):
+        buf, start, n, base = self.state
+        if first < base and self.spillName is not None:
+            return self._rows(first, base + n)
+        return buf[start + max(first - base, 0):start + n]
+
+    #======================================
+    # throw away the samples before sample number "upTo" 
+    # (writing them to the spill file if there is one)
+    def discard(self, upTo):
+
+        buf, start, n, base = self.state
+        k = min(upTo - base, n)
+        if k <= 0:
+            return
+
+        if self.spillName is not None:
+            with open(self.spillName, 'ab') as f:
+                buf[start:start + k].tofile(f)
+
+        self.state = (buf, start + k, n - k, base + k)
+
+    #======================================
+    # write samples to file "fileName" when they are discarded
+    # (anything already in the file is lost)
+    def spill(self, fileName):
+        open(fileName, 'wb').close()
+        self.spillName = fileName
+        self.spillBase = self.base  # the number of the first sample in the file
+
+    #======================================
+    # returns samples first to last-1 as a numpy array, reading the
+    # ones that are no longer in memory from the spill file
+    def _rows(self, first, last):
+
+        buf, start, n, base = self.state
+        parts = []
+        if first < base:
+            if self.spillName is None or first < self.spillBase:
+                raise IndexError('sample ' + str(first) + ' has been discarded')
+            nRows = min(last, base) - first
+            rowSize = self.dtype.itemsize * self.width
+            rows = np.fromfile(self.spillName, dtype=self.dtype, count=nRows * self.width,
+                               offset=(first - self.spillBase) * rowSize)
+            parts.append(rows.reshape(self._shape(-1)))
+            first = base
+
+        if last > first or len(parts) == 0:
+            parts.append(buf[start + first - base:start + max(first, last) - base])
+
+        if len(parts) == 1:
+            return parts[0]
+        return np.concatenate(parts)
+
+    #======================================
+    # list-like access (with sample numbers that don't change when 
+    # old samples are discarded)
+    def __len__(self):
+        state = self.state
+        return state[3] + state[2]
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            first, last, step = i.indices(len(self))
+            if step < 0:
+                return self._rows(0, len(self))[i]
+            return self._rows(first, max(first, last))[::step]
+        buf, start, n, base = self.state
+        if i < 0:
+            i += base + n
+        if i >= base + n:
+            raise IndexError('sample ' + str(i) + ' is out of range')
+        if i >= base:
+            return buf[start + i - base].tolist()
+        return self._rows(i, i + 1)[0].tolist()
+
+    def __iter__(self):
+        return iter(self.data().tolist())
+
+    def tolist(self):
+        return self.data().tolist()
+
+    def __repr__(self):
+        return 'ColumnStore(' + str(self.dtype) + ', width=' + str(self.width) + ', n=' + str(len(self)) + ', base=' + str(self.base) + ')'
@@ -0,0 +1,181 @@
+#
+# This file is part of PyOLab. https://github.com/matsselen/pyolab
+# (C) 2017 Mats Selen <mats.selen@gmail.com>
+#
+# SPDX-License-Identifier:    BSD-3-Clause
+# (https://opensource.org/licenses/BSD-3-Clause)
+#
+
+# system stuff
+import numpy as np
+
+# local stuff
+from .pyolabGlobals import G
+from .calibrationMethods import sensorRate
+
+"""
+These methods work out when each sensor sample was taken, for G.timeDataDict
+(see pyolabGlobals.py). They are called by decodeDataPayloads() in dataMethods.py
+for all of the records it decodes at once.
+
+The remote sends one dataFromRemote record every frame (G.framePeriod = 10 ms),
+and each record carries the frame number in a single byte that wraps from 255
+to 0. unwrapFrames() turns these into a frame count that doesn't wrap, starting
+at 0 with the first record decoded. Each remote has its own count (it is kept in 
+its RemoteStream, see remoteClass.py). Frames that never arrived leave gaps in the
+count, and if 256 or more frames in a row are lost (so that the byte comes back
+around) the time between the arrival of the records is used to tell how many
+times it wrapped. The remote starts counting over when its configuration is
+changed or data are started (see findLastConfig() in dataMethods.py), so the 
+first record after that follows on from the one before by however long it 
+took to arrive, rather than by the difference of their frame bytes.
+
+The samples from a sensor in a record were taken during the frame, so the last
+one is given the time of the end of the frame and the ones before it are spaced by
+1/rate (the sensor's rate in the fixed configuration the record was taken with, see 
+configName() and remote.configStarts), or spread evenly over the frame if the rate 
+isn't known. Times are in seconds
+(float64), with 0 being the start of the first frame decoded.
+
+"""
+
+#======================================
+# Returns the frame counts (int64) for records from "remote" (a RemoteStream) with frame 
+# bytes "frames" (numpy array) that arrived at "times" (time.monotonic_ns(), see 
+# recordArrivalTimes()) and start at stream offsets "offsets", following on from the 
+# last record decoded. Also returns the number of frames lost before each. 
+# (This doesn't change anything - see commitFrames())
+#
+def unwrapFrames(frames, times, remote, offsets):
+
+    frames = frames.astype(np.int64)
+    times = np.asarray(times, dtype=np.int64)
+    nRec = len(frames)
+
+    # frames since the record before, assuming the byte wrapped at most once (1 to 256)
+    before = np.concatenate(([remote.lastFrame], frames[:-1]))
+    delta = (frames - before - 1) % 256 + 1
+
+    # A long gap between the arrival of two records means the byte may have gone around
+    # more than once. Records that arrive together (in the same read) were waiting to be
+    # read rather than being sent late, so they don't count as part of the gap.
+    # (there can't be such a gap if all of them arrived within 128 frames of the last one)
+    if (times[-1] - remote.lastFrameTime) * 1e-9 > 128 * G.framePeriod:
+        timeBefore = np.concatenate(([remote.lastFrameTime], times[:-1]))
+        together = np.searchsorted(times, times, 'right') - np.arange(nRec)
+        gap = (times - timeBefore) * (1e-9 / G.framePeriod) - (together - 1)
+        delta += 256 * np.maximum(np.rint((gap - delta) / 256), 0).astype(np.int64)
+
+    lost = delta - 1
+
+    # the first record after the remote started counting over comes however many 
+    # frames after the one before it took to arrive (and none of them were lost)
+    if len(remote.restarts) > 0:
+        first = np.unique(np.searchsorted(offsets, remote.restarts))
+        first = first[first < nRec]
+        if len(first) > 0:
+            timeBefore = np.where(first > 0, times[first - 1], remote.lastFrameTime)
+            gap = np.rint((times[first] - timeBefore) * (1e-9 / G.framePeriod)).astype(np.int64)
+            delta[first] = np.maximum(gap, 1)
+            lost[first] = 0
+
+    if remote.lastFrameCount is None:
+        delta[0] = 1                # the first record decoded is frame 0
+        lost[0] = 0
+        counts = np.cumsum(delta) - 1
+    else:
+        counts = remote.lastFrameCount + np.cumsum(delta)
+
+    return counts, lost
+
+#======================================
+# remembers where the frame count of "remote" is after the records that were decoded
+# (the last of which starts at stream offset "last")
+#
+def commitFrames(counts, lost, times, remote, last):
+
+    remote.lastFrameCount = int(counts[-1])
+    remote.lastFrameTime = int(times[-1])
+    remote.lostFrames += int(lost.sum())
+    remote.restarts = [offset for offset in remote.restarts if offset > last]
+
+    if G.logData:
+        where = "" if remote.remote == 1 else " from remote " + str(remote.remote)
+        for j in np.flatnonzero(lost > 0).tolist():
+            G.logFile.write("\nlost " + str(lost[j]) + " frames before frame " + str(counts[j]) + where)
+
+#======================================
+# Returns the arrival times of the records starting at stream offsets "offsets"
+# (from G.recordIndex if they are still there, otherwise from G.dataBuffer)
+#
+def recordArrivalTimes(offsets):
+
+    index = G.recordIndex.data()
+    if len(index) > 0 and offsets[0] >= index['offset'][0]:
+        which = np.searchsorted(index['offset'], offsets)
+        return index['time'][np.minimum(which, len(index) - 1)]
+    return G.dataBuffer.arrivalTimes(offsets)
+
+#======================================
+# Returns the time of each sample in a set of records, given the frame count of the
+# record each sample came from, the number of samples in each of these records, and
+# the time between samples (1/rate) in each (numpy arrays with one entry per record).
+# The samples from a record go in a row, ending at the end of its frame (any that
+# would be before the start of the first frame are put at its start).
+#
+def sampleTimes(frameCounts, nSamples, spacing):
+
+    # sample i of the lot is (ends[r] - 1 - i) samples before the end of its record r
+    # (and frame n ends at (n + 1) frame periods)
+    ends = np.cumsum(nSamples)
+    times = (np.repeat((frameCounts + 1) * G.framePeriod - (ends - 1) * spacing, nSamples) +
+             np.arange(ends[-1] if len(ends) > 0 else 0) * np.repeat(spacing, nSamples))
+    return np.maximum(times, 0.0)
+
+#======================================
+# Returns the rate of "sensor" (NaN if it isn't known) in each of the new records from
+# "remote", which hold counts[j] samples each: the rate in the fixed configuration
+# the samples were taken with (see placeConfigChanges() in dataMethods.py)
+#
+def recordRates(sensor, counts, remote):
+
+    starts = remote.configStarts.get(sensor, [])
+    if len(starts) == 0:
+        return np.full(len(counts), sensorRate(sensor, np.nan, remote.lastFixedConfig), dtype=np.float64)
+
+    # the number of the first sample of each record, and the configuration it started in
+    # (samples from before the first start have no configuration, the last rate below)
+    first = len(remote.timeDataDict[sensor]) + np.cumsum(counts) - counts
+    which = np.searchsorted([start for start, config in starts], first, 'right') - 1
+    rates = np.array([sensorRate(sensor, np.nan, config) for start, config in starts] + [np.nan], dtype=np.float64)
+    return rates[which]
+
+#======================================
+# Adds the times of the new samples from "remote" to its timeDataDict, for all of the 
+# sensors in "sampleCounts" at once. sampleCounts[sensor] has the number of samples from 
+# each of the new records, and frameCounts has their frame counts (numpy arrays).
+#
+def addSampleTimes(sampleCounts, frameCounts, remote):
+
+    timeDataDict = remote.timeDataDict
+    sensors = [sensor for sensor in sampleCounts if sensor in timeDataDict]
+    if len(sensors) == 0:
+        return
+
+    # all of the sensors one after the other
+    nRec = len(frameCounts)
+    nSamples = np.concatenate([sampleCounts[sensor] for sensor in sensors])
+
+    # the time between samples for each of the records: 1/rate, or spread over 
+    # the frame if the rate isn't known
+    spacing = 1.0 / np.concatenate([recordRates(sensor, sampleCounts[sensor], remote) for sensor in sensors])
+    unknown = np.isnan(spacing)
+    if unknown.any():
+        spacing[unknown] = G.framePeriod / np.maximum(nSamples[unknown], 1)
+
+    times = sampleTimes(np.tile(frameCounts, len(sensors)), nSamples, spacing)
+
+    # hand them out
+    ends = np.cumsum(nSamples.reshape(len(sensors), nRec).sum(axis=1)).tolist()
+    for sensor, first, last in zip(sensors, [0] + ends[:-1], ends):
+        timeDataDict[sensor].append(times[first:last])
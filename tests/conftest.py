@@ -0,0 +1,71 @@
+#
+# This file is part of PyOLab. https://github.com/matsselen/pyolab
+# (C) 2017 Mats Selen <mats.selen@gmail.com>
+#
+# SPDX-License-Identifier:    BSD-3-Clause
+# (https://opensource.org/licenses/BSD-3-Clause)
+#
+
+# system stuff
+import os
+import time
+import pytest
+from concurrent.futures import wait
+
+# local stuff
+from pyolab3.pyolabGlobals import G
+from pyolab3.analClass import AnalysisClass
+from pyolab3.commMethods import setFixedConfig, getFixedConfig, getPacketConfig, startData, stopData
+
+"""
+Things the tests share. Every test runs in its own empty directory (so the log,
+capture and calibration files go there), and most of them take data from an
+IOLabEmulator, so they only run on Linux & macOS (they are skipped elsewhere).
+
+"""
+
+# the emulator module, or a skipped test if there are no ptys here
+def emulatorClass():
+    if not hasattr(os, 'openpty'):
+        pytest.skip('the IOLab emulator needs a pty')
+    return pytest.importorskip('pyolab3.emulatorClass')
+
+@pytest.fixture(autouse=True)
+def inTmpDir(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+@pytest.fixture
+def emulator():
+    emulator = emulatorClass().IOLabEmulator(seed=1)
+    yield emulator
+    emulator.close()
+
+# an AnalysisClass that counts how many times analLoop() is called
+@pytest.fixture
+def analysis():
+    calls = {'start': 0, 'loop': 0, 'end': 0}
+    def count(what):
+        def called():
+            calls[what] += 1
+        return called
+    analysis = AnalysisClass(count('start'), count('end'), count('loop'))
+    analysis.calls = calls
+    return analysis
+
+#======================================
+# Starts "session" (unless start is False because it already has been), takes
+# data in fixed configuration "config" for "seconds" and stops it again
+#
+def acquire(session, config, seconds, start=True):
+
+    if start:
+        assert session.start()
+    with session:
+        wait([setFixedConfig(G.serialPort, config, 1), getFixedConfig(G.serialPort, 1),
+              getPacketConfig(G.serialPort, 1), startData(G.serialPort)])
+    time.sleep(seconds)
+    with session:
+        stopData(G.serialPort).result()
+    time.sleep(0.1)
+    session.stop()
@@ -0,0 +1,96 @@
+#
+# This file is part of PyOLab. https://github.com/matsselen/pyolab
+# (C) 2017 Mats Selen <mats.selen@gmail.com>
+#
+# SPDX-License-Identifier:    BSD-3-Clause
+# (https://opensource.org/licenses/BSD-3-Clause)
+#
+
+# system stuff
+import numpy as np
+import pytest
+
+# local stuff
+from pyolab3.pyolabGlobals import G
+from pyolab3.iolabInfo import configDict
+from pyolab3.sessionClass import IOLabSession
+from pyolab3.setupMethods import setupGlobalVariables
+from pyolab3.dataMethods import findRecords, findLastConfig, decodeDataPayloads
+
+#======================================
+# Returns the records the emulator would send: its answers to getFixedConfig
+# and getPacketConfig for fixed configuration "config", followed by the data
+# records of nFrames frames (the emulator isn't started, its records are just kept)
+#
+def emulatorRecords(emulator, config, nFrames):
+
+    records = []
+    emulator.send = lambda data: records.append(bytes(data))
+    emulator.setConfig(config)
+    emulator.answer(0x27, [1])
+    emulator.answer(0x28, [1])
+    for frame in range(nFrames):
+        emulator.sendFrame()
+    return records
+
+# a data record with the last sensor left out (so it isn't laid out like the
+# packet configuration says, but can still be decoded)
+def irregular(rec):
+    nSens = rec[6]
+    i = 7
+    for k in range(nSens - 1):
+        i += 2 + rec[i + 1]
+    body = rec[3:6] + bytes([nSens - 1]) + rec[7:i] + rec[-2:-1]
+    return bytes([0x02, 0x41, len(body)]) + body + b'\x0a'
+
+# the same record from remote 2 (byte 3 is the remote number)
+def fromRemote2(rec):
+    return rec[:3] + b'\x02' + rec[4:]
+
+#======================================
+# Decodes "records" in a session of its own, "perPass" records at a time, like
+# analyzeData() does. The arrival times are made up, so two runs give
+# the same sample times.
+#
+def decode(records, batchDecode, perPass=40):
+
+    session = IOLabSession(None, logData=False, batchDecode=batchDecode)
+    with session:
+        setupGlobalVariables()
+        for i in range(0, len(records), perPass):
+            G.dataBuffer.write(b''.join(records[i:i + perPass]), i * 1000000)
+            findRecords(G.dataBuffer.writePos)
+            findLastConfig()
+            decodeDataPayloads()
+    return session
+
+#======================================
+# decoding runs of regular records in one go gives exactly what decoding them
+# one at a time does, for every fixed configuration, and also when the runs are
+# broken up by an irregular record, a record from remote 2 or a new configuration
+#
+@pytest.mark.parametrize('config', sorted(configDict))
+def test_batch_matches_records(emulator, config):
+
+    other = 1 if config != 1 else 38
+    records = emulatorRecords(emulator, config, 100)
+    records.insert(2, fromRemote2(records[1]))      # remote 2 has the same packet configuration
+    records.insert(30, irregular(records[30]))
+    records.insert(50, fromRemote2(records[50]))
+    records.insert(70, records[70])                 # the same frame twice
+    records += emulatorRecords(emulator, other, 60)
+
+    batch = decode(records, True)
+    single = decode(records, False)
+
+    assert sorted(batch.remotes) == sorted(single.remotes) == [1, 2]
+    nSamples = 0
+    for number, remote in batch.remotes.items():
+        for sensor, store in remote.uncalDataDict.items():
+            assert np.array_equal(store.data(), single.remotes[number].uncalDataDict[sensor].data())
+            assert np.array_equal(remote.timeDataDict[sensor].data(), single.remotes[number].timeDataDict[sensor].data())
+            nSamples += len(store)
+        for name in ('lastFrame', 'lastRF', 'lastFrameCount', 'lostFrames'):
+            assert getattr(remote, name) == getattr(single.remotes[number], name)
+    assert batch.remotes[1].lastFixedConfig == other
+    assert nSamples > 0
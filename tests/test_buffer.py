@@ -0,0 +1,135 @@
+#
+# This file is part of PyOLab. https://github.com/matsselen/pyolab
+# (C) 2017 Mats Selen <mats.selen@gmail.com>
+#
+# SPDX-License-Identifier:    BSD-3-Clause
+# (https://opensource.org/licenses/BSD-3-Clause)
+#
+
+# system stuff
+import time
+import numpy as np
+from threading import Thread
+
+# local stuff
+from pyolab3.bufferClass import RingBuffer
+
+#======================================
+# writing past the end of the storage slides the unread bytes back to the
+# front, and the stream offsets stay the same
+#
+def test_wrap_around():
+
+    ring = RingBuffer(64)
+    stream = bytes(range(256)) * 4
+    pos = 0
+    for i in range(0, len(stream), 24):
+        ring.write(stream[i:i + 24])
+        assert ring.getBytes(pos, ring.writePos) == stream[pos:ring.writePos]
+        pos = ring.writePos - 10            # leave the last 10 bytes unread
+        ring.consume(pos)
+        assert ring.peek() == (pos, stream[pos:ring.writePos])
+
+    assert len(ring.buf) == 64
+    assert ring.writePos == len(stream)
+    assert len(ring) == 10
+
+#======================================
+# a reader that falls behind doesn't lose bytes (the storage grows rather than
+# writing over them), but bytes it has let go of are gone, and chunks older than
+# the history show up as a gap in the chunk numbers
+#
+def test_reader_behind():
+
+    ring = RingBuffer(64, chunkHistory=8)
+    stream = bytes(range(200))
+    for i in range(0, len(stream), 10):
+        ring.write(stream[i:i + 10], 1000 + i)
+
+    assert len(ring.buf) >= 200
+    assert ring.peek() == (0, stream)
+
+    ring.consume(150)
+    assert ring.getBytes(100, 170) == stream[150:170]
+    assert ring.peek(180) == (150, stream[150:180])
+
+    # chunks 1 to 12 have been forgotten, which the reader can tell from the numbers
+    chunks = ring.chunksSince(0)
+    assert [c[0] for c in chunks] == list(range(13, 21))
+    assert [c[1] for c in chunks] == list(range(120, 200, 10))
+
+#======================================
+# each byte gets the time of the chunk it came in, and bytes older than the
+# chunk history get the time of the oldest chunk still remembered
+#
+def test_arrival_times():
+
+    ring = RingBuffer(64, chunkHistory=4)
+    for i in range(6):
+        ring.write(bytes(10), 1000 * (i + 1))
+
+    assert ring.arrivalTimes(np.array([30, 35, 39, 40, 59])).tolist() == [4000, 4000, 4000, 5000, 6000]
+    assert ring.arrivalTimes(np.array([0, 15, 25, 45])).tolist() == [3000, 3000, 3000, 5000]
+
+    ring.clear()
+    t = ring.arrivalTimes(np.array([60]))
+    assert t.dtype == np.int64 and t[0] > 6000        # (nothing remembered: now)
+
+#======================================
+# listeners see every chunk, and keep seeing them after the buffer is cleared
+#
+def test_listeners_kept_across_clear():
+
+    ring = RingBuffer(64)
+    seen = []
+    listener = lambda chunk, data: seen.append((chunk[1], data))
+    ring.addListener(listener)
+
+    ring.write(b'abc', 1)
+    ring.clear()
+    ring.write(b'de', 2)
+    assert seen == [(0, b'abc'), (3, b'de')]
+    assert ring.peek() == (3, b'de')
+
+    ring.removeListener(listener)
+    ring.write(b'f', 3)
+    assert len(seen) == 2
+
+#======================================
+# waitForData() wakes up as soon as a write gets the batch to minBytes, gives
+# up after "timeout" if nothing comes, and returns right away once closed
+#
+def test_wait_for_data():
+
+    ring = RingBuffer(64)
+
+    def writeLater(pieces):
+        for piece in pieces:
+            time.sleep(0.05)
+            ring.write(piece)
+
+    # woken by the second write (well before maxWait is up)
+    writer = Thread(target=writeLater, args=([b'ab', b'cdef'],))
+    writer.start()
+    start = time.monotonic()
+    assert ring.waitForData(0, minBytes=5, maxWait=5.0, timeout=5.0) == 6
+    assert time.monotonic() - start < 2.0
+    writer.join()
+
+    # nothing comes
+    start = time.monotonic()
+    assert ring.waitForData(6, timeout=0.1) == 6
+    assert 0.1 <= time.monotonic() - start < 2.0
+
+    # something comes, but not minBytes of it: it is handed over after maxWait
+    writer = Thread(target=writeLater, args=([b'g'],))
+    writer.start()
+    start = time.monotonic()
+    assert ring.waitForData(6, minBytes=10, maxWait=0.1, timeout=5.0) == 7
+    assert time.monotonic() - start < 2.0
+    writer.join()
+
+    ring.close()
+    start = time.monotonic()
+    assert ring.waitForData(7, timeout=5.0) == 7
+    assert time.monotonic() - start < 1.0
@@ -0,0 +1,118 @@
+#
+# This file is part of PyOLab. https://github.com/matsselen/pyolab
+# (C) 2017 Mats Selen <mats.selen@gmail.com>
+#
+# SPDX-License-Identifier:    BSD-3-Clause
+# (https://opensource.org/licenses/BSD-3-Clause)
+#
+
+# system stuff
+import numpy as np
+
+# local stuff
+from pyolab3.pyolabGlobals import G
+from pyolab3.sessionClass import IOLabSession
+from pyolab3.setupMethods import setupGlobalVariables
+from pyolab3.dataMethods import findRecords, findLastConfig, decodeDataPayloads
+from pyolab3.calibrationMethods import sessionCalibrator, useFactoryCalibration, setCalibration
+
+from test_batch import emulatorRecords
+
+#======================================
+# The barometer the way Documentation/old_csharp_code.cs does it
+# (CalculateCalibrationConstants() and Pressure())
+#
+def int16(word):
+    return word - 0x10000 if word > 0x7FFF else word
+
+def sign(x):
+    return (x > 0) - (x < 0)
+
+def oldPressure(rawA0, rawB1, rawB2, rawC12, Padc, Tadc):
+
+    absA0, absB1, absB2 = abs(int16(rawA0)), abs(int16(rawB1)), abs(int16(rawB2))
+    absC12 = abs(int16(rawC12 >> 2))
+    calA0 = sign(int16(rawA0)) * ((absA0 >> 3) + (absA0 & 0x7) / 2.0**3)
+    calB1 = sign(int16(rawB1)) * ((absB1 >> 13) + (absB1 & 0x1FFF) / 2.0**13)
+    calB2 = sign(int16(rawB2)) * ((absB2 >> 14) + (absB2 & 0x3FFF) / 2.0**14)
+    calC12 = sign(int16(rawC12)) * (absC12 & 0x1FFF) / 2.0**22
+
+    pComp = calA0 + (calB1 + calC12 * Tadc) * Padc + calB2 * Tadc
+    return 50 + pComp * (115 - 50) / 1023
+
+#======================================
+# the calibrated samples are what the old code worked out from the same numbers
+#
+def test_calibration_matches_old_code():
+
+    rng = np.random.default_rng(5)
+    with IOLabSession(None, logData=False):
+        setupGlobalVariables()
+
+        raw = rng.integers(-32768, 32768, (100, 3))
+        for sensor, countsPerUnit, countsOffset in ((1, [8206, 8116, 8162], [38, 0, -53]),
+                                                    (2, [573, 591, 558], [-569, -388, -1283]),
+                                                    (3, [938.7] * 3, [-20, 230, -80])):
+            old = [[(r[i] - countsOffset[i]) / countsPerUnit[i] for i in range(3)] for r in raw.tolist()]
+            assert np.allclose(sessionCalibrator(sensor).calibrate(raw), old, 1e-12, 0)
+
+        counts = rng.integers(0, 4096, 100)
+        assert np.allclose(sessionCalibrator(11).calibrate(counts), counts / 682.5, 1e-12, 0)
+        assert np.allclose(sessionCalibrator(21).calibrate(counts, 8), counts / (4095 // 3), 1e-12, 0)
+
+        # the barometer, with the constants of the first unit and with the ones the emulator has
+        words = rng.integers(0, 0x10000, (100, 2))
+        for calBytes in (None, [0x44, 0x23, 0x2d, 0x63, 0xbc, 0x5a, 0xfa, 0xb8]):
+            if calBytes is not None:
+                assert useFactoryCalibration(4, calBytes)
+            rawA0, rawB1, rawB2, rawC12 = [0x4422, 0xad63, 0xbcda, 0x3ab8] if calBytes is None else \
+                                          [(calBytes[i] << 8) + calBytes[i + 1] for i in range(0, 8, 2)]
+            cal = sessionCalibrator(4).calibrate(words)
+            old = [oldPressure(rawA0, rawB1, rawB2, rawC12, (P >> 6) & 0x3FF, (T >> 6) & 0x3FF) for P, T in words.tolist()]
+            assert np.allclose(cal[:, 0], old, 1e-12, 0)
+            assert np.allclose(cal[:, 1], (((words[:, 1] >> 6) & 0x3FF) - 605.75) / -5.35, 1e-12, 0)
+
+        # the thermometer (the sum of 8 ADC readings in the Ambient configuration)
+        sums = rng.integers(8 * 1900, 8 * 2600, 100)
+        for cal30, cal85 in ((2041, 2426), (0x07f9, 0x097a)):
+            assert useFactoryCalibration(26, [cal85 >> 8, cal85 & 0xFF, cal30 >> 8, cal30 & 0xFF])
+            old = 30 + (sums * 50 / 400 - cal30) * (85 - 30) / (cal85 - cal30)
+            assert np.allclose(sessionCalibrator(26).calibrate(sums, 6), old, 1e-12, 0)
+
+#======================================
+# samples are calibrated with the configuration they were taken with, and only once,
+# even if the configuration changes before they are looked at
+#
+def test_calibration_follows_config(emulator):
+
+    records = [emulatorRecords(emulator, config, 60) for config in (8, 12, 8)]
+    with IOLabSession(None, logData=False):
+        setupGlobalVariables()
+
+        def decode(records):
+            G.dataBuffer.write(b''.join(records))
+            findRecords(G.dataBuffer.writePos)
+            findLastConfig()
+            decodeDataPayloads()
+
+        decode(records[0])
+        first = G.calDataDict[21].data().copy()
+        store = G.calDataDict[21].store
+        assert len(first) > 0
+        decode(records[1] + records[2])          # the last change comes before any of these are looked at
+
+        raw = G.uncalDataDict[21].data()
+        starts = [first for first, config in G.remotes[1].configStarts[21]]
+        assert [config for first, config in G.remotes[1].configStarts[21]] == [8, 12, 8]
+        assert starts[0] == 0 and starts[1] == len(first) and starts[2] < len(raw)
+        fullScale = np.repeat([3.0, 3.3, 3.0], np.diff(starts + [len(raw)]))
+        assert np.allclose(G.calDataDict[21].data(), raw * fullScale / 4095, 1e-12, 0)
+        assert np.array_equal(G.calDataDict[21].data()[:len(first)], first)
+        assert G.calDataDict[21].store is store      # the new ones were just added
+
+        # changing the constants calibrates everything again, still with the right configurations
+        setCalibration(1, countsOffset=[0, 0, 0])
+        assert len(G.calDataDict[21]) == len(raw) and G.calDataDict[21].store is store
+        setCalibration(21)
+        assert np.allclose(G.calDataDict[21].data(), raw * fullScale / 4095, 1e-12, 0)
+        assert G.calDataDict[21].store is not store
@@ -0,0 +1,108 @@
+#
+# This file is part of PyOLab. https://github.com/matsselen/pyolab
+# (C) 2017 Mats Selen <mats.selen@gmail.com>
+#
+# SPDX-License-Identifier:    BSD-3-Clause
+# (https://opensource.org/licenses/BSD-3-Clause)
+#
+
+# system stuff
+import os
+import json
+
+# local stuff
+from pyolab3.pyolabGlobals import G
+from pyolab3.sessionClass import IOLabSession
+from pyolab3.calibrationMethods import sessionCalibrator, setCalibration
+
+#======================================
+# Starts a session on the emulator with the calibration file "fileName", and
+# returns it (stopped) along with the commands the emulator was sent before it was
+# stopped. "then" is called inside the session while it is running.
+#
+def calibrate(emulator, analysis, fileName, then=None):
+
+    commands = []
+    answer = emulator.answer
+    def recordAnswer(command, payload):
+        commands.append(command)
+        answer(command, payload)
+    emulator.answer = recordAnswer
+
+    session = IOLabSession(emulator.portName, analysis=analysis, calibrationFile=fileName)
+    assert session.start()
+    with session:
+        if then is not None:
+            then()
+    sent = list(commands)
+    session.stop()
+    emulator.answer = answer
+    return session, sent
+
+def readFile(fileName):
+    with open(fileName) as f:
+        return json.load(f)
+
+#======================================
+# no file is written (and nothing is asked) unless G.calibrationFile is set
+#
+def test_calibration_file_off(emulator, analysis):
+
+    session, commands = calibrate(emulator, analysis, None)
+    assert commands == [] and session.remoteID is None
+    assert os.listdir('.') == [os.path.basename(session.logFileName)]
+
+#======================================
+# the constants read from the remote are saved under its ID and firmware, and
+# only read again when the firmware changes
+#
+def test_calibration_cache(emulator, analysis):
+
+    # nothing saved yet: ask the remote
+    session, commands = calibrate(emulator, analysis, 'calibration.json')
+    assert commands == [G.recType_getDongleStatus, G.recType_getRemoteStatus] + [G.recType_getCalibration] * 2
+    saved = readFile('calibration.json')
+    assert list(saved) == ['000001']
+    assert saved['000001'] == {'firmware': [256, 256], 'user': {},
+                               'factory': {'4': [0x44, 0x22, 0xad, 0x63, 0xbc, 0xda, 0x3a, 0xb8], 
+                                           '26': [0x09, 0x7a, 0x07, 0xf9]}}
+    with session:
+        assert (sessionCalibrator(26).params['cal30'], sessionCalibrator(26).params['cal85']) == (0x07f9, 0x097a)
+
+    # saved: just find out which remote it is (and leave the other remotes alone)
+    saved['00abcd'] = {'firmware': [1, 1], 'factory': {'26': [0, 1, 0, 2]}, 'user': {}}
+    saved['000001']['factory']['26'] = [0x09, 0x80, 0x07, 0xf0]
+    with open('calibration.json', 'w') as f:
+        json.dump(saved, f)
+    session, commands = calibrate(emulator, analysis, 'calibration.json')
+    assert commands == [G.recType_getDongleStatus, G.recType_getRemoteStatus]
+    with session:
+        assert (sessionCalibrator(26).params['cal30'], sessionCalibrator(26).params['cal85']) == (0x07f0, 0x0980)
+
+    # new firmware: ask again (but keep what the user measured)
+    saved['000001']['firmware'] = [256, 255]
+    saved['000001']['user'] = {'8': {'countsOffset': 2059}}
+    with open('calibration.json', 'w') as f:
+        json.dump(saved, f)
+    session, commands = calibrate(emulator, analysis, 'calibration.json')
+    assert commands.count(G.recType_getCalibration) == 2
+    again = readFile('calibration.json')
+    assert again['000001']['firmware'] == [256, 256]
+    assert again['000001']['factory']['26'] == [0x09, 0x7a, 0x07, 0xf9]
+    assert again['000001']['user'] == {'8': {'countsOffset': 2059}}
+    assert again['00abcd'] == saved['00abcd']
+
+#======================================
+# what the user sets is saved, and used by the next session with the same remote
+#
+def test_calibration_round_trip(emulator, analysis):
+
+    calibrate(emulator, analysis, 'calibration.json', lambda: setCalibration(8, countsOffset=2059, countsPerUnit=-118))
+    assert readFile('calibration.json')['000001']['user'] == {'8': {'countsOffset': 2059, 'countsPerUnit': -118}}
+
+    session, commands = calibrate(emulator, analysis, 'calibration.json')
+    with session:
+        force = sessionCalibrator(8)
+        assert (force.countsOffset, force.countsPerUnit) == (2059, -118)
+        assert force.calibrate([2059 - 118]).tolist() == [1.0]
+    assert G.recType_getCalibration not in commands
@@ -0,0 +1,28 @@
+#
+# This file is part of PyOLab. https://github.com/matsselen/pyolab
+# (C) 2017 Mats Selen <mats.selen@gmail.com>
+#
+# SPDX-License-Identifier:    BSD-3-Clause
+# (https://opensource.org/licenses/BSD-3-Clause)
+#
+
+# local stuff
+from pyolab3.sessionClass import IOLabSession
+from pyolab3.captureMethods import readCapture
+
+from conftest import acquire
+
+#======================================
+# what startItUp() writes to the capture file is what was read from the port
+#
+def test_capture_round_trip(emulator, analysis):
+
+    session = IOLabSession(emulator.portName, analysis=analysis, dumpData=True)
+    acquire(session, 38, 1.0)
+
+    chunks = list(readCapture(session.captureFileName))
+    data = b''.join([chunk for seq, t, chunk in chunks])
+    assert len(data) == session.readStats['bytes'] > 0
+    seqs = [seq for seq, t, chunk in chunks]
+    assert seqs == list(range(seqs[0], seqs[0] + len(chunks)))
+    assert data.count(b'\x02\x41') >= emulator.stats['records']
@@ -0,0 +1,138 @@
+#
+# This file is part of PyOLab. https://github.com/matsselen/pyolab
+# (C) 2017 Mats Selen <mats.selen@gmail.com>
+#
+# SPDX-License-Identifier:    BSD-3-Clause
+# (https://opensource.org/licenses/BSD-3-Clause)
+#
+
+# system stuff
+import time
+import pytest
+from threading import current_thread
+
+# local stuff
+from pyolab3.pyolabGlobals import G
+from pyolab3.sessionClass import IOLabSession
+from pyolab3.commMethods import issueCommand, resolveCommand, setFixedConfig, getFixedConfig, getPacketConfig
+
+# a serial port that keeps what is written to it
+class WrittenPort(object):
+    def __init__(self):
+        self.written = []
+    def write(self, data):
+        self.written.append(list(data))
+
+#======================================
+# answers complete the oldest command they answer, whatever order they come in
+#
+def test_answers_complete_commands():
+
+    port = WrittenPort()
+    with IOLabSession(None, logData=False):
+        fixed = [issueCommand(port, [0x02, 0x27, 0x01, 1, 0x0A]) for n in range(2)]
+        start = issueCommand(port, [0x02, 0x20, 0x00, 0x0A])
+        assert len(port.written) == 3 and not any(f.done() for f in fixed + [start])
+
+        resolveCommand([0x02, G.recType_ACK, 0x01, 0x20, 0x0A])
+        resolveCommand([0x02, G.recType_getFixedConfig, 0x02, 1, 38, 0x0A])
+        resolveCommand([0x02, G.recType_NACK, 0x02, 0x27, 0x03, 0x0A])
+        resolveCommand([0x02, G.recType_ACK, 0x01, 0x21, 0x0A])     # nobody asked
+        assert G.pendingCommands == {}
+
+    assert start.result()[1] == G.recType_ACK
+    assert fixed[0].result()[4] == 38
+    assert fixed[1].result()[1] == G.recType_NACK
+
+#======================================
+# each remote's answer goes to the command that asked that remote, whichever
+# remote answers first (ACKs, which don't say, go to the oldest command)
+#
+def test_remotes_answer_out_of_order():
+
+    port = WrittenPort()
+    with IOLabSession(None, logData=False):
+        fixed = [issueCommand(port, [0x02, 0x27, 0x01, remote, 0x0A]) for remote in (1, 2)]
+        packet = [issueCommand(port, [0x02, 0x28, 0x01, remote, 0x0A]) for remote in (1, 2)]
+        power = [issueCommand(port, [0x02, 0x2B, 0x01, remote, 0x0A]) for remote in (1, 2)]
+
+        resolveCommand([0x02, G.recType_getFixedConfig, 0x02, 2, 12, 0x0A])
+        resolveCommand([0x02, G.recType_getPacketConfig, 0x04, 2, 1, 21, 2, 0x0A])
+        assert not fixed[0].done() and not packet[0].done()
+        resolveCommand([0x02, G.recType_getFixedConfig, 0x02, 1, 38, 0x0A])
+        resolveCommand([0x02, G.recType_getPacketConfig, 0x04, 1, 1, 1, 6, 0x0A])
+        resolveCommand([0x02, G.recType_getFixedConfig, 0x02, 2, 12, 0x0A])    # nobody asked
+        resolveCommand([0x02, G.recType_ACK, 0x01, 0x2B, 0x0A])
+        assert power[0].done() and not power[1].done()
+        resolveCommand([0x02, G.recType_ACK, 0x01, 0x2B, 0x0A])
+        assert G.pendingCommands == {}
+
+    assert [f.result()[3:5] for f in fixed] == [[1, 38], [2, 12]]
+    assert [f.result()[3:6] for f in packet] == [[1, 1, 1], [2, 1, 21]]
+
+#======================================
+# a command that was sent again is only answered once, and the other answer
+# doesn't go to the next command like it
+#
+def test_late_answer_dropped():
+
+    port = WrittenPort()
+    with IOLabSession(None, logData=False):
+        first = issueCommand(port, [0x02, 0x27, 0x01, 1, 0x0A], timeout=0.05, retries=1)
+        while len(port.written) < 2:
+            time.sleep(0.01)
+        resolveCommand([0x02, G.recType_getFixedConfig, 0x02, 1, 38, 0x0A])
+        assert first.result(0)[4] == 38
+
+        second = issueCommand(port, [0x02, 0x27, 0x01, 1, 0x0A], timeout=5.0)
+        resolveCommand([0x02, G.recType_getFixedConfig, 0x02, 1, 38, 0x0A])   # the late one
+        assert not second.done()
+        resolveCommand([0x02, G.recType_getFixedConfig, 0x02, 1, 12, 0x0A])
+        assert second.result(0)[4] == 12
+        assert G.pendingCommands == {} and G.lateAnswers == []
+
+#======================================
+# a command that isn't answered is sent again, and then fails
+#
+def test_unanswered_command_times_out():
+
+    port = WrittenPort()
+    with IOLabSession(None, logData=False):
+        f = issueCommand(port, [0x02, 0x14, 0x00, 0x0A], timeout=0.02, retries=2)
+        with pytest.raises(TimeoutError):
+            f.result(2.0)
+        assert G.pendingCommands == {}
+    assert port.written == [[0x02, 0x14, 0x00, 0x0A]] * 3
+
+#======================================
+# the commands don't wait for their answers, so the analysis thread (which 
+# finds the answers) can send them too
+#
+def test_commands_dont_wait():
+
+    port = WrittenPort()
+    with IOLabSession(None, logData=False, commandTimeout=5.0):
+        G.analThread = current_thread()
+        f = getFixedConfig(port, 1)
+        assert not f.done()
+        resolveCommand([0x02, G.recType_getFixedConfig, 0x02, 1, 38, 0x0A])
+        assert f.result(0)[4] == 38
+
+#======================================
+# and they get the same answers from the emulator as they would from a dongle
+#
+def test_commands_return_answers(emulator, analysis):
+
+    session = IOLabSession(emulator.portName, analysis=analysis)
+    assert session.start()
+    with session:
+        ack = setFixedConfig(G.serialPort, 38, 1).result()
+        nack = setFixedConfig(G.serialPort, 0, 1).result()    # there is no config 0
+        fixed = getFixedConfig(G.serialPort, 1).result()
+        packet = getPacketConfig(G.serialPort, 1).result()
+    session.stop()
+
+    assert (ack[1], ack[3]) == (G.recType_ACK, 0x26)
+    assert (nack[1], nack[3]) == (G.recType_NACK, 0x26)
+    assert (fixed[1], fixed[4]) == (G.recType_getFixedConfig, 38)
+    assert packet[1] == G.recType_getPacketConfig and packet[4] == 11
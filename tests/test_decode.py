@@ -0,0 +1,32 @@
+#
+# This file is part of PyOLab. https://github.com/matsselen/pyolab
+# (C) 2017 Mats Selen <mats.selen@gmail.com>
+#
+# SPDX-License-Identifier:    BSD-3-Clause
+# (https://opensource.org/licenses/BSD-3-Clause)
+#
+
+# system stuff
+import numpy as np
+
+# local stuff
+from pyolab3.sessionClass import IOLabSession
+
+from conftest import acquire, emulatorClass
+
+#======================================
+# a corrupted data record is skipped, and the ones after it are still decoded
+# (once each - the emulator's samples are counters, so none of them repeat)
+#
+def test_corrupt_records_skipped(analysis):
+
+    emulator = emulatorClass().IOLabEmulator(corruptRate=0.05, seed=3)
+    session = IOLabSession(emulator.portName, analysis=analysis)
+    acquire(session, 38, 2.0)
+    emulator.close()
+
+    remote = session.remotes[1]
+    assert len(remote.pending) == remote.pending.base
+    samples = session.uncalDataDict[1].data()[:, 0].astype(np.int64)
+    assert len(samples) > 0
+    assert len(np.unique(samples)) == len(samples)
@@ -0,0 +1,107 @@
+#
+# This file is part of PyOLab. https://github.com/matsselen/pyolab
+# (C) 2017 Mats Selen <mats.selen@gmail.com>
+#
+# SPDX-License-Identifier:    BSD-3-Clause
+# (https://opensource.org/licenses/BSD-3-Clause)
+#
+
+# system stuff
+import random
+
+# local stuff
+from pyolab3.pyolabGlobals import G
+from pyolab3.sessionClass import IOLabSession
+from pyolab3.setupMethods import setupGlobalVariables
+from pyolab3.dataMethods import findRecords
+
+#======================================
+# findRecords() the way it used to be: one byte at a time through G.dataList.
+# Returns (records, nextData), where records is a list of [recType, bytes]
+# for the records found from byte nextData on.
+#
+def findRecordsOneByteAtATime(dataList, nextData, recTypeList):
+
+    found = []
+    i = nextData
+    iLast = len(dataList)
+    while i < (iLast - 3):
+        if (dataList[i] == 2):
+            for recType in recTypeList:
+                if dataList[i+1] == recType:
+                    ndata = dataList[i+2]
+                    if i+3+ndata < iLast:
+                        if dataList[i+3+ndata] == 0xa:
+                            found.append([recType, dataList[i:i+4+ndata]])
+                            nextData = i + 4 + ndata
+                            i = nextData - 1
+                            break
+                    else:
+                        break
+            i += 1
+        else:
+            i += 1
+    return found, nextData
+
+#======================================
+# Makes up a stream of bytes with the things that make framing hard in it:
+# SOP bytes followed by valid record types inside payloads, records with a
+# bad EOP, records of types nobody knows about and junk between records.
+#
+def makeStream(nRecords, seed):
+
+    rng = random.Random(seed)
+    types = list(G.recTypeDict.keys())
+    stream = bytearray()
+    for n in range(nRecords):
+        what = rng.random()
+        payload = bytearray(rng.randrange(256) for i in range(rng.randrange(0, 40)))
+        if len(payload) > 3 and rng.random() < 0.3:
+            # a false record start inside the payload
+            i = rng.randrange(len(payload) - 2)
+            payload[i:i+3] = bytes([0x02, rng.choice(types), rng.randrange(4)])
+
+        if what < 0.7:
+            stream += bytes([0x02, rng.choice(types), len(payload)]) + payload + b'\x0a'
+        elif what < 0.8:
+            stream += bytes([0x02, rng.choice(types), len(payload)]) + payload + b'\x0b'   # bad EOP
+        elif what < 0.9:
+            stream += bytes([0x02, 0x99, len(payload)]) + payload + b'\x0a'              # unknown type
+        else:
+            stream += payload                                                            # junk
+    return bytes(stream)
+
+#======================================
+# the records findRecords() finds are exactly the ones the per-byte loop found,
+# however the stream is cut up into reads
+#
+def test_framer_matches_per_byte_loop():
+
+    for seed in range(20):
+        stream = makeStream(300, seed)
+        rng = random.Random(seed)
+
+        session = IOLabSession(None, logData=False)
+        with session:
+            setupGlobalVariables()
+            start = G.dataBuffer.writePos
+
+            dataList = []
+            nextData = 0
+            expected = []
+            i = 0
+            while i < len(stream):
+                piece = stream[i:i + rng.randrange(1, 64)]    # records get split across reads
+                i += len(piece)
+
+                dataList.extend(piece)
+                found, nextData = findRecordsOneByteAtATime(dataList, nextData, G.recTypeList)
+                expected += found
+
+                G.dataBuffer.write(piece)
+                findRecords(G.dataBuffer.writePos)
+
+            got = [[rec.recType, rec.tolist()] for rec in G.recordIndex.records(G.recordIndex.select())]
+            assert len(expected) > 100
+            assert got == expected
+            assert G.nextData - start == nextData
@@ -0,0 +1,80 @@
+#
+# This file is part of PyOLab. https://github.com/matsselen/pyolab
+# (C) 2017 Mats Selen <mats.selen@gmail.com>
+#
+# SPDX-License-Identifier:    BSD-3-Clause
+# (https://opensource.org/licenses/BSD-3-Clause)
+#
+
+# system stuff
+import numpy as np
+
+# local stuff
+from pyolab3.pyolabGlobals import G
+from pyolab3.sessionClass import IOLabSession
+from pyolab3.setupMethods import setupGlobalVariables
+from pyolab3.dataMethods import findRecords
+
+from test_framer import findRecordsOneByteAtATime, makeStream
+
+#======================================
+# The old lists, worked out from the records the per-byte loop finds: 
+# allRecList, dataRecList and commRecList held [recType, index in G.recDict[recType]]
+# for every record, the data records, and the other records.
+#
+def oldLists(found):
+
+    counts = {}
+    allRecList = []
+    for recType, rec in found:
+        allRecList.append([recType, counts.get(recType, 0)])
+        counts[recType] = counts.get(recType, 0) + 1
+    dataRecList = [entry for entry in allRecList if entry[0] == G.recType_dataFromRemote]
+    commRecList = [entry for entry in allRecList if entry[0] != G.recType_dataFromRemote]
+    return allRecList, dataRecList, commRecList
+
+#======================================
+# the index (and its views) give the same entries as the old lists did, and
+# select() picks out the same records
+#
+def test_index_matches_old_lists():
+
+    with IOLabSession(None, logData=False):
+        setupGlobalVariables()
+        stream = makeStream(400, 7)
+        found, nextData = findRecordsOneByteAtATime(list(stream), 0, G.recTypeList)
+        allRecList, dataRecList, commRecList = oldLists(found)
+
+        for i in range(0, len(stream), 500):
+            G.dataBuffer.write(stream[i:i + 500])
+            findRecords(G.dataBuffer.writePos)
+        index = G.recordIndex
+        assert len(allRecList) > 250
+
+        assert G.allRecList.tolist() == list(G.allRecList) == allRecList
+        assert list(G.dataRecList) == G.dataRecList[:] == dataRecList
+        assert list(G.commRecList) == G.commRecList[:] == commRecList
+        assert len(G.commRecList) == len(commRecList) and G.commRecList[-1] == commRecList[-1]
+
+        def records(entries):
+            return [rec.tolist() for rec in index.records(entries)]
+
+        assert records(index.select()) == [rec for recType, rec in found]
+        assert records(index.select(G.recType_dataFromRemote)) == [rec for recType, rec in found if recType == G.recType_dataFromRemote]
+        commTypes = [recType for recType in G.recTypeList if recType != G.recType_dataFromRemote]
+        assert index.pairs(index.select(commTypes)) == commRecList
+        assert index.pairs(index.select(after=100)) == allRecList[100:]
+
+        # the entries know where their records start
+        offsets = index.data()['offset']
+        for t, o, offset in zip(index.data()['recType'].tolist(), index.data()['ordinal'].tolist(), offsets.tolist()):
+            assert G.recDict[t].data()[o] == offset
+        start, stop = offsets[50], offsets[80] + 1
+        assert index.select(start=start, stop=stop).tolist() == list(range(50, 81))
+        assert index.select(G.recType_ACK, start=start, stop=stop).tolist() == \
+            [i for i in range(50, 81) if allRecList[i][0] == G.recType_ACK]
+
+        # entries that have been discarded are no longer selected
+        index.discard(200)
+        assert np.array_equal(index.select(), np.arange(200, len(allRecList)))
+        assert index.pairs(index.select(after=10)) == allRecList[200:]
@@ -0,0 +1,109 @@
+#
+# This file is part of PyOLab. https://github.com/matsselen/pyolab
+# (C) 2017 Mats Selen <mats.selen@gmail.com>
+#
+# SPDX-License-Identifier:    BSD-3-Clause
+# (https://opensource.org/licenses/BSD-3-Clause)
+#
+
+# system stuff
+import os
+import io
+import queue
+
+# local stuff
+from pyolab3.sessionClass import IOLabProcessSession
+from pyolab3.processClass import CommandPort
+from pyolab3.sharedClass import SharedRing
+
+from conftest import acquire
+
+#======================================
+# the reader process keeps the same read statistics as the read thread does
+#
+def test_process_read_stats(emulator, analysis):
+
+    session = IOLabProcessSession(emulator.portName, analysis=analysis, decoders=1)
+    acquire(session, 38, 1.0)
+
+    stats = session.readStats
+    assert stats['bytes'] > 0
+    assert sum(stats['readSizes'].values()) == stats['reads'] - stats['emptyReads'] > 0
+    assert max(stats['readSizes']) > stats['largestRead'] >= max(stats['readSizes']) // 2
+
+#======================================
+# a port that hands out the bytes of "data" "perRead" at a time (like readinto()
+# on a serial port with that many waiting), and nothing once they are all read
+#
+class ChunkedPort(io.RawIOBase):
+
+    def __init__(self, data, perRead):
+        self.data = data
+        self.perRead = perRead
+        self.pos = 0
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        n = min(len(b), self.perRead, len(self.data) - self.pos)
+        b[:n] = self.data[self.pos:self.pos + n]
+        self.pos += n
+        return n
+
+#======================================
+# the ring keeps the read statistics of whoever reads into it, and the bytes
+# come out the way they went in, also across the end of the storage
+#
+def test_ring_read_stats():
+
+    name = 'pyolabtest' + str(os.getpid()) + 'r'
+    ring = SharedRing(name, 1000, create=True)
+    try:
+        data = bytes(range(250)) * 10
+        port = ChunkedPort(data, 100)
+        nReads = 0
+        while port.pos < len(data):
+            ring.readFrom(port, 300, nwait=len(data) - port.pos)
+            nReads += 1
+        ring.readFrom(port, 300)
+
+        stats = ring.readStats()
+        assert stats['bytes'] == len(data)
+        assert stats['reads'] == nReads + 1
+        assert stats['emptyReads'] == 1
+        assert stats['largestRead'] == 100
+        assert stats['maxWaiting'] == len(data)
+        assert stats['readSizes'] == {128: nReads}
+
+        # only the last 1000 bytes are still there
+        start, got = ring.read(0, ring.writePos)
+        assert start == len(data) - 1000
+        assert got == data[start:]
+        assert sum(c[2] for c in ring.chunksSince(0)) == len(data)
+    finally:
+        ring.close()
+        ring.unlink()
+
+#======================================
+# commands written to the CommandPort go to the reader process as they are, and
+# it otherwise looks like a serial port with nothing to read
+#
+def test_command_port():
+
+    commands = queue.SimpleQueue()
+    port = CommandPort(commands, 'port')
+
+    assert port.write([0x02, 0x20, 0x00, 0x0a]) == 4
+    assert port.write(bytearray([0x02, 0x2a, 0x00, 0x0a])) == 4
+    assert commands.get_nowait() == bytes([0x02, 0x20, 0x00, 0x0a])
+    assert commands.get_nowait() == bytes([0x02, 0x2a, 0x00, 0x0a])
+    assert commands.empty()
+    assert port.written == 8
+
+    assert port.inWaiting() == port.in_waiting == 0
+    assert port.read(10) == b''
+    assert port.readinto(bytearray(10)) == 0
+    assert port.is_open
+    port.close()
+    assert not port.is_open
@@ -0,0 +1,68 @@
+#
+# This file is part of PyOLab. https://github.com/matsselen/pyolab
+# (C) 2017 Mats Selen <mats.selen@gmail.com>
+#
+# SPDX-License-Identifier:    BSD-3-Clause
+# (https://opensource.org/licenses/BSD-3-Clause)
+#
+
+# system stuff
+import pytest
+
+# local stuff
+from pyolab3.storeClass import ColumnStore
+from pyolab3.recordClass import RecordList
+
+# a RecordList of three records, and the records themselves
+def makeRecords():
+    records = [[0x02, 0x41, 3, 1, 7, 9, 0x0A], [0x02, 0x8A, 1, 0, 0x0A], [0x02, 0x41, 2, 1, 8, 0x0A]]
+    recordBytes = ColumnStore('uint8', size=4, base=100)
+    recList = RecordList(recordBytes)
+    for rec in records:
+        recList.extend([len(recordBytes)])
+        recordBytes.append(rec)
+    return recList, records
+
+#======================================
+# a Record looks like the list it used to be
+#
+def test_record_like_list():
+
+    recList, records = makeRecords()
+    rec = recList[0]
+    assert rec == records[0] and rec.tolist() == records[0] and list(rec) == records[0]
+    assert (len(rec), rec[-1], rec[1:3]) == (7, 0x0A, [0x41, 3])
+    assert (rec.recType, rec.byteCount, rec.remote, rec.frame, rec.rf) == (0x41, 3, 1, 7, 9)
+    assert rec.payload.tolist() == [1, 7, 9] and bytes(rec) == bytes(records[0])
+    assert recList.tolist() == records and recList[1:] == records[1:]
+    with pytest.raises(IndexError):
+        rec[7]
+
+#======================================
+# views taken before the bytes are discarded keep them (even after the buffer has 
+# been replaced), while records whose bytes are gone fail loudly
+#
+def test_record_after_discard():
+
+    recList, records = makeRecords()
+    first = recList[0]
+    payload = first.payload
+    recList.recordBytes.discard(recList.data()[1])
+    recList.recordBytes.append([0x02, 0x41, 0, 0x0A] * 100)    # lots more bytes
+
+    assert payload.tolist() == [1, 7, 9]
+    assert recList[1] == records[1] and recList[2] == records[2]
+    for get in (first.tolist, lambda: first[3], lambda: bytes(recList[0])):
+        with pytest.raises(IndexError):
+            get()
+
+#======================================
+# unless they were spilled, in which case they come from the file
+#
+def test_record_after_spill():
+
+    recList, records = makeRecords()
+    recList.recordBytes.spill('recordBytes.bin')
+    recList.recordBytes.discard(recList.data()[2] + 2)
+    assert recList.tolist() == records
+    assert recList[2].payload.tolist() == [1, 8]
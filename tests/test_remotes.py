@@ -0,0 +1,56 @@
+#
+# This file is part of PyOLab. https://github.com/matsselen/pyolab
+# (C) 2017 Mats Selen <mats.selen@gmail.com>
+#
+# SPDX-License-Identifier:    BSD-3-Clause
+# (https://opensource.org/licenses/BSD-3-Clause)
+#
+
+# system stuff
+import random
+import numpy as np
+import pytest
+
+# local stuff
+from test_batch import emulatorRecords, fromRemote2, decode
+
+#======================================
+# with the records of two remotes mixed together (in runs of random length), each
+# RemoteStream gets exactly the samples it gets when its remote is the only one
+#
+@pytest.mark.parametrize('batchDecode', [True, False])
+def test_remotes_interleaved(emulator, batchDecode):
+
+    one = emulatorRecords(emulator, 38, 200)
+    two = [fromRemote2(rec) for rec in emulatorRecords(emulator, 1, 150)]
+
+    rng = random.Random(4)
+    mixed = one[:2] + two[:2]
+    i, j = 2, 2
+    while i < len(one) or j < len(two):
+        n = rng.randrange(1, 8)
+        mixed += one[i:i + n]
+        i += n
+        n = rng.randrange(1, 8)
+        mixed += two[j:j + n]
+        j += n
+
+    both = decode(mixed, batchDecode)
+    alone = {1: decode(one, batchDecode), 2: decode(two, batchDecode)}
+
+    assert sorted(both.remotes) == [1, 2]
+    assert both.remotes[1].lastFixedConfig == 38 and both.remotes[2].lastFixedConfig == 1
+    for number in (1, 2):
+        remote = both.remotes[number]
+        expected = alone[number].remotes[number]
+        nSamples = 0
+        for sensor, store in remote.uncalDataDict.items():
+            assert np.array_equal(store.data(), expected.uncalDataDict[sensor].data())
+            nSamples += len(store)
+        assert nSamples > 0
+        assert remote.lastFrameCount == expected.lastFrameCount
+        assert remote.lostFrames == expected.lostFrames == 0
+
+    # remote 2 only had the gyroscope, remote 1 everything in Kitchen Sink
+    assert len(both.remotes[2].uncalDataDict[1]) == 0 and len(both.remotes[2].uncalDataDict[3]) > 0
+    assert len(both.remotes[1].uncalDataDict[12]) > 0 and len(both.remotes[2].uncalDataDict[12]) == 0
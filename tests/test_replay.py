@@ -0,0 +1,100 @@
+#
+# This file is part of PyOLab. https://github.com/matsselen/pyolab
+# (C) 2017 Mats Selen <mats.selen@gmail.com>
+#
+# SPDX-License-Identifier:    BSD-3-Clause
+# (https://opensource.org/licenses/BSD-3-Clause)
+#
+
+# system stuff
+import numpy as np
+
+# local stuff
+from pyolab3.pyolabGlobals import G
+from pyolab3.sessionClass import IOLabSession
+from pyolab3.setupMethods import setupGlobalVariables, analyzeData
+from pyolab3.captureClass import CaptureWriter
+from pyolab3.replayMethods import replayCapture
+
+from conftest import acquire, emulatorClass
+from test_batch import emulatorRecords, fromRemote2
+
+#======================================
+# replaying a capture file decodes the same samples (at the same times, give or
+# take rounding) as were decoded live, whether the records are decoded in batches
+# or one at a time
+#
+def test_replay_matches_live(analysis):
+
+    emulator = emulatorClass().IOLabEmulator(seed=2, dropRate=0.01, overflowRate=0.01, corruptRate=0.01)
+    live = IOLabSession(emulator.portName, 'live', analysis, dumpData=True)
+    acquire(live, 38, 1.5)
+    emulator.close()
+
+    for batchDecode in (True, False):
+        replay = IOLabSession(None, 'replay', analysis, logData=False, batchDecode=batchDecode)
+        with replay:
+            replayCapture(live.captureFileName, report=False)
+
+        assert replay.lostFrames == live.lostFrames
+        for sensor, store in live.uncalDataDict.items():
+            assert np.array_equal(replay.uncalDataDict[sensor].data(), store.data())
+            assert np.allclose(replay.timeDataDict[sensor].data(), live.timeDataDict[sensor].data(), 0, 1e-9)
+
+#======================================
+# the samples replayCapture() reports are those of every remote, not just remote 1
+#
+def test_replay_counts_every_remote(emulator, analysis):
+
+    records = emulatorRecords(emulator, 38, 50)
+    records.insert(2, fromRemote2(records[1]))
+    records += [fromRemote2(rec) for rec in records[3:]]
+    with open('data.txt', 'w') as f:
+        f.write(' '.join(['%02x' % b for b in b''.join(records)]))
+
+    replay = IOLabSession(None, 'replay', analysis, logData=False)
+    with replay:
+        stats = replayCapture('data.txt', report=False)
+
+    nSamples = [sum([len(store) for store in remote.uncalDataDict.values()]) for remote in replay.remotes.values()]
+    assert sorted(replay.remotes) == [1, 2]
+    assert nSamples[0] == nSamples[1] > 0
+    assert stats['samples'] == sum(nSamples)
+    assert stats['dataRecords'] == 100
+
+#======================================
+# a capture with a dropout of more than 256 frames (so the frame byte has gone
+# all the way around) replays with the frame counts, lost frames and sample
+# times the data got when they arrived, at any speed
+#
+def test_replay_keeps_arrival_gaps(emulator, analysis):
+
+    records = emulatorRecords(emulator, 38, 600)
+    records = records[:202] + records[502:]          # frames 201 to 500 never arrive
+    frames = [0, 0] + list(range(1, 201)) + list(range(501, 601))
+    chunks = [(1000000000 + frame * 10000000, record) for frame, record in zip(frames, records)]
+
+    writer = CaptureWriter('gap.iolab')
+    for seq, (t, record) in enumerate(chunks):
+        writer.add((seq, 0, len(record), t), record)
+    writer.close()
+
+    # what the data got when they arrived, one record at a time
+    live = IOLabSession(None, 'live', analysis, logData=False)
+    with live:
+        setupGlobalVariables()
+        for t, record in chunks:
+            G.dataBuffer.write(record, t)
+            G.dataPointer = analyzeData()
+    assert live.lostFrames == 300
+    assert live.lastFrameCount == 599      # (the first frame is frame 0)
+
+    for speed in ('fast', 20):
+        replay = IOLabSession(None, 'replay', analysis, logData=False)
+        with replay:
+            replayCapture('gap.iolab', speed, report=False)
+        assert replay.lostFrames == 300
+        assert replay.lastFrameCount == 599
+        for sensor, store in live.uncalDataDict.items():
+            assert np.array_equal(replay.uncalDataDict[sensor].data(), store.data())
+            assert np.allclose(replay.timeDataDict[sensor].data(), live.timeDataDict[sensor].data(), 0, 1e-9)
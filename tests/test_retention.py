@@ -0,0 +1,91 @@
+#
+# This file is part of PyOLab. https://github.com/matsselen/pyolab
+# (C) 2017 Mats Selen <mats.selen@gmail.com>
+#
+# SPDX-License-Identifier:    BSD-3-Clause
+# (https://opensource.org/licenses/BSD-3-Clause)
+#
+
+# system stuff
+import numpy as np
+
+# local stuff
+from pyolab3.sessionClass import IOLabSession
+from pyolab3.replayMethods import replayCapture
+
+from test_batch import emulatorRecords, fromRemote2
+
+#======================================
+# writes the records of two remotes taking data in configuration 38 to a hex dump
+# (which replayCapture() reads a few records at a time) and returns its name
+#
+def writeDump(emulator, nFrames):
+
+    records = emulatorRecords(emulator, 38, nFrames)
+    records.insert(2, fromRemote2(records[1]))
+    for i in range(3, len(records)):
+        records.insert(2 * i - 2, fromRemote2(records[2 * i - 3]))
+    with open('data.txt', 'w') as f:
+        f.write(' '.join(['%02x' % b for b in b''.join(records)]))
+    return 'data.txt'
+
+def replay(fileName, analysis, retention):
+    session = IOLabSession(None, analysis=analysis, logData=False, retention=retention)
+    with session:
+        replayCapture(fileName, report=False)
+    return session
+
+#======================================
+# old records and samples are thrown away, and the ones that are left keep
+# their numbers (and the samples their times)
+#
+def test_retention_keeps_numbering(emulator, analysis):
+
+    fileName = writeDump(emulator, 300)
+    full = replay(fileName, analysis, {})
+    kept = replay(fileName, analysis, {'uncal': ('samples', 100), 'records': ('samples', 20)})
+
+    nSensors = 0
+    for number in (1, 2):
+        for sensor, store in kept.remotes[number].uncalDataDict.items():
+            everything = full.remotes[number].uncalDataDict[sensor]
+            times = kept.remotes[number].timeDataDict[sensor]
+            assert len(store) == len(everything)
+            if len(store) == 0:
+                continue
+            nSensors += 1
+            assert len(store) > 100
+            assert store.base == times.base == len(store) - 100
+            assert np.array_equal(store.data(), everything.data()[store.base:])
+            assert np.array_equal(times.data(), full.remotes[number].timeDataDict[sensor].data()[store.base:])
+            assert store[-1] == everything[-1]
+    assert nSensors > 2
+
+    for recType, records in kept.recDict.items():
+        everything = full.recDict[recType]
+        assert len(records) == len(everything)
+        assert records.base == max(len(records) - 20, 0)
+        assert [rec.tolist() for rec in records] == [rec.tolist() for rec in everything[records.base:]]
+    assert kept.recordBytes.base == min([records.data()[0] for records in kept.recDict.values() if records.n > 0])
+
+    index = kept.recordIndex
+    assert len(index) == len(full.recordIndex) and index.base == len(index) - 20
+    for field in ('recType', 'ordinal', 'offset'):
+        assert np.array_equal(index.data()[field], full.recordIndex.data()[field][index.base:])
+    assert len(kept.dataRecList) == len(full.dataRecList)
+
+#======================================
+# samples that are spilled can still be read, from the file
+#
+def test_retention_spill(emulator, analysis):
+
+    fileName = writeDump(emulator, 200)
+    full = replay(fileName, analysis, {})
+    kept = replay(fileName, analysis, {('uncal', 1): ('spill', 50), ('uncal', 3, 2): ('samples', 10)})
+
+    spilled = kept.remotes[1].uncalDataDict[1]
+    assert spilled.base == len(spilled) - 50 > 0
+    assert np.array_equal(spilled[0:len(spilled)], full.uncalDataDict[1].data())
+    assert np.array_equal(kept.timeDataDict[1][0:len(spilled)], full.timeDataDict[1].data())
+    assert kept.remotes[2].uncalDataDict[3].base == len(kept.remotes[2].uncalDataDict[3]) - 10
+    assert kept.remotes[1].uncalDataDict[3].base == 0
@@ -0,0 +1,199 @@
+#
+# This file is part of PyOLab. https://github.com/matsselen/pyolab
+# (C) 2017 Mats Selen <mats.selen@gmail.com>
+#
+# SPDX-License-Identifier:    BSD-3-Clause
+# (https://opensource.org/licenses/BSD-3-Clause)
+#
+
+# system stuff
+import time
+import socket
+import numpy as np
+import pytest
+from threading import Thread
+
+# local stuff
+from pyolab3.sessionClass import IOLabSession
+from pyolab3.serverClass import Subscriber, SampleBatch, frameHeader, frameStatus, frameSubscribe, statusFormat
+from pyolab3.clientClass import IOLabSubscriber
+
+from conftest import acquire
+
+sensors = [1, 2, 3, 4, 7, 8, 9, 12, 21]
+
+# what analyzeData() pushes: one batch of "n" samples per sensor
+def batches(first, n=10):
+    return [SampleBatch(1, sensor, first, np.arange(first, first + n) * 0.01,
+                        np.arange(first, first + n, dtype=np.int16)) for sensor in sensors]
+
+#======================================
+# a subscriber that falls behind loses samples of every sensor, not whole sensors
+#
+@pytest.mark.parametrize('policy', ['drop', 'coalesce'])
+def test_queue_bound_is_per_sensor(policy):
+
+    subscriber = Subscriber(None)
+    for i in range(20):
+        for batch in batches(i * 10):
+            subscriber.put(batch, 4, policy, 1000)
+
+    queued = [batch for batch in subscriber.queue]
+    for sensor in sensors:
+        mine = [batch for batch in queued if batch.sensor == sensor]
+        assert len(mine) == 4
+        assert mine[-1].first + mine[-1].count == 200
+        if policy == 'coalesce':
+            assert sum([batch.count for batch in mine]) == 200
+    assert subscriber.waiting == {(1, sensor): 4 for sensor in sensors}
+
+# samples with "width" numbers each, numbered from "first" (sample i is i, i+1, ...)
+def rows(first, n, width):
+    return (np.arange(first, first + n)[:, None] + np.arange(width)).astype(np.int16)
+
+#======================================
+# merging keeps the samples in order and numbered, down to the newest maxSamples,
+# and a batch that doesn't follow on is kept on its own
+#
+def test_merge():
+
+    earlier = SampleBatch(1, 12, 100, np.arange(100, 110) * 0.01, rows(100, 10, 3))
+    later = SampleBatch(1, 12, 110, np.arange(110, 125) * 0.01, rows(110, 15, 3))
+
+    merged, lost = earlier.merge(later, 1000)
+    assert lost == 0
+    assert (merged.first, merged.count, merged.width, merged.key) == (100, 25, 3, (1, 12))
+    assert merged.samples == rows(100, 25, 3).tobytes()
+    assert merged.times == (np.arange(100, 125) * 0.01).tobytes()
+
+    merged, lost = earlier.merge(later, 20)
+    assert lost == 5
+    assert (merged.first, merged.count) == (105, 20)
+    assert merged.samples == rows(105, 20, 3).tobytes()
+    assert merged.times == (np.arange(105, 125) * 0.01).tobytes()
+    assert len(merged.frame()) == frameHeader.size + 20 * 8 + 20 * 3 * 2
+
+    gap = SampleBatch(1, 12, 130, np.arange(130, 135) * 0.01, rows(130, 5, 3))
+    merged, lost = earlier.merge(gap, 1000)
+    assert merged is gap and lost == 10
+
+#======================================
+# a full queue throws away the oldest batch of the sensor ('drop') or adds the
+# new samples to the newest one ('coalesce'), and counts what it loses
+#
+def test_put_policies():
+
+    def batch(sensor, first, n=10):
+        return SampleBatch(1, sensor, first, np.arange(first, first + n) * 0.01, rows(first, n, 1)[:, 0])
+
+    subscriber = Subscriber(None)
+    subscriber.put(batch(21, 0), 2, 'drop', 1000)
+    for first in (0, 10, 20):
+        subscriber.put(batch(12, first), 2, 'drop', 1000)
+    assert [(b.sensor, b.first) for b in subscriber.queue] == [(21, 0), (12, 10), (12, 20)]
+    assert subscriber.waiting == {(1, 21): 1, (1, 12): 2}
+    assert subscriber.stats['dropped'] == 10
+
+    subscriber = Subscriber(None)
+    subscriber.queue.append(b'a status frame')
+    for first in (0, 10, 20, 30):
+        subscriber.put(batch(12, first), 2, 'coalesce', 25)
+    assert [(b.first, b.count) for b in list(subscriber.queue)[1:]] == [(0, 10), (15, 25)]
+    assert subscriber.waiting == {(1, 12): 2}
+    assert subscriber.stats['coalesced'] == 2 and subscriber.stats['dropped'] == 5
+
+    # samples that don't follow on replace the waiting ones
+    subscriber.put(batch(12, 100), 2, 'coalesce', 25)
+    assert [(b.first, b.count) for b in list(subscriber.queue)[1:]] == [(0, 10), (100, 10)]
+    assert subscriber.stats['dropped'] == 30
+
+#======================================
+# an IOLabSubscriber gets back what a SampleBatch sent, and keeps the status
+#
+def test_unpack(tmp_path):
+
+    path = str(tmp_path / 'iolab.sock')
+    listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    listener.bind(path)
+    listener.listen(1)
+    subscriber = IOLabSubscriber(path)
+    listener.close()
+
+    frames = [SampleBatch(2, 12, 40, np.arange(5) * 0.1, rows(40, 5, 3)).frame(),
+              SampleBatch(2, 21, 7, [0.5, 0.6], np.array([1.5, 2.5], np.float32)).frame(),
+              frameHeader.pack(frameStatus, 2, 0, 0, b'', 0, 0, statusFormat.size) + statusFormat.pack(38, 3, -1, 12),
+              frameHeader.pack(frameSubscribe, 2, 0, 0, b'', 0, 0, 1) + b'\x01']
+    subscriber.received += b''.join(frames)[:-1]
+
+    remote, sensor, first, samples, times = subscriber.unpack(*subscriber.nextFrame())
+    assert (remote, sensor, first) == (2, 12, 40)
+    assert samples.dtype == np.int16 and np.array_equal(samples, rows(40, 5, 3))
+    assert np.array_equal(times, np.arange(5) * 0.1)
+
+    remote, sensor, first, samples, times = subscriber.unpack(*subscriber.nextFrame())
+    assert (remote, sensor, first) == (2, 21, 7)
+    assert samples.dtype == np.float32 and samples.tolist() == [1.5, 2.5]
+
+    assert subscriber.unpack(*subscriber.nextFrame()) is None
+    assert subscriber.status == {2: {'lastFixedConfig': 38, 'lostFrames': 3, 'lastFrameCount': None, 'lastFrameTime': 12}}
+
+    # the last frame hasn't come in completely yet
+    assert subscriber.nextFrame() is None
+    subscriber.received += frames[-1][-1:]
+    assert subscriber.unpack(*subscriber.nextFrame()) is None
+    subscriber.close()
+
+#======================================
+# Takes the batches sent to an IOLabSubscriber (waiting "delay" after each one)
+# until the server goes away
+#
+def collect(subscriber, delay, got):
+    while not subscriber.done:
+        batch = subscriber.receive(5.0)
+        if batch is not None:
+            remote, sensor, first, samples, times = batch
+            got.setdefault(sensor, []).append((first, samples.copy(), times.copy()))
+            time.sleep(delay)
+
+@pytest.mark.parametrize('policy', ['drop', 'coalesce'])
+def test_server_fan_out(emulator, analysis, policy):
+
+    path = 'iolab.sock'
+    session = IOLabSession(emulator.portName, analysis=analysis, serverPath=path,
+                           serverPolicy=policy, serverQueueLength=4)
+    assert session.start()
+
+    # one subscriber for everything that keeps up, one that only wants the
+    # accelerometer, and one for everything that doesn't keep up
+    subscribers = [IOLabSubscriber(path), IOLabSubscriber(path, 1, [1]), IOLabSubscriber(path)]
+    got = [{}, {}, {}]
+    threads = [Thread(target=collect, args=(s, delay, g)) for s, delay, g in zip(subscribers, [0, 0, 0.01], got)]
+    for thread in threads:
+        thread.start()
+    while len([s for s in session.server.subscribers.values() if s.wanted]) < 3:
+        time.sleep(0.01)
+
+    acquire(session, 38, 1.0, start=False)
+    for thread in threads:
+        thread.join()
+
+    def samples(batches):
+        return np.concatenate([s for f, s, t in batches]), np.concatenate([np.arange(f, f + len(s)) for f, s, t in batches])
+
+    # the ones that keep up get everything
+    stores = {sensor: store for sensor, store in session.uncalDataDict.items() if len(store) > 0}
+    assert sorted(got[0]) == sorted(stores)
+    assert sorted(got[1]) == [1]
+    for g in got[:2]:
+        for sensor, batches in g.items():
+            data, numbers = samples(batches)
+            assert np.array_equal(numbers, np.arange(len(stores[sensor])))
+            assert np.array_equal(data, stores[sensor].data())
+
+    # the slow one gets some of every sensor, each sample with the right number
+    assert sorted(got[2]) == sorted(stores)
+    for sensor, batches in got[2].items():
+        data, numbers = samples(batches)
+        assert np.array_equal(data, stores[sensor].data()[numbers])
+        if policy == 'coalesce':
+            assert np.array_equal(numbers, np.arange(numbers[0], numbers[0] + len(numbers)))
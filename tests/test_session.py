@@ -0,0 +1,96 @@
+#
+# This file is part of PyOLab. https://github.com/matsselen/pyolab
+# (C) 2017 Mats Selen <mats.selen@gmail.com>
+#
+# SPDX-License-Identifier:    BSD-3-Clause
+# (https://opensource.org/licenses/BSD-3-Clause)
+#
+
+# system stuff
+import time
+import pytest
+from threading import Thread
+
+# local stuff
+from pyolab3.pyolabGlobals import G, defaultGlobals, currentGlobals, inSession
+from pyolab3.sessionClass import IOLabSession, IOLabSessionManager
+from pyolab3.commMethods import setFixedConfig, getFixedConfig, getPacketConfig, startData, stopData
+
+from conftest import emulatorClass
+
+#======================================
+# G is whatever session the thread is in (the default globals outside of any), 
+# and each session has its own copies of everything
+#
+def test_session_globals():
+
+    one = IOLabSession(None, 'one', logData=False)
+    two = IOLabSession(None, readTimeout=0.5)
+    assert currentGlobals() is defaultGlobals
+    with one:
+        assert currentGlobals() is one and G.name == 'one' and G.logFileName == 'log_one.txt'
+        with two:
+            G.nextData = 7
+            G.readStats['reads'] = 3
+            assert G.readTimeout == 0.5 and G.lastFixedConfig == 0
+            G.lastFixedConfig = 38                     # (this is remote 1's)
+        assert G.nextData == 0 and G.readStats['reads'] == 0
+    assert currentGlobals() is defaultGlobals
+    assert (two.nextData, two.readStats['reads'], two.remotes[1].lastFixedConfig) == (7, 3, 38)
+    assert one.remotes[1] is not two.remotes[1] and one.dataBuffer is not two.dataBuffer
+
+    with pytest.raises(AttributeError):
+        IOLabSession(None, noSuchThing=1)
+
+#======================================
+# threads start out with the default globals, unless they are started with inSession()
+#
+def test_session_threads():
+
+    seen = []
+    def look():
+        seen.append(currentGlobals())
+    session = IOLabSession(None, logData=False)
+    with session:
+        threads = [Thread(target=look), Thread(target=inSession(look))]
+        for thread in threads:
+            thread.start()
+            thread.join()
+        assert session.run(currentGlobals) is session
+    assert seen == [defaultGlobals, session]
+    assert session.run(lambda: G.logData) is False
+
+#======================================
+# a manager runs a session per dongle, each with its own data (and G stays put)
+#
+def test_manager_runs_sessions(analysis):
+
+    emulators = [emulatorClass().IOLabEmulator(seed=n) for n in range(2)]
+    configs = [1, 38]
+    bytesBefore = G.readStats['bytes']
+
+    manager = IOLabSessionManager([emulator.portName for emulator in emulators], analysis=analysis)
+    names = [session.name for session in manager]
+    assert manager.start()
+    def configure():
+        config = configs[names.index(G.name)]
+        setFixedConfig(G.serialPort, config, 1)
+        getFixedConfig(G.serialPort, 1)
+        getPacketConfig(G.serialPort, 1).result()
+        startData(G.serialPort)
+    manager.run(configure)
+    time.sleep(1.0)
+    manager.run(lambda: stopData(G.serialPort).result())
+    time.sleep(0.1)
+    manager.stop()
+    for emulator in emulators:
+        emulator.close()
+
+    for session, emulator, config in zip(manager, emulators, configs):
+        assert session.lastFixedConfig == config
+        assert len(session.recDict[G.recType_dataFromRemote]) == emulator.stats['records'] > 0
+        assert session.lostFrames == 0
+    assert len(manager[0].uncalDataDict[3]) > 0 and len(manager[0].uncalDataDict[12]) == 0
+    assert len(manager[1].uncalDataDict[12]) > 0
+    assert manager.readStats()['bytes'] == manager[0].readStats['bytes'] + manager[1].readStats['bytes']
+    assert G.readStats['bytes'] == bytesBefore
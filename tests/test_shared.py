@@ -0,0 +1,143 @@
+#
+# This file is part of PyOLab. https://github.com/matsselen/pyolab
+# (C) 2017 Mats Selen <mats.selen@gmail.com>
+#
+# SPDX-License-Identifier:    BSD-3-Clause
+# (https://opensource.org/licenses/BSD-3-Clause)
+#
+
+# system stuff
+import os
+import sys
+import time
+import subprocess
+import numpy as np
+import pytest
+
+# local stuff
+from pyolab3.pyolabGlobals import G
+from pyolab3.sessionClass import IOLabSession
+from pyolab3.clientClass import IOLabClient
+from pyolab3.sharedClass import SharedColumn, SharedCatalog
+from pyolab3.commMethods import setFixedConfig, getFixedConfig, getPacketConfig, startData, stopData
+
+#======================================
+# what a client reads from shared memory is what was decoded
+#
+def test_client_reads_published(emulator, analysis):
+
+    session = IOLabSession(emulator.portName, analysis=analysis)
+    session.publishName = 'pyolabtest' + str(os.getpid())
+    assert session.start()
+    with session:
+        setFixedConfig(G.serialPort, 38, 1)
+        getFixedConfig(G.serialPort, 1)
+        getPacketConfig(G.serialPort, 1).result()
+        startData(G.serialPort)
+    time.sleep(1.0)
+    with session:
+        stopData(G.serialPort).result()
+    time.sleep(0.2)
+
+    # (the memory goes away when the session is stopped)
+    client = IOLabClient(session.publishName)
+    client.update()
+    for sensor in (1, 12, 21):
+        first, samples, times = client.since(sensor, 0)
+        assert first == 0 and len(samples) > 0
+        assert np.array_equal(samples, session.uncalDataDict[sensor].data())
+        assert np.array_equal(times, session.timeDataDict[sensor].data())
+    client.close()
+    session.stop()
+
+#======================================
+# views of a column keep working after it (and the writer's) are closed
+#
+def test_view_outlives_column():
+
+    name = 'pyolabtest' + str(os.getpid())
+    writer = SharedColumn(name, 'int64', capacity=1000, create=True)
+    writer.append(np.arange(100))
+    reader = SharedColumn(name, track=False)
+    first, samples = reader.view(0)
+    reader.close()
+    writer.close()
+    writer.unlink()
+    assert first == 0
+    assert samples.tolist() == list(range(100))
+
+#======================================
+# a column's memory is closed once the column and the last view of it are gone
+#
+def test_memory_closed_with_last_view():
+
+    name = 'pyolabtest' + str(os.getpid())
+    writer = SharedColumn(name, 'int16', width=3, capacity=10, create=True)
+    writer.append(np.ones((4, 3)))
+    reader = SharedColumn(name, track=False)
+    first, rows = reader.view(0)
+    row = rows[1]
+    shm = reader.shm
+    reader.close()
+    del rows
+    assert shm.buf is not None
+    assert row.tolist() == [1, 1, 1]
+    del row
+    assert shm.buf is None
+
+    shm = writer.shm
+    writer.close()
+    assert shm.buf is None
+    writer.unlink()
+
+#======================================
+# nothing is published under a name that another writer is still using, but
+# what a writer that has finished left behind is replaced (readers that have
+# it keep what they have)
+#
+def test_name_in_use():
+
+    name = 'pyolabtest' + str(os.getpid())
+    catalog = SharedCatalog(name, create=True)
+    column = SharedColumn(catalog.columnName('uncal', 12), 'int16', capacity=10, create=True)
+    column.append(np.arange(5))
+    catalog.add('uncal', 12)
+
+    with pytest.raises(FileExistsError, match=str(os.getpid())):
+        SharedCatalog(name, create=True)
+    with pytest.raises(FileExistsError):
+        SharedColumn(column.name, 'int16', capacity=10, create=True)
+    reader = SharedColumn(column.name, track=False)
+    assert reader.data().tolist() == list(range(5))
+
+    catalog.finish()
+    catalog.close()
+    column.close()
+    catalog = SharedCatalog(name, create=True)
+    assert len(catalog) == 0 and not catalog.done
+    with pytest.raises(FileNotFoundError):
+        SharedColumn(column.name)
+    assert reader.data().tolist() == list(range(5))
+    reader.close()
+    catalog.close()
+    catalog.unlink()
+
+# a client in the same process as the publisher (the resource tracker complains
+# about memory that is taken away from it twice, on stderr)
+inOneProcess = '''
+import os
+from pyolab3.sharedClass import SharedCatalog
+name = 'pyolabtest' + str(os.getpid())
+catalog = SharedCatalog(name, create=True)
+reader = SharedCatalog(name, track=False)
+reader.close()
+catalog.close()
+catalog.unlink()
+'''
+
+def test_client_in_publishing_process():
+
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path))
+    result = subprocess.run([sys.executable, '-c', inOneProcess], env=env, capture_output=True, text=True)
+    assert result.returncode == 0
+    assert result.stderr == ''
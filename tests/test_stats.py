@@ -0,0 +1,102 @@
+#
+# This file is part of PyOLab. https://github.com/matsselen/pyolab
+# (C) 2017 Mats Selen <mats.selen@gmail.com>
+#
+# SPDX-License-Identifier:    BSD-3-Clause
+# (https://opensource.org/licenses/BSD-3-Clause)
+#
+
+# system stuff
+import numpy as np
+
+# local stuff
+from pyolab3.statsClass import RunningStats, WindowStats, SensorStats
+
+# cuts range(n) into chunks of random sizes (some of them empty)
+def chunks(n, rng):
+    cuts = np.sort(rng.integers(0, n, 40))
+    return list(zip(np.concatenate(([0], cuts)), np.concatenate((cuts, [n]))))
+
+#======================================
+# the statistics put together chunk by chunk are those of all of the samples,
+# also when they sit far from zero (where adding up squares loses the variance)
+#
+def test_running_matches_numpy():
+
+    rng = np.random.default_rng(25)
+    x = 1e6 + rng.normal(0, 0.01, (5000, 3))
+    stats = RunningStats(3)
+    halves = [RunningStats(3), RunningStats(3)]
+    for i, j in chunks(len(x), rng):
+        stats.add(x[i:j])
+        halves[int(i >= 2500)].add(x[i:j])
+    halves[0].merge(halves[1])
+
+    for s in (stats, halves[0]):
+        assert s.count == len(x)
+        assert np.allclose(s.mean, x.mean(0), rtol=0, atol=1e-7)
+        assert np.allclose(s.var, x.var(0), rtol=1e-6)
+        assert np.allclose(s.std, x.std(0), rtol=1e-6)
+        assert np.allclose(s.rms, np.sqrt((x * x).mean(0)))
+        assert np.array_equal(s.min, x.min(0)) and np.array_equal(s.max, x.max(0))
+
+    one = RunningStats()
+    assert np.isnan(one.mean)
+    one.add(x[:100, 0])
+    assert np.isclose(one.var, x[:100, 0].var(), rtol=1e-6)
+
+#======================================
+# after every chunk a window holds the samples of the buckets it covers
+#
+def test_window_matches_numpy():
+
+    rng = np.random.default_rng(7)
+    times = np.cumsum(rng.uniform(0, 0.004, 5000))
+    x = rng.normal(3, 2, (5000, 2))
+    window = WindowStats(2, 1.0, 20)
+    for i, j in chunks(len(x), rng):
+        window.add(x[i:j], times[i:j])
+        if j == 0:
+            continue
+        bucket = np.floor(times[:j] / 0.05)
+        mine = x[:j][bucket > bucket[-1] - 20]
+        assert window.stats.count == len(mine)
+        assert np.allclose(window.stats.mean, mine.mean(0))
+        assert np.allclose(window.stats.var, mine.var(0))
+        assert np.array_equal(window.stats.max, mine.max(0))
+
+#======================================
+# a window moves on with the time, whether samples come in or not
+#
+def test_window_eviction():
+
+    stats = SensorStats(1, [1.0], 20)
+    times = np.arange(1, 201) * 0.01           # two seconds of samples
+    stats.addChunk(np.arange(200.0), times, 0)
+
+    def expected(now):
+        bucket = np.floor(times / 0.05)
+        return np.arange(200.0)[bucket > np.floor(now / 0.05) - 20]
+
+    for now in (2.0, 2.3, 2.77, 2.96):
+        mine = expected(now)
+        assert stats.window(1.0, now).count == len(mine) > 0
+        assert stats.window(1.0, now).mean == mine.mean()
+    assert stats.window(1.0, 3.0).count == 0
+    assert stats.window(1.0, 1.0).count == len(expected(2.0))     # (it never goes back before the newest sample)
+    assert np.isnan(stats.window(1.0, 3.0).mean)
+    assert stats.count == 200
+
+    # by default it is the time of the newest sample plus how long ago it came in
+    assert 2.0 <= stats.now() < 2.5
+    assert stats.window(1.0).count == len(expected(2.0))
+    stats.lastAdded -= 0.5
+    assert stats.window(1.0).count == len(expected(2.5))
+    stats.lastAdded -= 1.0
+    assert stats.window(1.0).count == 0
+
+    # and samples that come in later start filling it again
+    stats.addChunk([5.0, 7.0], [3.6, 3.61], 200)
+    assert stats.window(1.0, 3.7).count == 2
+    assert stats.window(1.0, 3.7).mean == 6.0
+    assert stats.count == 202
@@ -0,0 +1,59 @@
+#
+# This file is part of PyOLab. https://github.com/matsselen/pyolab
+# (C) 2017 Mats Selen <mats.selen@gmail.com>
+#
+# SPDX-License-Identifier:    BSD-3-Clause
+# (https://opensource.org/licenses/BSD-3-Clause)
+#
+
+# system stuff
+import sys
+import numpy as np
+from threading import Thread
+
+# local stuff
+from pyolab3.storeClass import ColumnStore
+
+#======================================
+# samples keep their numbers when old ones are discarded
+#
+def test_store_numbering():
+
+    store = ColumnStore('int64', size=4)
+    store.append(np.arange(10))
+    store.discard(6)
+    store.append([10, 11])
+    assert (len(store), store.base) == (12, 6)
+    assert store.data().tolist() == list(range(6, 12))
+    assert store.since(8).tolist() == [8, 9, 10, 11]
+    assert store[-1] == 11
+    assert store[12:12].tolist() == [] and ColumnStore('int64')[0:0].tolist() == []
+
+#======================================
+# somebody looking at the samples while they are being added (and thrown away)
+# always sees sample i in slot i - base, even while the buffer is being replaced
+#
+def test_store_read_while_writing():
+
+    store = ColumnStore('int64', size=1)
+    done = []
+    def write():
+        for i in range(0, 200000, 7):
+            store.append(np.arange(i, i + 7))
+            store.discard(i - 20)
+        done.append(True)
+
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    try:
+        writer = Thread(target=write)
+        writer.start()
+        bad = 0
+        while not done:
+            data = store.data()
+            if len(data) > 0 and data[0] != data[-1] - len(data) + 1:
+                bad += 1
+        writer.join()
+    finally:
+        sys.setswitchinterval(interval)
+    assert bad == 0
@@ -0,0 +1,144 @@
+#
+# This file is part of PyOLab. https://github.com/matsselen/pyolab
+# (C) 2017 Mats Selen <mats.selen@gmail.com>
+#
+# SPDX-License-Identifier:    BSD-3-Clause
+# (https://opensource.org/licenses/BSD-3-Clause)
+#
+
+# system stuff
+import os
+import time
+import numpy as np
+
+# local stuff
+from pyolab3.pyolabGlobals import G
+from pyolab3.remoteClass import RemoteStream
+from pyolab3.replayMethods import replayCapture
+from pyolab3.sessionClass import IOLabSession
+from pyolab3.storeClass import ColumnStore
+from pyolab3.timingMethods import unwrapFrames, commitFrames, sampleTimes, addSampleTimes
+from pyolab3.commMethods import setFixedConfig, getFixedConfig, getPacketConfig, startData, stopData
+
+exampleData = os.path.join(os.path.dirname(__file__), '..', 'Documentation', 'example_data.txt')
+
+# frame counts for records with frame bytes "frames" arriving at "times" (in frame 
+# periods), starting at stream offsets "offsets" (1, 2, 3... if not given)
+def unwrap(remote, frames, times, offsets=None):
+    times = (np.array(times) * G.framePeriod * 1e9).astype(np.int64)
+    if offsets is None:
+        offsets = np.arange(1, len(frames) + 1)
+    counts, lost = unwrapFrames(np.array(frames, dtype=np.uint8), times, remote, offsets)
+    commitFrames(counts, lost, times, remote, int(offsets[-1]))
+    remote.lastFrame = frames[-1]           # (decoding the records does this)
+    return counts.tolist(), lost.tolist()
+
+#======================================
+# the frame byte is unwrapped, and frames that never arrived are counted, even 
+# when 256 or more of them in a row are lost
+#
+def test_unwrap_frames():
+
+    with IOLabSession(None, logData=False):
+        remote = RemoteStream(1)
+        assert unwrap(remote, [250, 251, 255, 0, 1], [0, 1, 5, 6, 7]) == ([0, 1, 5, 6, 7], [0, 0, 3, 0, 0])
+
+        # 601 frames later (the byte went around twice), then a few that waited to be read together
+        assert unwrap(remote, [(1 + 601) % 256, 91, 92, 93], [608, 620, 620, 620]) == \
+            ([608, 609, 610, 611], [600, 0, 0, 0])
+        assert remote.lostFrames == 603 and remote.lastFrameCount == 611
+
+#======================================
+# after a config or startData record the remote starts counting over, which
+# isn't lost frames: the count goes on by how long the record took to come
+#
+def test_unwrap_frames_restart():
+
+    with IOLabSession(None, logData=False):
+        remote = RemoteStream(1)
+        unwrap(remote, [200, 201], [0, 1], [10, 20])
+        remote.restarts = [35]
+        assert unwrap(remote, [202, 0, 1], [2, 5, 6], [30, 40, 50]) == ([2, 5, 6], [0, 0, 0])
+        assert remote.restarts == [] and remote.lostFrames == 0
+
+#======================================
+# the samples of a record end at the end of its frame, spaced by 1/rate (and
+# none of them come before the start of the first frame)
+#
+def test_sample_times():
+
+    with IOLabSession(None, logData=False):
+        times = sampleTimes(np.array([0, 1, 3]), np.array([4, 2, 1]), np.array([0.004, 0.004, 0.004]))
+        assert np.allclose(times, [0, 0.002, 0.006, 0.010, 0.016, 0.020, 0.040], 0, 1e-12)
+
+#======================================
+# the samples of records taken before a change of configuration are spaced by the
+# rate of the configuration they were taken with, not the one after the change
+#
+def test_sample_times_follow_config():
+
+    with IOLabSession(None, logData=False):
+        remote = RemoteStream(1)
+        remote.timeDataDict[1] = ColumnStore('float64')
+        remote.timeDataDict[1].append(np.zeros(6))
+        remote.timeDataDict[12] = ColumnStore('float64')
+
+        # the accelerometer (sensor 1) runs at 200 Hz in configuration 4 and 400 Hz in 
+        # configuration 2, and the records after the change start at sample 6 + 3 * 2
+        remote.configStarts = {1: [(0, 4), (12, 2)]}
+        remote.lastFixedConfig = 2
+        counts = np.array([2, 2, 2, 4, 4])
+        frames = np.array([10, 11, 12, 20, 21])
+        addSampleTimes({1: counts, 12: np.array([1, 0, 1, 1, 1])}, frames, remote)
+
+        times = remote.timeDataDict[1].data()[6:]
+        assert np.allclose(times, np.concatenate((sampleTimes(frames[:3], counts[:3], np.full(3, 1 / 200)),
+                                                  sampleTimes(frames[3:], counts[3:], np.full(2, 1 / 400)))), 0, 1e-12)
+
+        # (sensor 12 has no rate in configuration 2 and no configStarts,
+        # so its samples are spread over their frames)
+        assert np.allclose(remote.timeDataDict[12].data(), (np.array([10, 12, 20, 21]) + 1) * G.framePeriod, 0, 1e-12)
+
+#======================================
+# the remote counts frames over after setFixedConfig(38) in example_data.txt,
+# which isn't the frame byte wrapping (it used to look like 254 lost frames)
+#
+def test_config_change_restarts_frames():
+
+    G.logData = False
+    replayCapture(exampleData, report=False)
+
+    remote = G.remotes[1]
+    assert remote.lostFrames == 0
+    assert remote.lastFrameCount == 3
+    for sensor in (1, 2, 12):
+        times = G.timeDataDict[sensor].data()
+        assert len(times) > 0
+        assert times.min() >= 0
+        assert times.max() < 4 * G.framePeriod + 1e-9
+
+#======================================
+# and so does the emulator when data are stopped and started again
+#
+def test_start_data_restarts_frames(emulator, analysis):
+
+    session = IOLabSession(emulator.portName, analysis=analysis)
+    assert session.start()
+    with session:
+        setFixedConfig(G.serialPort, 38, 1)
+        getFixedConfig(G.serialPort, 1)
+        getPacketConfig(G.serialPort, 1).result()
+    for n in range(2):
+        with session:
+            startData(G.serialPort)
+        time.sleep(0.5)
+        with session:
+            stopData(G.serialPort).result()
+        time.sleep(0.1)
+    session.stop()
+
+    assert session.remotes[1].lostFrames == 0
+    times = session.timeDataDict[1].data()
+    assert times.min() >= 0
+    assert np.all(np.diff(times) > 0)
+    assert times[-1] < 2.0